@@ -1,7 +1,19 @@
+import click
+import json
+import requests
+from queue import Full
 from flask import Flask
 from app.controllers import blueprints
-from flask import render_template
+from flask import render_template, request, Response, stream_with_context, url_for
 from app.twitch_client import TwitchClient, get_userinfo
+from app.batch import BATCH_MAX_STREAMERS
+from app.controllers.jobs import batch_suggestions_job
+from app.jobs import get_job_queue, JOB_TIMEOUT
+from app.user_loader import get_user_loader, is_valid_login
+from app.suggestion_cache import get_suggestion_cache
+from app.single_flight import get_single_flight
+from app.follower_sync import FollowerStore, FollowerSync, FOLLOWER_DB
+from app.helix import get_transport
 
 
 app = Flask(__name__, template_folder='../templates')
@@ -18,17 +30,147 @@ def index():
 
 @app.route('/user/<username>')
 def suggestions(username):
+    """
+    Responds with suggested raids for username.  With ?adaptive=1, followers are sampled adaptively (see TwitchClient)
+    and the X-Followers-Used header reports how many followers the suggestions are based on.  Concurrent requests for
+    the same suggestions share a single computation; X-Coalesced is 'true' for requests that reused another's result.
+    Responds with 503 (and Retry-After) when Twitch or the shared computation did not answer in time.
+    """
     suggested_raids = {}
+    headers = {}
     try:
         userinfo = get_userinfo(username)
         if userinfo and 'uid' in userinfo:
             print(f'Collecting suggestions for {userinfo["name"]}')
-            suggested_raids = TwitchClient(userinfo['uid'], num_suggestions=10).get_similar_streams()
+            cache = get_suggestion_cache()
+            key = cache.key(userinfo['uid'], num_suggestions=10, adaptive=is_adaptive())
+
+            def compute():
+                client = cache.get_client(key, max_workers=10)
+                suggestions = client.get_similar_streams()
+                cache.store(key, client)
+                return suggestions, client.followers_used()
+
+            (suggested_raids, followers_used), coalesced = get_single_flight().do(key, compute)
+            headers['X-Followers-Used'] = str(followers_used)
+            headers['X-Coalesced'] = str(coalesced).lower()
 
     except ValueError:
         print('Supplied user name was either invalid or not found on Twitch.')
+    except TimeoutError as exc:
+        print(f'Gave up on suggestions for {username}: {exc}')
+        return {'error': 'Timed out collecting suggestions; try again later.'}, 503, {'Retry-After': '10'}
+
+    return suggested_raids, 200, headers
+
+
+@app.route('/users/suggestions', methods=['POST'])
+def batch_suggestions():
+    """
+    Queues suggested raids for many streamers at once, computed from one shared crawl (see BatchClient), and responds
+    right away (202) with the job's id and status url, as POST /jobs/suggestions/<username> does.  The request body is a
+    json list of user names, e.g., {"usernames": ["name1", "name2", ...]}; the job's result maps each user name to the
+    dict /user/<username> would return ({} for names that were not found on Twitch).
+    """
+    usernames = (request.get_json(silent=True) or {}).get('usernames')
+    if not isinstance(usernames, list) or not all(isinstance(username, str) for username in usernames):
+        return {'error': 'Expected a json body as {"usernames": ["name1", "name2", ...]}'}, 400
+    if len(usernames) > BATCH_MAX_STREAMERS:
+        return {'error': f'At most {BATCH_MAX_STREAMERS} user names are accepted per request'}, 400
+    invalid = [username for username in usernames if not is_valid_login(username)]
+    if invalid:
+        return {'error': f'Invalid Twitch user names: {invalid}'}, 400
+
+    try:
+        users = get_user_loader().load_many('login', usernames) if usernames else {}
+    except requests.HTTPError:
+        print('Unable to look up the supplied user names on Twitch.')
+        users = {}
+    except TimeoutError:
+        return {'error': 'Timed out looking up the users on Twitch; try again later.'}, 503, {'Retry-After': '5'}
+    uids = {username: users[username.lower()]['id'] for username in usernames if users.get(username.lower())}
+
+    print(f'Queueing batch suggestions for {len(uids)} streamers')
+    key = ('batch', tuple(usernames))
+    try:
+        job = get_job_queue().submit(batch_suggestions_job(usernames, uids), key=key, timeout=JOB_TIMEOUT)
+    except Full:
+        return {'error': 'Too many queued jobs; try again later.'}, 503, {'Retry-After': '5'}
+
+    status_url = url_for('jobs_bp.job_status', job_id=job.id)
+    return {'id': job.id, 'status': job.status, 'status_url': status_url}, 202, {'Location': status_url}
+
+
+@app.route('/user/<username>/stream')
+def stream_suggestions(username):
+    """
+    Streams the suggestions pipeline as newline-delimited json: phase changes and provisional rankings are sent as soon
+    as they are available and the final ranking (the same dict returned by /user/<username>) is sent last.
+    """
+    def generate():
+        yield json.dumps({'event': 'phase', 'phase': 'userinfo'}) + '\n'
+        try:
+            userinfo = get_userinfo(username)
+        except ValueError:
+            print('Supplied user name was either invalid or not found on Twitch.')
+            yield json.dumps({'event': 'result', 'suggestions': {}}) + '\n'
+            return
+        except TimeoutError:
+            yield json.dumps({'event': 'error', 'error': 'Timed out looking up the user on Twitch.'}) + '\n'
+            return
+
+        print(f'Streaming suggestions for {userinfo["name"]}')
+        yield json.dumps({'event': 'userinfo', 'userinfo': userinfo}) + '\n'
+        client = TwitchClient(userinfo['uid'], num_suggestions=10, max_workers=10, adaptive=is_adaptive())
+        for event in client.iter_similar_streams():
+            yield json.dumps(event) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.cli.command('migrate-graph')
+def migrate_graph():
+    """ Creates the graph DB schema (uniqueness constraints); safe to run more than once. """
+    from app.models import neo4_db
+    created = neo4_db.migrate()
+    print(f'Created {len(created)} constraints: {created}')
+
+
+@app.cli.command('build-similarity-index')
+@click.option('--k', type=int, help='Neighbours stored per streamer; NEO4J_SIMILAR_TO_K by default')
+@click.option('--batch-size', default=50, help='Number of streamers indexed per transaction')
+def build_similarity_index(k, batch_size):
+    """ Precomputes the top-k co-followed neighbours of every Streamer in the graph DB. """
+    from app.models import neo4_db
+    stats = neo4_db.build_similarity_index(k=k or neo4_db.SIMILAR_TO_K, n_streamers=batch_size)
+    print(f'Indexed {stats["relationships"]} neighbours for {stats["streamers"]} streamers '
+          f'in {round(stats["runtime"], 1)} sec')
+
+
+@app.cli.command('sync-followers')
+@click.argument('usernames', nargs=-1, required=True)
+@click.option('--reconcile/--no-reconcile', default=None, help='Force or skip a full pass that removes unfollows')
+@click.option('--graph', is_flag=True, help='Also write new follows and unfollows to the graph DB')
+@click.option('--db', default=FOLLOWER_DB, help='The SQLite path of the followers store; FOLLOWER_DB by default')
+def sync_followers(usernames, reconcile, graph, db):
+    """ Brings the stored followers of each streamer up to date, paging only follows newer than the last sync. """
+    if not db:
+        # An in-memory store would be lost on exit, making every run a full pass
+        raise click.UsageError('Set FOLLOWER_DB (or pass --db) to the SQLite path of the followers store')
+    on_added = on_removed = None
+    if graph:
+        from app.models import neo4_db
+        on_added, on_removed = neo4_db.merge_follows, neo4_db.delete_follows
+    follower_sync = FollowerSync(get_transport(), FollowerStore(db), on_added=on_added, on_removed=on_removed)
+    for username in usernames:
+        stats = follower_sync.sync(get_userinfo(username)['uid'], reconcile=reconcile)
+        print(f'{username}: {stats}')
+
+
+def is_adaptive() -> bool:
+    return request.args.get('adaptive', '').lower() in ('1', 'true', 'yes')
 
-    return suggested_raids
 
 @app.route('/validate/<username>')
 def validate(username):
@@ -39,4 +181,6 @@ def validate(username):
             return userinfo
 
     except ValueError:
-        return {}
\ No newline at end of file
+        return {}
+    except TimeoutError:
+        return {'error': 'Timed out looking up the user on Twitch; try again later.'}, 503, {'Retry-After': '5'}
\ No newline at end of file
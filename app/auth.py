@@ -1,27 +1,231 @@
+import json
+import logging
+import os
 import requests
 from collections import namedtuple
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from dateutil import parser
+from threading import Lock, Thread
+from time import time
 import pytz
+from app.metrics import OAUTH_REQUESTS, OAUTH_SECONDS
+
+try:
+    import fcntl
+except ImportError:  # Windows; file-backed token store falls back to unlocked reads/writes
+    fcntl = None
 
 try:
     from app import settings
     TWITCH_CLIENT_ID = settings.TWITCH_CLIENT_ID
     TWITCH_CLIENT_SECRET = settings.TWITCH_CLIENT_SECRET
+    TWITCH_TOKEN_STORE = getattr(settings, 'TWITCH_TOKEN_STORE', None)
+    TWITCH_OAUTH_URL = getattr(settings, 'TWITCH_OAUTH_URL', 'https://id.twitch.tv/oauth2')
 except ImportError:
-    import os
     TWITCH_CLIENT_ID = os.environ.get('TWITCH_CLIENT_ID')
     TWITCH_CLIENT_SECRET = os.environ.get('TWITCH_CLIENT_SECRET')
+    TWITCH_TOKEN_STORE = os.environ.get('TWITCH_TOKEN_STORE')
+    TWITCH_OAUTH_URL = os.environ.get('TWITCH_OAUTH_URL', 'https://id.twitch.tv/oauth2')
+
+module_logger = logging.getLogger(__name__+'.py')
+
+# (connect, read) timeout in seconds of OAuth requests; every caller waiting for a token waits on them
+OAUTH_TIMEOUT = (3.05, 10)
+
+
+class TokenProvider:
+    """
+    A thread-safe cache for the app access token shared by every Auth, TwitchClient and get_userinfo call in a process.
+    A token is requested from Twitch only when none is cached or the cached token has expired.  Once a token enters its
+    refresh window, the current token keeps being served while a single background thread fetches a replacement.
+
+    When store_path is given, tokens are also persisted to a json file (guarded by an flock) so that every gunicorn
+    worker on a dyno reuses the same token instead of each requesting its own.
+    """
+    def __init__(self, client_id=None, client_secret=None, store_path=None,
+                 expiry_buffer=timedelta(days=3), refresh_ahead=timedelta(days=1), oauth_url=TWITCH_OAUTH_URL):
+        """
+        :param oauth_url: The base url of Twitch's OAuth endpoints, e.g., that of tools/mock_helix
+        """
+        self.oauth_url = oauth_url.rstrip('/') + '/token'
+        self.validate_url = oauth_url.rstrip('/') + '/validate'
+        self.client_id = client_id
+        self._client_secret = client_secret
+        self.store_path = store_path
+        # Maintain a buffer between End-of-Life according to Twitch vs End-of-Life known to this app
+        self.expiry_buffer = expiry_buffer.total_seconds()
+        # Tokens are refreshed in the background once they are this close to (buffered) End-of-Life
+        self.refresh_ahead = refresh_ahead.total_seconds()
+        self._token = None
+        self._lock = Lock()
+        self._refreshing = False
+
+    @property
+    def token(self) -> dict:
+        """ The current token as {'access_token': ..., 'expires_in': ..., 'fetched_at': ..., 'expires_at': ...} """
+        token = self._token
+        if token is None or self.__expired(token):
+            # No usable token; every caller must wait for one
+            with self._lock:
+                if self._token is None or self.__expired(self._token):
+                    self._token = self.__load_or_fetch()
+                token = self._token
+        elif token['expires_at'] - time() < self.refresh_ahead:
+            self.__refresh_in_background()
+
+        return token
+
+    @property
+    def bear_token(self) -> dict:
+        return {
+            'Authorization':  'Bearer ' + self.token['access_token'],
+            'Client-ID':      self.client_id
+            }
+
+    @property
+    def expires_at(self) -> datetime:
+        return datetime.fromtimestamp(self.token['expires_at'], tz=pytz.utc)
+
+    def is_expired(self) -> bool:
+        return self._token is None or self.__expired(self._token)
+
+    def invalidate(self, access_token=None):
+        """ Drops the cached token (only if it is still access_token, when given) so the next use fetches a new one. """
+        with self._lock:
+            if self._token and (access_token is None or self._token['access_token'] == access_token):
+                dropped, self._token = self._token['access_token'], None
+                if self.store_path:
+                    with self.__store_lock():
+                        # Another worker may have stored a new token since; only the dropped token is removed
+                        stored = self.__read_store()
+                        if stored is not None and stored['access_token'] == dropped:
+                            self.__write_store(None)
+
+    def validate(self) -> bool:
+        """ Validates the cached token with Twitch; an invalid token is dropped and replaced on next use. """
+        access_token = self.token['access_token']
+        auth_header = {'Authorization': 'OAuth {}'.format(access_token)}
+        with OAUTH_SECONDS.time(kind='validate'), requests.get(self.validate_url, headers=auth_header,
+                                                               timeout=OAUTH_TIMEOUT) as req:
+            OAUTH_REQUESTS.inc(kind='validate', status=req.status_code)
+            # The OAuth token is valid if json response from Twitch contains 'client_id'
+            valid = 'client_id' in req.json()
+
+        if not valid:
+            self.invalidate(access_token)
+        return valid
+
+    def __expired(self, token) -> bool:
+        return time() >= token['expires_at']
+
+    def __refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def refresh():
+            try:
+                token = self.__load_or_fetch(force=True)
+                with self._lock:
+                    self._token = token
+            except Exception as exc:
+                module_logger.error(f'Background token refresh failed: {exc}')
+            finally:
+                self._refreshing = False
+
+        Thread(target=refresh, name='token-refresh', daemon=True).start()
+
+    def __load_or_fetch(self, force=False) -> dict:
+        if not self.store_path:
+            return self.__fetch()
+
+        with self.__store_lock():
+            # Another worker may have already refreshed the shared token
+            token = self.__read_store()
+            stale = token is None or self.__expired(token)
+            if force and token is not None:
+                stale = stale or token['expires_at'] - time() < self.refresh_ahead
+            if stale:
+                token = self.__fetch()
+                self.__write_store(token)
+
+        return token
+
+    @contextmanager
+    def __store_lock(self):
+        """ Holds the flock guarding the shared token store for the duration of a with block. """
+        with open(self.store_path + '.lock', 'a') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def __fetch(self) -> dict:
+        auth_params = {
+            'client_id':      self.client_id,
+            'client_secret':  self._client_secret,
+            'grant_type':     'client_credentials'
+            }
+        with OAUTH_SECONDS.time(kind='token'), requests.post(self.oauth_url, data=auth_params,
+                                                             timeout=OAUTH_TIMEOUT) as req:
+            OAUTH_REQUESTS.inc(kind='token', status=req.status_code)
+            # e.g., 400 or 403 for invalid client credentials
+            req.raise_for_status()
+            token = req.json()
+            # Capturing Token Lifetime Information according to Twitch's clock when available
+            fetched_at = parser.parse(req.headers['date']).timestamp() if 'date' in req.headers else time()
+
+        token['fetched_at'] = fetched_at
+        token['expires_at'] = fetched_at + token['expires_in'] - min(self.expiry_buffer, token['expires_in'] / 2)
+        module_logger.info('Fetched a new app access token from Twitch')
+        return token
+
+    def __read_store(self):
+        try:
+            with open(self.store_path) as store:
+                token = json.load(store)
+            return token if token.get('access_token') else None
+        except (OSError, ValueError):
+            return None
+
+    def __write_store(self, token):
+        if not self.store_path:
+            return
+        tmp_path = f'{self.store_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as store:
+            json.dump(token or {}, store)
+        os.replace(tmp_path, self.store_path)
+
+
+_token_provider = None
+_token_provider_lock = Lock()
+
+
+def get_token_provider() -> TokenProvider:
+    """ Returns the process-wide TokenProvider, creating it on first use. """
+    global _token_provider
+    if _token_provider is None:
+        with _token_provider_lock:
+            if _token_provider is None:
+                _token_provider = TokenProvider(TWITCH_CLIENT_ID, TWITCH_CLIENT_SECRET, TWITCH_TOKEN_STORE)
+    return _token_provider
 
 
 class Auth:
+    """ A view of the process-wide app access token; see TokenProvider. """
     # String formatted version of timestamp returned by twitch
     twitch_time_fmt = '%a, %d %b %Y %H:%M:%S %Z'
 
-    def __init__(self):
+    def __init__(self, provider=None):
         # Initialize class attributes
-        self.client_id = TWITCH_CLIENT_ID
-        self._client_secret = TWITCH_CLIENT_SECRET
+        self._provider = provider if provider else get_token_provider()
+        self.client_id = self._provider.client_id
+        self._client_secret = self._provider._client_secret
         self._auth_token = None
         self._bear_token = None
         self.fetched_at = None
@@ -30,68 +234,37 @@ class Auth:
 
     @property
     def bear_token(self):
-        # Check if exists and has value other than None, [], '', 0, or False
-        if hasattr(self, '_bear_token') and self._bear_token:
-            return self._bear_token
         return self.__create_token().bear_token
 
     @property
     def auth_token(self):
-        # Check if exists and has value other than None, [], '', 0, or False
-        if hasattr(self, '_auth_token') and self._auth_token:
-            return self._auth_token
         return self.__create_token().auth_token
 
     def __create_token(self) -> namedtuple:
         Token = namedtuple('Token', ['auth_token', 'bear_token'])
-        # Check if exists
-        if hasattr(self, '_auth_token') and hasattr(self, '_bear_token'):
-            # Check if not None, [], '', 0, or False
-            if self._auth_token and self._bear_token:
-                return Token(self._auth_token, self._bear_token)
-
-        oauth_url = 'https://id.twitch.tv/oauth2/token'
-        auth_params = {
-            'client_id':      self.client_id,
-            'client_secret':  self._client_secret,
-            'grant_type':     'client_credentials'
-            }
-        with requests.post(oauth_url, data=auth_params) as req:
-            self._auth_token = req.json()
+        # The provider only contacts Twitch when its cached token is missing or expired
+        token = self._provider.token
+        if self._auth_token is None or self._auth_token['access_token'] != token['access_token']:
+            self._auth_token = token
             self._bear_token = {
-                'Authorization':  'Bearer ' + self._auth_token['access_token'],
+                'Authorization':  'Bearer ' + token['access_token'],
                 'Client-ID':      self.client_id
                 }
-        # Capturing & String-Formatting Token Lifetime Information
-            self.fetched_at = parser.parse(req.headers['date']).strftime(self.twitch_time_fmt)
-            expires_at = parser.parse(self.fetched_at) + timedelta(seconds=self._auth_token['expires_in'])
-            # Maintain a 3 day buffer between End-of-Life according to Twitch vs End-of-Life known to this app
-            expires_at -= timedelta(days=3)
-            self.expires_at = expires_at.strftime(self.twitch_time_fmt)
+            # String-Formatting Token Lifetime Information
+            fetched_at = datetime.fromtimestamp(token['fetched_at'], tz=pytz.utc)
+            self.fetched_at = fetched_at.strftime(self.twitch_time_fmt)
+            self.expires_at = self._provider.expires_at.strftime(self.twitch_time_fmt)
 
         return Token(self._auth_token, self._bear_token)
 
 
     def is_expired(self) -> bool:
-        # Check if doesn't exist and value is not None, [], '', 0, or False
-        if not hasattr(self, 'self.expires_at') and not self.expires_at:
-            expired = True
-        else:
-            expired = datetime.utcnow().astimezone(tz=pytz.utc) > parser.parse(self.expires_at)
-
-        return expired
+        return self._provider.is_expired()
 
 
     def validate(self):
         """ This function validates an instance of this object with Twitch and fetches a new token if not valid """
-        valid = False
-        # If token has not exceeded lifetime, validate with Twitch
-        if self.is_expired():
-            oauth_url = 'https://id.twitch.tv/oauth2/validate'
-            auth_header = {'Authorization': 'OAuth {}'.format(self._auth_token['access_token'])}
-            with requests.get(oauth_url, headers=auth_header) as req:
-                # The OAuth token is valid if json response from Twitch contains 'client_id'
-                valid = 'client_id' in req.json()
-
-        if not valid:
-            self.__create_token()
+        # If token has not exceeded lifetime, validate with Twitch; an expired token is always replaced
+        if self.is_expired() or not self._provider.validate():
+            self._auth_token = None
+        self.__create_token()
@@ -0,0 +1,146 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from time import perf_counter
+from app import profiling
+from app.follow_store import FollowStore
+from app.twitch_client import TwitchClient
+
+try:
+    from app import settings
+    BATCH_MAX_STREAMERS = getattr(settings, 'BATCH_MAX_STREAMERS', 50)
+except ImportError:
+    BATCH_MAX_STREAMERS = int(os.environ.get('BATCH_MAX_STREAMERS', 50))
+
+module_logger = logging.getLogger(__name__+'.py')
+
+
+class BatchClient:
+    """
+    Collects suggested raids for many streamers at once from one shared crawl.  The followers of every streamer are
+    collected first; the followings of each follower in their union are then fetched only once, and every streamer's
+    overlap counts are built from those shared followings.  Live statuses of the union of all candidates are looked up
+    in a single pass, and candidate totals fetched while ranking one streamer are reused for the others.  Followings
+    and totals are shared through a FollowStore, which keeps them as interned integer columns.
+
+    Suggestions are the same as those of separate TwitchClient(streamer_uid, ...).get_similar_streams() runs with the
+    default (counter) engine; every follower is used, i.e., there is no adaptive sampling.
+    """
+    def __init__(self, streamer_uids: list, n_followers=100, n_followings=50, num_suggestions=10, max_workers=None,
+                 follows_cache=None, live_index=None, checkpoint=None):
+        """
+        :param streamer_uids: A list of streamer uids (strings); duplicates are ignored
+        :param max_workers: The number of helix requests made concurrently; requests are made serially by default
+        :param checkpoint: Called without arguments between the steps of the crawl (e.g., after each follower's
+        followings); an exception it raises, such as JobTimeout from Job.check_deadline, stops the crawl
+        """
+        if not streamer_uids:
+            raise ValueError('No streamer ids supplied to BatchClient()')
+        self.follow_store = FollowStore()
+        self.clients = {uid: TwitchClient(uid, n_followers, n_followings, num_suggestions, max_workers=max_workers,
+                                          follows_cache=follows_cache, live_index=live_index,
+                                          follow_store=self.follow_store)
+                        for uid in dict.fromkeys(streamer_uids)}
+        # A client of its own crawls the followings of the union of followers and makes the shared lookups
+        self.crawler = TwitchClient(streamer_uids[0], n_followers, n_followings, num_suggestions,
+                                    max_workers=max_workers, follows_cache=follows_cache, live_index=live_index,
+                                    follow_store=self.follow_store)
+        self.max_workers = max_workers
+        self.checkpoint = checkpoint if checkpoint else lambda: None
+        self._totals_lock = Lock()
+        self.totals_fetched = 0
+        self.totals_shared = 0
+        self.n_unique_followers = 0
+
+    def stats(self) -> dict:
+        clients = self.clients.values()
+        return {'streamers': len(self.clients), 'followers': sum(client.followers_used() for client in clients),
+                'unique_followers': self.n_unique_followers, 'skipped': self.crawler.num_skipped,
+                'follows_requests': self.crawler.follows_requests + sum(client.follows_requests for client in clients),
+                'totals_fetched': self.totals_fetched, 'totals_shared': self.totals_shared,
+                'follow_edges': len(self.follow_store)}
+
+    def get_followers_followings(self) -> dict:
+        """
+        Collects every streamer's followers, then the followings of their union, once per follower.
+
+        :return: A dictionary of {'streamer_uid': {'other_streamer_uid1': count, ...}, ...} (see
+        TwitchClient.get_followers_followings())
+        """
+        clients = [client for client in self.clients.values() if client.followings_count is None]
+        if not clients:
+            return {uid: client.followings_count for uid, client in self.clients.items()}
+
+        workers = self.max_workers if self.max_workers and self.max_workers > 1 else 1
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(profiling.propagate(TwitchClient.get_streamer_followers), clients))
+
+        self.checkpoint()
+
+        self.crawler.followers_list = list(dict.fromkeys(follower for client in clients
+                                                         for follower in client.followers_list))
+        self.n_unique_followers = len(self.crawler.followers_list)
+        followings_iter = self.crawler._map_followers(self.crawler._get_follower_followings)
+        try:
+            for followings, follower in zip(followings_iter, self.crawler.followers_list):
+                self.follow_store.add_follower(follower.uid, followings)
+                self.checkpoint()
+        finally:
+            followings_iter.close()  # cancels pending followings requests when the crawl was stopped
+
+        for client in clients:
+            follower_uids = [follower.uid for follower in client.followers_list]
+            client.followings_count = self.follow_store.overlap_counts(follower_uids)
+            client.n_followers_used = len(client.followers_list)
+            client.stop_reason = 'exhausted'
+
+        return {uid: client.followings_count for uid, client in self.clients.items()}
+
+    def get_similar_streams(self) -> dict:
+        """
+        :return: A dictionary of {'streamer_uid': {1: {best candidate details}, 2: {...}, ...}, ...}; each streamer's
+        suggestions are formatted as those of TwitchClient.get_similar_streams()
+        """
+        start_time = perf_counter()
+        self.get_followers_followings()
+
+        candidates = {}
+        for uid, client in self.clients.items():
+            candidates[uid] = {candidate: count for candidate, count in client.followings_count.items()
+                               if count >= TwitchClient.MIN_FOLLOWINGS and candidate != uid}
+
+        all_candidates = list(dict.fromkeys(candidate for streamer in candidates.values() for candidate in streamer))
+        live_streams = self.crawler.get_live_streams(all_candidates) if all_candidates else {}
+
+        suggestions = {}
+        for uid, client in self.clients.items():
+            self.checkpoint()
+            live_candidates = {candidate: count for candidate, count in candidates[uid].items()
+                               if candidate in live_streams}
+            ranked_candidates = client.rank_candidates(live_candidates, self.__fetch_total)
+            # final_candidates() adds per-streamer details (e.g., sim_score) to the stream details it is given
+            suggestions[uid] = client.final_candidates(
+                ranked_candidates, {candidate: dict(live_streams[candidate]) for candidate, _ in ranked_candidates})
+
+        stats = self.stats()
+        print(f'Round trip time to collect batch suggestions: {round(perf_counter() - start_time, 3)} sec')
+        print(f'Followers Used: {stats["unique_followers"]} unique of {stats["followers"]} '
+              f'for {stats["streamers"]} streamers')
+        print(f'Live candidates: {len(live_streams)} of {len(all_candidates)}; '
+              f'totals fetched: {stats["totals_fetched"]} ({stats["totals_shared"]} reused)')
+
+        return suggestions
+
+    def __fetch_total(self, candidate_uid: str):
+        # Totals seen while collecting followers (and those fetched for other streamers) are kept in the follow store;
+        # rankers run one after another and a ranker's waves hold distinct uids, so no total is fetched twice at once
+        total = self.follow_store.total(candidate_uid, 'to_id')
+        with self._totals_lock:
+            if total is not None:
+                self.totals_shared += 1
+                return total
+            self.totals_fetched += 1
+        total = self.crawler.get_total_follows_count(candidate_uid)
+        self.follow_store.set_total(candidate_uid, 'to_id', total)
+        return total
@@ -1,7 +1,11 @@
 from .users import users_bp
+from .eventsub import eventsub_bp
+from .jobs import jobs_bp
+from .metrics import metrics_bp
+from .profiles import profiles_bp
 
 # if you add other users you could do the following:
 # from .raids import raid_bp
 # blueprints = [users_bp, raid_bp]
 
-blueprints = [users_bp]
+blueprints = [users_bp, eventsub_bp, jobs_bp, metrics_bp, profiles_bp]
@@ -0,0 +1,87 @@
+import hashlib
+import hmac
+import logging
+import os
+from collections import OrderedDict
+from datetime import datetime as dt, timedelta
+from threading import Lock
+from dateutil.parser import parse as dt_parse
+from flask import Blueprint, request
+from pytz import utc
+from app.live_index import get_live_index
+
+try:
+    from app import settings
+    EVENTSUB_SECRET = getattr(settings, 'EVENTSUB_SECRET', None)
+except ImportError:
+    EVENTSUB_SECRET = os.environ.get('EVENTSUB_SECRET')
+
+module_logger = logging.getLogger(__name__+'.py')
+
+eventsub_bp = Blueprint('eventsub_bp', __name__, url_prefix='/eventsub')
+
+# Twitch retries notifications that were not acknowledged in time; recently seen message ids are ignored
+_seen_ids = OrderedDict()
+_seen_ids_lock = Lock()
+MAX_SEEN_IDS = 10000
+# Messages older than this are rejected to prevent replays
+MAX_MESSAGE_AGE = timedelta(minutes=10)
+
+
+def signature(secret: str, message_id: str, timestamp: str, body: bytes) -> str:
+    """ :return: The Twitch-Eventsub-Message-Signature header value of a message signed with secret """
+    digest = hmac.new(secret.encode(), message_id.encode() + timestamp.encode() + body, hashlib.sha256).hexdigest()
+    return 'sha256=' + digest
+
+
+def is_duplicate(message_id: str) -> bool:
+    with _seen_ids_lock:
+        if message_id in _seen_ids:
+            return True
+        _seen_ids[message_id] = None
+        if len(_seen_ids) > MAX_SEEN_IDS:
+            _seen_ids.popitem(last=False)
+    return False
+
+
+@eventsub_bp.route('/callback', methods=['POST'])
+def callback():
+    """
+    Receives EventSub webhook messages for stream.online and stream.offline subscriptions and applies them to the live
+    index: offline streams are recorded as offline, while online streams are invalidated so that their details (title,
+    viewers, thumbnail) are fetched from helix on the next lookup.  Subscription verification challenges are answered.
+    """
+    secret = EVENTSUB_SECRET
+    message_id = request.headers.get('Twitch-Eventsub-Message-Id', '')
+    timestamp = request.headers.get('Twitch-Eventsub-Message-Timestamp', '')
+    if not secret:
+        return 'EventSub is not configured', 404
+    expected = signature(secret, message_id, timestamp, request.get_data())
+    if not hmac.compare_digest(expected, request.headers.get('Twitch-Eventsub-Message-Signature', '')):
+        return 'Invalid signature', 403
+    try:
+        sent_at = dt_parse(timestamp)
+    except (ValueError, OverflowError):
+        return 'Invalid timestamp', 400
+    if sent_at.tzinfo is None:  # Twitch sends UTC timestamps; a naive one cannot be compared to the current time
+        return 'Invalid timestamp', 400
+    if dt.now(utc) - sent_at > MAX_MESSAGE_AGE:
+        return 'Message too old', 403
+
+    message = request.get_json(force=True)
+    message_type = request.headers.get('Twitch-Eventsub-Message-Type')
+    if message_type == 'webhook_callback_verification':
+        return message['challenge'], 200, {'Content-Type': 'text/plain'}
+    if message_type == 'revocation':
+        module_logger.warning(f'EventSub subscription revoked: {message["subscription"]}')
+        return '', 204
+    if message_type != 'notification' or is_duplicate(message_id):
+        return '', 204
+
+    event_type = message['subscription']['type']
+    broadcaster_uid = message['event']['broadcaster_user_id']
+    if event_type == 'stream.online':
+        get_live_index().invalidate(broadcaster_uid)
+    elif event_type == 'stream.offline':
+        get_live_index().set_offline(broadcaster_uid)
+    return '', 204
@@ -0,0 +1,91 @@
+import math
+from queue import Full
+from flask import Blueprint, request, url_for
+from app.jobs import get_job_queue, JOB_TIMEOUT
+from app.suggestion_cache import get_suggestion_cache
+from app.batch import BatchClient
+from app.twitch_client import get_userinfo
+
+jobs_bp = Blueprint('jobs_bp', __name__, url_prefix='/jobs')
+
+# Priorities a client may ask for: jobs can be deferred, but never placed ahead of those with the default priority
+DEFAULT_PRIORITY, MAX_PRIORITY = 10, 100
+
+
+def suggestions_job(key: tuple):
+    """ :return: A job target computing suggestions for a SuggestionCache key, reporting progress along the way """
+    def run(job):
+        cache = get_suggestion_cache()
+        client = cache.get_client(key, max_workers=10)
+        suggestions = {}
+        events = client.iter_similar_streams()
+        try:
+            for event in events:
+                if event['event'] == 'result':
+                    suggestions = event['suggestions']
+                else:
+                    job.report(event)
+        finally:
+            events.close()  # stops pending follower requests when the job timed out
+        cache.store(key, client)
+        return suggestions
+    return run
+
+
+def batch_suggestions_job(usernames: list, uids: dict):
+    """
+    :param usernames: The requested user names
+    :param uids: A dictionary of {user name: uid, ...} for the user names found on Twitch
+    :return: A job target computing suggestions for every user name from one shared BatchClient crawl
+    """
+    def run(job):
+        suggested_raids = {username: {} for username in usernames}
+        if uids:
+            job.report({'event': 'phase', 'phase': 'batch', 'streamers': len(uids)})
+            batch = BatchClient(list(uids.values()), num_suggestions=10, max_workers=10,
+                                checkpoint=job.check_deadline)
+            suggestions = batch.get_similar_streams()
+            suggested_raids.update({username: suggestions[uid] for username, uid in uids.items()})
+        return suggested_raids
+    return run
+
+
+@jobs_bp.route('/suggestions/<username>', methods=['POST'])
+def submit_suggestions(username):
+    """
+    Queues a suggestions computation for username and responds right away (202) with the job's id and status url.
+    Optional query parameters: priority (lower runs first; 10 by default, clamped to 10 to 100), timeout (seconds, at
+    most JOB_TIMEOUT) and adaptive.  Responds with 400 for a timeout that is not a positive number and with 503 when the
+    queue is full.
+    """
+    try:
+        userinfo = get_userinfo(username)
+    except ValueError:
+        return {'error': 'Supplied user name was either invalid or not found on Twitch.'}, 404
+    except TimeoutError:
+        return {'error': 'Timed out looking up the user on Twitch; try again later.'}, 503, {'Retry-After': '5'}
+
+    timeout = request.args.get('timeout', JOB_TIMEOUT, float)
+    if not math.isfinite(timeout) or timeout <= 0:
+        return {'error': 'timeout must be a positive number of seconds.'}, 400
+    timeout = min(timeout, JOB_TIMEOUT)
+    priority = min(max(request.args.get('priority', DEFAULT_PRIORITY, int), DEFAULT_PRIORITY), MAX_PRIORITY)
+
+    adaptive = request.args.get('adaptive', '').lower() in ('1', 'true', 'yes')
+    key = get_suggestion_cache().key(userinfo['uid'], num_suggestions=10, adaptive=adaptive)
+    try:
+        job = get_job_queue().submit(suggestions_job(key), key=key, priority=priority, timeout=timeout)
+    except Full:
+        return {'error': 'Too many queued jobs; try again later.'}, 503, {'Retry-After': '5'}
+
+    status_url = url_for('jobs_bp.job_status', job_id=job.id)
+    return {'id': job.id, 'status': job.status, 'status_url': status_url}, 202, {'Location': status_url}
+
+
+@jobs_bp.route('/<job_id>')
+def job_status(job_id):
+    """ Responds with a job's status and progress, and with its result (the /user/<username> dict) once done. """
+    job = get_job_queue().store.get(job_id)
+    if job is None:
+        return {'error': 'Unknown or expired job id.'}, 404
+    return job
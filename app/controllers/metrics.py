@@ -0,0 +1,59 @@
+import sys
+from time import perf_counter
+from flask import Blueprint, Response, g, request
+from app.follows_cache import get_follows_cache
+from app.helix import get_transport
+from app.jobs import get_job_queue
+from app.live_index import get_live_index
+from app.metrics import HTTP_SECONDS, REGISTRY
+from app.single_flight import get_single_flight
+from app.suggestion_cache import get_suggestion_cache
+from app.user_loader import get_user_loader
+
+metrics_bp = Blueprint('metrics_bp', __name__)
+
+
+def graph_pool_stats():
+    # The graph DB is optional (py2neo); its pool is only reported once something has imported it
+    neo4_db = sys.modules.get('app.models.neo4_db')
+    return neo4_db.get_pool().stats() if neo4_db is not None else None
+
+
+def ratelimit_stats():
+    bucket = get_transport().bucket
+    return {'tokens': bucket.tokens, 'capacity': bucket.capacity}
+
+
+REGISTRY.register_collector('raidrite_follows_cache', 'Follows cache statistics', lambda: get_follows_cache().stats())
+REGISTRY.register_collector('raidrite_suggestion_cache', 'Suggestion cache statistics',
+                            lambda: get_suggestion_cache().stats())
+REGISTRY.register_collector('raidrite_user_loader', 'Helix users loader statistics', lambda: get_user_loader().stats())
+REGISTRY.register_collector('raidrite_live_index', 'Live index statistics', lambda: get_live_index().stats())
+REGISTRY.register_collector('raidrite_single_flight', 'Single-flight statistics', lambda: get_single_flight().stats())
+REGISTRY.register_collector('raidrite_jobs', 'Job queue statistics', lambda: get_job_queue().stats())
+REGISTRY.register_collector('raidrite_graph_pool', 'Graph DB connection pool statistics', graph_pool_stats)
+REGISTRY.register_collector('raidrite_helix_ratelimit', 'Helix rate limit bucket', ratelimit_stats)
+
+
+@metrics_bp.before_app_request
+def start_timer():
+    g.request_started_at = perf_counter()
+
+
+@metrics_bp.after_app_request
+def observe_latency(response):
+    """ Records the latency of every request; for streamed responses this is the time to the first byte. """
+    if 'request_started_at' in g:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        HTTP_SECONDS.observe(perf_counter() - g.request_started_at, route=route, method=request.method,
+                             status=response.status_code)
+    return response
+
+
+@metrics_bp.route('/metrics')
+def metrics():
+    """
+    Exports the metrics of this process in the Prometheus text format.  Each gunicorn worker keeps its own metrics, so
+    scrape every worker (or run a single worker) for complete counts.
+    """
+    return Response(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,96 @@
+import hmac
+import logging
+import os
+from threading import BoundedSemaphore
+from flask import Blueprint, current_app, g, request, send_file, url_for
+from app.profiling import PROFILE_DIR, Profile, profile_path
+
+try:
+    from app import settings
+    PROFILE_TOKEN = getattr(settings, 'PROFILE_TOKEN', None)
+    PROFILE_MAX_ACTIVE = getattr(settings, 'PROFILE_MAX_ACTIVE', 2)
+except ImportError:
+    PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN')
+    PROFILE_MAX_ACTIVE = int(os.environ.get('PROFILE_MAX_ACTIVE', 2))
+
+module_logger = logging.getLogger(__name__+'.py')
+
+profiles_bp = Blueprint('profiles_bp', __name__, url_prefix='/profiles')
+
+# Bounds the number of requests profiled at once; further requests for profiling run unprofiled
+_profiling_slots = BoundedSemaphore(PROFILE_MAX_ACTIVE)
+
+
+def is_authorized() -> bool:
+    """
+    Profiling must be unlocked with the X-Profile-Token header matching PROFILE_TOKEN; without a PROFILE_TOKEN it is
+    only available in debug and testing mode.  The token is never read from the query string, which ends up in access
+    logs and browser history.
+    """
+    if not PROFILE_TOKEN:
+        return current_app.debug or current_app.testing
+    token = request.headers.get('X-Profile-Token', '')
+    return hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode())
+
+
+def is_requested() -> bool:
+    flag = request.headers.get('X-Profile') or request.args.get('profile', '')
+    return flag.lower() in ('1', 'true', 'yes')
+
+
+@profiles_bp.before_app_request
+def start_profile():
+    if not is_requested() or request.blueprint == profiles_bp.name or not is_authorized():
+        return
+    if not _profiling_slots.acquire(blocking=False):
+        module_logger.warning(f'Not profiling {request.path}; {PROFILE_MAX_ACTIVE} requests are already profiled')
+        return
+    rule = request.url_rule.rule if request.url_rule else request.path
+    g.profile = Profile(f'{request.method} {rule} ({request.path})').start()
+
+
+@profiles_bp.after_app_request
+def add_profile_headers(response):
+    profile = g.get('profile')
+    if profile is not None:
+        response.headers['X-Profile-Id'] = profile.id
+        response.headers['X-Profile-Url'] = url_for('profiles_bp.download', profile_id=profile.id)
+        if response.is_streamed:
+            # Streamed routes are profiled until their last chunk has been sent
+            g.pop('profile')
+            response.call_on_close(lambda: save_profile(profile))
+    return response
+
+
+@profiles_bp.teardown_app_request
+def teardown_profile(exc):
+    profile = g.pop('profile', None)
+    if profile is not None:
+        save_profile(profile)
+
+
+def save_profile(profile: Profile):
+    try:
+        profile.stop()
+        profile.save(PROFILE_DIR)
+    except Exception as save_exc:
+        module_logger.error(f'Unable to save profile {profile.id}: {save_exc}')
+    finally:
+        _profiling_slots.release()
+
+
+@profiles_bp.route('/<profile_id>')
+def download(profile_id):
+    """
+    Downloads a saved profile: ?format=speedscope (default; open with https://www.speedscope.app) or ?format=chrome
+    (chrome://tracing or https://ui.perfetto.dev).  Requires the same authorization as profiling.
+    """
+    if not is_authorized():
+        return {'error': 'Profiling is not enabled.'}, 403
+    file_format = request.args.get('format', 'speedscope')
+    path = profile_path(profile_id, file_format, PROFILE_DIR)
+    if path is None:
+        return {'error': 'Unknown or expired profile, or unsupported format.'}, 404
+    resp = send_file(path, mimetype='application/json')
+    resp.headers['Content-Disposition'] = f'attachment; filename={os.path.basename(path)}'
+    return resp
@@ -0,0 +1,151 @@
+import logging
+import sys
+from array import array
+from collections import Counter
+from threading import Lock
+
+module_logger = logging.getLogger(__name__+'.py')
+
+
+class UserMeta:
+    """ Follows totals reported by Twitch for a user of a FollowStore; None until known. """
+    __slots__ = ('followers', 'followings')
+
+    def __init__(self, followers=None, followings=None):
+        self.followers = followers
+        self.followings = followings
+
+
+class FollowStore:
+    """
+    A compact, in-process store of follow edges.  Twitch uids are interned to dense integer ids in first-seen order;
+    each follower's followings are kept as one row of ids in an array column (CSR layout: a row offsets column and a
+    followed ids column), so an edge costs 4 bytes instead of a string object and a list slot.  Follows totals are
+    kept per user in __slots__ records.
+
+    Followings are added once per follower; adding a follower that is already stored is a no-op, as a store lives for
+    one crawl (e.g., a BatchClient run) rather than across the lifetime of follows lists.
+    """
+    __slots__ = ('_ids', '_uids', '_row_users', '_indptr', '_followed', '_rows', '_meta', '_lock')
+
+    def __init__(self):
+        self._ids = {}  # uid -> interned id
+        self._uids = []  # interned id -> uid
+        self._row_users = array('I')  # row -> interned follower id
+        self._indptr = array('Q', [0])  # row -> offset of its first followed id; rows end where the next row starts
+        self._followed = array('I')  # interned followed ids of every row, back to back
+        self._rows = {}  # interned follower id -> row
+        self._meta = {}  # interned id -> UserMeta
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        """ :return: The number of follow edges stored """
+        return len(self._followed)
+
+    def __contains__(self, follower_uid: str) -> bool:
+        """ :return: True if the followings of follower_uid are stored """
+        return self._ids.get(follower_uid) in self._rows
+
+    @property
+    def n_followers(self) -> int:
+        return len(self._row_users)
+
+    @property
+    def n_users(self) -> int:
+        return len(self._uids)
+
+    def stats(self) -> dict:
+        return {'edges': len(self), 'followers': self.n_followers, 'users': self.n_users, 'bytes': self.nbytes()}
+
+    def nbytes(self) -> int:
+        """ :return: An estimate of the memory used by the store, including its interned uid strings """
+        columns = sum(column.buffer_info()[1] * column.itemsize
+                      for column in (self._row_users, self._indptr, self._followed))
+        tables = sum(sys.getsizeof(table) for table in (self._ids, self._uids, self._rows, self._meta))
+        uids = sum(sys.getsizeof(uid) for uid in self._uids)
+        meta = len(self._meta) * sys.getsizeof(UserMeta())
+        return columns + tables + uids + meta
+
+    def intern(self, uid: str) -> int:
+        """ :return: The integer id of uid, assigning the next id if uid is new """
+        user_id = self._ids.get(uid)
+        if user_id is None:
+            user_id = self._ids[uid] = len(self._uids)
+            self._uids.append(uid)
+        return user_id
+
+    def uid(self, user_id: int) -> str:
+        return self._uids[user_id]
+
+    def add_follower(self, follower_uid: str, followed_uids) -> bool:
+        """
+        Stores the followings of a follower as a new row.
+
+        :param followed_uids: An iterable of the uids followed by follower_uid
+        :return: False if the followings of follower_uid were already stored (and were left unchanged)
+        """
+        with self._lock:
+            follower_id = self.intern(follower_uid)
+            if follower_id in self._rows:
+                return False
+            self._followed.extend(map(self.intern, followed_uids))
+            self._rows[follower_id] = len(self._row_users)
+            self._row_users.append(follower_id)
+            self._indptr.append(len(self._followed))
+        return True
+
+    def followed_ids(self, follower_uid: str) -> array:
+        """ :return: The interned ids followed by follower_uid, or None if its followings are not stored """
+        with self._lock:
+            row = self._rows.get(self._ids.get(follower_uid))
+            if row is None:
+                return None
+            return self._followed[self._indptr[row]:self._indptr[row + 1]]
+
+    def followings(self, follower_uid: str) -> list:
+        """ :return: The uids followed by follower_uid, in the order they were added, or None if not stored """
+        followed_ids = self.followed_ids(follower_uid)
+        return None if followed_ids is None else list(map(self._uids.__getitem__, followed_ids))
+
+    def follower_uids(self) -> list:
+        """ :return: The uids of every stored follower, in the order their followings were added """
+        return list(map(self._uids.__getitem__, self._row_users))
+
+    def overlap_counts(self, follower_uids=None) -> Counter:
+        """
+        Counts, for each followed uid, how many of the given followers follow it.  Counts are built in the order of
+        follower_uids, so the result is identical (in content and order) to updating a Counter with each follower's
+        followings in turn, as TwitchClient.get_followers_followings() does.
+
+        :param follower_uids: An iterable of follower uids; every stored follower if None.  Unknown uids are ignored.
+        :return: A Counter of {'followed_uid': number of followers, ...}
+        """
+        overlap = Counter()
+        for follower_uid in (self.follower_uids() if follower_uids is None else follower_uids):
+            followed_ids = self.followed_ids(follower_uid)
+            if followed_ids:
+                overlap.update(map(self._uids.__getitem__, followed_ids))
+        return overlap
+
+    def set_total(self, uid: str, to_or_from_id: str, total: int):
+        """ Records the followers ('to_id') or followings ('from_id') total reported by Twitch for uid. """
+        with self._lock:
+            user_id = self.intern(uid)
+            meta = self._meta.get(user_id)
+            if meta is None:
+                meta = self._meta[user_id] = UserMeta()
+            if to_or_from_id == 'to_id':
+                meta.followers = total
+            else:
+                meta.followings = total
+
+    def total(self, uid: str, to_or_from_id: str):
+        """ :return: The followers ('to_id') or followings ('from_id') total recorded for uid, or None if unknown """
+        meta = self.meta(uid)
+        if meta is None:
+            return None
+        return meta.followers if to_or_from_id == 'to_id' else meta.followings
+
+    def meta(self, uid: str):
+        """ :return: The UserMeta recorded for uid or None """
+        return self._meta.get(self._ids.get(uid))
@@ -0,0 +1,167 @@
+import logging
+import os
+import sqlite3
+from threading import Lock
+from time import time
+
+try:
+    from app import settings
+    FOLLOWER_DB = getattr(settings, 'FOLLOWER_DB', None)
+    FOLLOWER_RECONCILE_AGE = getattr(settings, 'FOLLOWER_RECONCILE_AGE', 86400)
+except ImportError:
+    FOLLOWER_DB = os.environ.get('FOLLOWER_DB')
+    FOLLOWER_RECONCILE_AGE = int(os.environ.get('FOLLOWER_RECONCILE_AGE', 86400))
+
+module_logger = logging.getLogger(__name__+'.py')
+
+
+def iter_follows_pages(helix, given_uid: str, watermark=None, page_size=100):
+    """
+    Pages through a streamer's followers (newest first, as helix returns them) and stops at the first follow older than
+    watermark, so that only follows made since the watermark are fetched.  Follows made in the same second as the
+    watermark are returned again; callers must treat adding a follow as idempotent.
+
+    :param helix: A HelixTransport
+    :param given_uid: A streamer's uid
+    :param watermark: A followed_at timestamp (e.g., '2020-01-01T00:00:00Z'); every follow is paged if None
+    :param page_size: The number of follows requested per page (at most 100)
+    :return: A generator of (total followers reported by helix, list of new follow dicts) tuples, one per request
+    """
+    q_params = {'to_id': given_uid, 'first': page_size}
+    while True:
+        resp = helix.get('users/follows', params=q_params)
+        page = resp['data']
+        new_follows = [follow for follow in page if watermark is None or follow['followed_at'] >= watermark]
+        yield resp['total'], new_follows
+        cursor = resp.get('pagination', {}).get('cursor')
+        if len(new_follows) < len(page) or not cursor or not page:
+            return
+        q_params['after'] = cursor
+
+
+class FollowerStore:
+    """
+    Stores every known follower of synced streamers, with the sync state (watermark, total and timestamps) of each
+    streamer, in an SQLite database on local disk when db_path is given, or in memory otherwise.
+    """
+    def __init__(self, db_path=FOLLOWER_DB):
+        self.db_path = db_path
+        self._lock = Lock()
+        self._db = sqlite3.connect(db_path or ':memory:', check_same_thread=False, isolation_level=None)
+        if db_path:
+            self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS followers ('
+                         'streamer_uid TEXT, follower_uid TEXT, followed_at TEXT, '
+                         'PRIMARY KEY (streamer_uid, follower_uid))')
+        self._db.execute('CREATE TABLE IF NOT EXISTS follower_sync ('
+                         'streamer_uid TEXT PRIMARY KEY, watermark TEXT, total INTEGER, synced_at REAL, '
+                         'reconciled_at REAL)')
+
+    def state(self, streamer_uid: str):
+        """ :return: A dictionary of {'watermark', 'total', 'synced_at', 'reconciled_at'} or None if never synced """
+        with self._lock:
+            row = self._db.execute('SELECT watermark, total, synced_at, reconciled_at FROM follower_sync '
+                                   'WHERE streamer_uid=?', (streamer_uid,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('watermark', 'total', 'synced_at', 'reconciled_at'), row))
+
+    def set_state(self, streamer_uid: str, watermark, total: int, synced_at: float, reconciled_at: float):
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO follower_sync VALUES (?, ?, ?, ?, ?)',
+                             (streamer_uid, watermark, total, synced_at, reconciled_at))
+
+    def followers(self, streamer_uid: str) -> list:
+        """ :return: A list of (follower_uid, followed_at) tuples, newest first """
+        with self._lock:
+            return self._db.execute('SELECT follower_uid, followed_at FROM followers WHERE streamer_uid=? '
+                                    'ORDER BY followed_at DESC, follower_uid', (streamer_uid,)).fetchall()
+
+    def count(self, streamer_uid: str) -> int:
+        with self._lock:
+            row = self._db.execute('SELECT count(*) FROM followers WHERE streamer_uid=?', (streamer_uid,)).fetchone()
+        return row[0]
+
+    def add(self, streamer_uid: str, follows: list) -> list:
+        """
+        Adds follows that are not stored yet.
+
+        :param follows: A list of helix follow dicts
+        :return: The follows that were added
+        """
+        added = []
+        with self._lock:
+            self._db.execute('BEGIN')
+            for follow in follows:
+                cursor = self._db.execute('INSERT OR IGNORE INTO followers VALUES (?, ?, ?)',
+                                          (streamer_uid, follow['from_id'], follow['followed_at']))
+                if cursor.rowcount:
+                    added.append(follow)
+            self._db.execute('COMMIT')
+        return added
+
+    def remove(self, streamer_uid: str, follower_uids: list):
+        with self._lock:
+            self._db.execute('BEGIN')
+            self._db.executemany('DELETE FROM followers WHERE streamer_uid=? AND follower_uid=?',
+                                 [(streamer_uid, follower_uid) for follower_uid in follower_uids])
+            self._db.execute('COMMIT')
+
+
+class FollowerSync:
+    """
+    Keeps a FollowerStore current with helix.  A streamer's first sync, and every sync once reconcile_age seconds have
+    passed since the last full pass, pages every follower and removes unfollows; other syncs only page follows newer
+    than the stored watermark, which takes a request or two for most streamers.  New and removed follows can be mirrored
+    elsewhere (e.g., Neo4j with neo4_db.merge_follows and neo4_db.delete_follows) through on_added and on_removed.
+    """
+    def __init__(self, helix, store: FollowerStore, reconcile_age=FOLLOWER_RECONCILE_AGE, on_added=None,
+                 on_removed=None):
+        """
+        :param on_added: Called with a list of new helix follow dicts
+        :param on_removed: Called with a streamer uid and a list of follower uids that unfollowed
+        """
+        self.helix = helix
+        self.store = store
+        self.reconcile_age = reconcile_age
+        self.on_added = on_added
+        self.on_removed = on_removed
+
+    def sync(self, streamer_uid: str, reconcile=None) -> dict:
+        """
+        :param reconcile: Forces (True) or prevents (False) a full pass; decided by reconcile_age if None
+        :return: A dictionary of {'mode': 'incremental' | 'full', 'requests', 'added', 'removed', 'total', 'stored'}
+        """
+        now = time()
+        state = self.store.state(streamer_uid)
+        if reconcile is None:
+            reconcile = state is None or now - state['reconciled_at'] >= self.reconcile_age
+        watermark = state['watermark'] if state and not reconcile else None
+
+        requests, total, newest, seen = 0, 0, None, []
+        for total, new_follows in iter_follows_pages(self.helix, streamer_uid, watermark):
+            requests += 1
+            newest = newest or (new_follows[0]['followed_at'] if new_follows else None)
+            seen.extend(new_follows)
+
+        added = self.store.add(streamer_uid, seen)
+        removed = []
+        if reconcile:
+            current = {follow['from_id'] for follow in seen}
+            removed = [follower_uid for follower_uid, _ in self.store.followers(streamer_uid)
+                       if follower_uid not in current]
+            self.store.remove(streamer_uid, removed)
+        if added and self.on_added:
+            self.on_added(added)
+        if removed and self.on_removed:
+            self.on_removed(streamer_uid, removed)
+
+        reconciled_at = now if reconcile or state is None else state['reconciled_at']
+        self.store.set_state(streamer_uid, newest or watermark, total, now, reconciled_at)
+        stored = self.store.count(streamer_uid)
+        if stored != total:
+            # Unfollows since the last full pass; they are removed at the next reconciliation
+            module_logger.info(f'{streamer_uid}: {stored} followers stored, {total} reported by helix')
+
+        return {'mode': 'full' if reconcile else 'incremental', 'requests': requests, 'added': len(added),
+                'removed': len(removed), 'total': total, 'stored': stored}
@@ -0,0 +1,208 @@
+import json
+import logging
+import os
+import sqlite3
+from collections import OrderedDict
+from threading import Lock
+from time import time
+
+try:
+    from app import settings
+    FOLLOWS_CACHE_TTL = getattr(settings, 'FOLLOWS_CACHE_TTL', 6 * 3600)
+    FOLLOWS_CACHE_SIZE = getattr(settings, 'FOLLOWS_CACHE_SIZE', 50000)
+    FOLLOWS_CACHE_BYTES = getattr(settings, 'FOLLOWS_CACHE_BYTES', 256 * 2 ** 20)
+    FOLLOWS_TOTAL_TTL = getattr(settings, 'FOLLOWS_TOTAL_TTL', 3600)
+    FOLLOWS_CACHE_DB = getattr(settings, 'FOLLOWS_CACHE_DB', None)
+except ImportError:
+    FOLLOWS_CACHE_TTL = int(os.environ.get('FOLLOWS_CACHE_TTL', 6 * 3600))
+    FOLLOWS_CACHE_SIZE = int(os.environ.get('FOLLOWS_CACHE_SIZE', 50000))
+    FOLLOWS_CACHE_BYTES = int(os.environ.get('FOLLOWS_CACHE_BYTES', 256 * 2 ** 20))
+    FOLLOWS_TOTAL_TTL = int(os.environ.get('FOLLOWS_TOTAL_TTL', 3600))
+    FOLLOWS_CACHE_DB = os.environ.get('FOLLOWS_CACHE_DB')
+
+module_logger = logging.getLogger(__name__+'.py')
+
+
+class FollowsCache:
+    """
+    A two tier TTL cache of follows lists keyed by (uid, 'to_id' | 'from_id').  Entries live in an in-memory LRU, bounded
+    by both entry count and approximate size, and, when db_path is given, in an SQLite database on local disk so that
+    they survive restarts and are shared by every worker on a host.  Each entry is stored as (total follows reported by
+    Twitch, list of the uids on the other side of the follows collected); follows totals looked up on their own are
+    cached separately, for total_ttl seconds.
+    """
+    # Disk eviction scans the whole table, so it only runs once every evict_every writes
+    evict_every = 500
+    # Approximate memory held by an entry and by each of its uid strings (str object plus list slot), in bytes
+    entry_bytes = 200
+    uid_bytes = 70
+
+    def __init__(self, ttl=FOLLOWS_CACHE_TTL, max_entries=FOLLOWS_CACHE_SIZE, db_path=FOLLOWS_CACHE_DB,
+                 max_bytes=FOLLOWS_CACHE_BYTES, total_ttl=FOLLOWS_TOTAL_TTL):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.total_ttl = total_ttl
+        self.db_path = db_path
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.total_hits = 0
+        self.total_misses = 0
+        self._entries = OrderedDict()
+        self._totals = OrderedDict()
+        self._bytes = 0
+        self._lock = Lock()
+        self._db = None
+        self._db_writes = 0
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            # Entries used to hold whole helix follow dicts; follow_ids rows hold uids only
+            self._db.execute('CREATE TABLE IF NOT EXISTS follow_ids ('
+                             'uid TEXT, direction TEXT, stored_at REAL, used_at REAL, total INTEGER, data TEXT, '
+                             'PRIMARY KEY (uid, direction))')
+            self._db.execute('CREATE INDEX IF NOT EXISTS follow_ids_used_at ON follow_ids (used_at)')
+            self._db.execute('CREATE TABLE IF NOT EXISTS follow_totals ('
+                             'uid TEXT, direction TEXT, stored_at REAL, total INTEGER, PRIMARY KEY (uid, direction))')
+
+    @property
+    def hits(self) -> int:
+        return self.memory_hits + self.disk_hits
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        total_lookups = self.total_hits + self.total_misses
+        return {'memory_hits': self.memory_hits, 'disk_hits': self.disk_hits, 'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0, 'entries': len(self._entries),
+                'bytes': self._bytes, 'total_hits': self.total_hits, 'total_misses': self.total_misses,
+                'total_hit_rate': self.total_hits / total_lookups if total_lookups else 0.0}
+
+    def get(self, uid: str, direction: str):
+        """
+        :return: A (total, list of uids) tuple if a fresh entry exists for (uid, direction); None otherwise.
+        """
+        key = (uid, direction)
+        now = time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, total, data = entry
+                if now - stored_at < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    return total, data
+                self.__forget(key)
+
+            if self._db is not None:
+                row = self._db.execute('SELECT stored_at, total, data FROM follow_ids WHERE uid=? AND direction=?',
+                                       key).fetchone()
+                if row is not None and now - row[0] < self.ttl:
+                    self._db.execute('UPDATE follow_ids SET used_at=? WHERE uid=? AND direction=?', (now, *key))
+                    stored_at, total, data = row[0], row[1], json.loads(row[2])
+                    self.__remember(key, stored_at, total, data)
+                    self.disk_hits += 1
+                    return total, data
+
+            self.misses += 1
+        return None
+
+    def set(self, uid: str, direction: str, total: int, data: list):
+        """
+        :param total: The total follows reported by Twitch
+        :param data: The uids on the other side of the follows collected (strings)
+        """
+        key = (uid, direction)
+        now = time()
+        with self._lock:
+            self.__remember(key, now, total, data)
+            if self._db is not None:
+                self._db.execute('INSERT OR REPLACE INTO follow_ids VALUES (?, ?, ?, ?, ?, ?)',
+                                 (*key, now, now, total, json.dumps(data)))
+                self._db_writes += 1
+                if self._db_writes % self.evict_every == 0:
+                    self.__evict_disk()
+
+    def get_total(self, uid: str, direction: str):
+        """
+        :return: The total follows of (uid, direction) recorded by set_total() less than total_ttl seconds ago, or by
+        set() less than ttl seconds ago; None otherwise
+        """
+        key = (uid, direction)
+        now = time()
+        with self._lock:
+            entry = self._totals.get(key)
+            if entry is not None:
+                if now - entry[0] < self.total_ttl:
+                    self.total_hits += 1
+                    return entry[1]
+                del self._totals[key]
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] < self.ttl:
+                self.total_hits += 1
+                return entry[1]
+            if self._db is not None:
+                row = self._db.execute('SELECT stored_at, total FROM follow_totals WHERE uid=? AND direction=?',
+                                       key).fetchone()
+                if row is not None and now - row[0] < self.total_ttl:
+                    self.__remember_total(key, *row)
+                    self.total_hits += 1
+                    return row[1]
+            self.total_misses += 1
+        return None
+
+    def set_total(self, uid: str, direction: str, total: int):
+        key = (uid, direction)
+        now = time()
+        with self._lock:
+            self.__remember_total(key, now, total)
+            if self._db is not None:
+                self._db.execute('INSERT OR REPLACE INTO follow_totals VALUES (?, ?, ?, ?)', (*key, now, total))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._totals.clear()
+            self._bytes = 0
+            if self._db is not None:
+                self._db.execute('DELETE FROM follow_ids')
+                self._db.execute('DELETE FROM follow_totals')
+
+    def __remember(self, key, stored_at, total, data):
+        self.__forget(key)
+        self._entries[key] = (stored_at, total, data)
+        self._bytes += self.entry_bytes + self.uid_bytes * len(data)
+        while len(self._entries) > self.max_entries or (self._bytes > self.max_bytes and len(self._entries) > 1):
+            self.__forget(next(iter(self._entries)))
+
+    def __forget(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= self.entry_bytes + self.uid_bytes * len(entry[2])
+
+    def __remember_total(self, key, stored_at, total):
+        self._totals[key] = (stored_at, total)
+        self._totals.move_to_end(key)
+        while len(self._totals) > self.max_entries:
+            self._totals.popitem(last=False)
+
+    def __evict_disk(self):
+        # Drop expired rows first, then least recently used rows beyond max_entries
+        self._db.execute('DELETE FROM follow_ids WHERE stored_at < ?', (time() - self.ttl,))
+        self._db.execute('DELETE FROM follow_ids WHERE rowid IN ('
+                         'SELECT rowid FROM follow_ids ORDER BY used_at DESC LIMIT -1 OFFSET ?)', (self.max_entries,))
+        self._db.execute('DELETE FROM follow_totals WHERE stored_at < ?', (time() - self.total_ttl,))
+
+
+_follows_cache = None
+_follows_cache_lock = Lock()
+
+
+def get_follows_cache() -> FollowsCache:
+    """ Returns the process-wide FollowsCache, creating it on first use. """
+    global _follows_cache
+    if _follows_cache is None:
+        with _follows_cache_lock:
+            if _follows_cache is None:
+                _follows_cache = FollowsCache()
+    return _follows_cache
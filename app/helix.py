@@ -0,0 +1,185 @@
+import logging
+import os
+import random
+import requests
+from requests.adapters import HTTPAdapter
+from threading import Condition, Lock
+from time import perf_counter, time, sleep
+from app import profiling
+from app.auth import get_token_provider
+from app.metrics import HELIX_BYTES, HELIX_REQUESTS, HELIX_RETRIES, HELIX_SECONDS
+
+try:
+    from app import settings
+    HELIX_URL = getattr(settings, 'TWITCH_HELIX_URL', 'https://api.twitch.tv/helix')
+except ImportError:
+    HELIX_URL = os.environ.get('TWITCH_HELIX_URL', 'https://api.twitch.tv/helix')
+
+module_logger = logging.getLogger(__name__+'.py')
+
+
+class TokenBucket:
+    """
+    A token bucket mirroring Twitch's rate limit: `capacity` points refilled evenly over `period` seconds.  The bucket is
+    kept in sync with the Ratelimit-* headers of every response so that all threads in a process share one view of the
+    remaining quota.  When Twitch reports the quota as exhausted, acquire() blocks until the reported reset time.
+    """
+
+    def __init__(self, capacity=800, period=60.0):
+        self.capacity = capacity
+        self.period = period
+        self.tokens = float(capacity)
+        self.blocked_until = 0.0
+        self._updated_at = time()
+        self._cond = Condition(Lock())
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / self.period
+
+    def acquire(self, cost=1):
+        """ Blocks until `cost` points are available, then spends them. """
+        with self._cond:
+            while True:
+                now = time()
+                self.__refill(now)
+                if now >= self.blocked_until and self.tokens >= cost:
+                    self.tokens -= cost
+                    return
+                wait = max(self.blocked_until - now, (cost - self.tokens) / self.rate)
+                self._cond.wait(timeout=wait)
+
+    def sync(self, limit=None, remaining=None, reset=None):
+        """
+        Updates the bucket from Twitch's view of the quota.
+
+        :param limit: Value of the Ratelimit-Limit header (points per period)
+        :param remaining: Value of the Ratelimit-Remaining header
+        :param reset: Value of the Ratelimit-Reset header (unix epoch seconds at which the bucket is full again)
+        """
+        with self._cond:
+            self.__refill(time())
+            if limit is not None and int(limit) > 0:
+                self.capacity = int(limit)
+            if remaining is not None:
+                # Requests in flight may have been counted by Twitch but not yet by us; trust the lower number
+                self.tokens = min(self.tokens, float(remaining))
+                if int(remaining) <= 0 and reset is not None:
+                    self.blocked_until = max(self.blocked_until, float(reset))
+            self._cond.notify_all()
+
+    def __refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+
+class HelixTransport:
+    """
+    The single HTTP path to Twitch's helix API.  Every call waits on a shared TokenBucket, authenticates with the
+    process-wide app access token, uses per-call timeouts, and retries 429s (after the reported reset time), 5xx
+    responses and connection errors with exponential backoff and full jitter.  A 401 drops the cached token and is
+    retried once with a new token.  Any other error, or a retryable error once retries are exhausted, is raised as a
+    requests.HTTPError (or the underlying requests exception).
+    """
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, base_url=HELIX_URL, token_provider=None, bucket=None, timeout=(3.05, 10), max_retries=4,
+                 backoff=0.5, max_backoff=30.0, pool_size=32):
+        self.base_url = base_url.rstrip('/')
+        self.token_provider = token_provider if token_provider else get_token_provider()
+        self.bucket = bucket if bucket else TokenBucket()
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.sess = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.sess.mount('https://', adapter)
+        self.sess.mount('http://', adapter)
+
+
+    def get(self, endpoint: str, params=None, headers=None, timeout=None) -> dict:
+        """
+        Sends a GET request to a helix endpoint and returns the decoded json response.
+
+        :param str endpoint: A helix endpoint relative to base_url, e.g., 'users/follows'
+        :param params: Query parameters for the request
+        :param headers: Authorization headers to be used instead of the shared app access token
+        :param timeout: A (connect, read) timeout in seconds overriding the transport's default for this call
+        :return: The json response as a dictionary
+        """
+        url = f'{self.base_url}/{endpoint}'
+        reauthorized = False
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            start_time = perf_counter()
+            auth_headers = headers or self.token_provider.bear_token
+            try:
+                resp = self.sess.get(url, params=params, headers=auth_headers, timeout=timeout or self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as exc:
+                HELIX_REQUESTS.inc(endpoint=endpoint, status=type(exc).__name__)
+                profiling.record(f'helix {endpoint}', start_time, params=params, attempt=attempt,
+                                 error=type(exc).__name__)
+                if attempt >= self.max_retries:
+                    raise
+                HELIX_RETRIES.inc(endpoint=endpoint, reason=type(exc).__name__)
+                module_logger.warning(f'Retrying {endpoint} after {type(exc).__name__}')
+                sleep(self.__backoff(attempt))
+                attempt += 1
+                continue
+
+            HELIX_SECONDS.observe(perf_counter() - start_time, endpoint=endpoint)
+            HELIX_REQUESTS.inc(endpoint=endpoint, status=resp.status_code)
+            HELIX_BYTES.inc(len(resp.content), endpoint=endpoint)
+            profiling.record(f'helix {endpoint}', start_time, params=params, attempt=attempt, status=resp.status_code,
+                             bytes=len(resp.content))
+            self.bucket.sync(resp.headers.get('Ratelimit-Limit'), resp.headers.get('Ratelimit-Remaining'),
+                             resp.headers.get('Ratelimit-Reset'))
+
+            if resp.status_code == 401 and not headers and not reauthorized:
+                # The app access token was revoked or expired early; fetch a new one and try again.  Only the token this
+                # request sent is dropped, so that a token another thread has just fetched survives.
+                self.token_provider.invalidate(auth_headers['Authorization'][len('Bearer '):])
+                reauthorized = True
+                HELIX_RETRIES.inc(endpoint=endpoint, reason=resp.status_code)
+                continue
+
+            if resp.status_code in self.RETRY_STATUSES and attempt < self.max_retries:
+                wait = self.__backoff(attempt)
+                if resp.status_code == 429:
+                    wait = max(wait, self.__until_reset(resp))
+                HELIX_RETRIES.inc(endpoint=endpoint, reason=resp.status_code)
+                module_logger.warning(f'Retrying {endpoint} after HTTP {resp.status_code} in {round(wait, 2)} sec')
+                sleep(wait)
+                attempt += 1
+                continue
+
+            resp.raise_for_status()
+            return resp.json()
+
+
+    def __backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+
+    def __until_reset(self, resp) -> float:
+        reset = resp.headers.get('Ratelimit-Reset')
+        if reset is not None:
+            return min(self.max_backoff, max(0.0, float(reset) - time()) + random.uniform(0, self.backoff))
+        retry_after = resp.headers.get('Retry-After')
+        return float(retry_after) if retry_after else 0.0
+
+
+_transport = None
+_transport_lock = Lock()
+
+
+def get_transport() -> HelixTransport:
+    """ Returns the process-wide HelixTransport, creating it on first use. """
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = HelixTransport()
+    return _transport
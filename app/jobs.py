@@ -0,0 +1,211 @@
+import itertools
+import logging
+import os
+import pickle
+import sqlite3
+import uuid
+from queue import Full, PriorityQueue
+from threading import Lock, Thread
+from time import time
+
+try:
+    from app import settings
+    JOB_WORKERS = getattr(settings, 'JOB_WORKERS', 4)
+    JOB_QUEUE_SIZE = getattr(settings, 'JOB_QUEUE_SIZE', 100)
+    JOB_TIMEOUT = getattr(settings, 'JOB_TIMEOUT', 120)
+    JOB_RESULT_TTL = getattr(settings, 'JOB_RESULT_TTL', 600)
+    JOB_DB = getattr(settings, 'JOB_DB', None)
+except ImportError:
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 4))
+    JOB_QUEUE_SIZE = int(os.environ.get('JOB_QUEUE_SIZE', 100))
+    JOB_TIMEOUT = int(os.environ.get('JOB_TIMEOUT', 120))
+    JOB_RESULT_TTL = int(os.environ.get('JOB_RESULT_TTL', 600))
+    JOB_DB = os.environ.get('JOB_DB')
+
+module_logger = logging.getLogger(__name__+'.py')
+
+
+class JobTimeout(Exception):
+    """ Raised by Job.check_deadline() once a job has run for longer than its timeout. """
+
+
+class Job:
+    """ A unit of work run by a JobQueue; targets receive their Job to report progress and check their deadline. """
+    __slots__ = ('id', 'key', 'target', 'priority', 'timeout', 'status', 'progress', 'result', 'error', 'submitted_at',
+                 'started_at', 'finished_at', 'store')
+
+    def __init__(self, target, key=None, priority=10, timeout=JOB_TIMEOUT):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.target = target
+        self.priority = priority
+        self.timeout = timeout
+        self.status = 'queued'
+        self.progress = None
+        self.result = None
+        self.error = None
+        self.submitted_at = time()
+        self.started_at = None
+        self.finished_at = None
+        self.store = None
+
+    def report(self, progress):
+        """ Publishes (picklable) progress for status requests, then checks the deadline. """
+        self.progress = progress
+        if self.store is not None:
+            self.store.put(self)
+        self.check_deadline()
+
+    def check_deadline(self):
+        if self.started_at is not None and time() - self.started_at > self.timeout:
+            raise JobTimeout(f'Job {self.id} timed out after {self.timeout} sec')
+
+    def as_dict(self) -> dict:
+        job = {'id': self.id, 'status': self.status, 'priority': self.priority, 'progress': self.progress,
+               'submitted_at': self.submitted_at, 'started_at': self.started_at, 'finished_at': self.finished_at}
+        if self.status == 'done':
+            job['result'] = self.result
+        if self.error is not None:
+            job['error'] = self.error
+        return job
+
+
+class JobStore:
+    """
+    Keeps the status of jobs so that any worker process can answer status requests: in an SQLite database shared by the
+    workers on a host when db_path is given, or in memory (visible to this process only) otherwise.
+    """
+    def __init__(self, db_path=JOB_DB, result_ttl=JOB_RESULT_TTL):
+        self.result_ttl = result_ttl
+        self._lock = Lock()
+        self._db = sqlite3.connect(db_path or ':memory:', check_same_thread=False, isolation_level=None, timeout=30)
+        if db_path:
+            self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, updated_at REAL, job BLOB)')
+
+    def put(self, job: Job):
+        now = time()
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO jobs VALUES (?, ?, ?)', (job.id, now, pickle.dumps(job.as_dict())))
+
+    def get(self, job_id: str):
+        """ :return: A job's status as a dictionary (see Job.as_dict()) or None if unknown or expired """
+        with self._lock:
+            row = self._db.execute('SELECT job FROM jobs WHERE id=?', (job_id,)).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def prune(self):
+        """ Deletes jobs that have not been updated for result_ttl seconds. """
+        with self._lock:
+            self._db.execute('DELETE FROM jobs WHERE updated_at<?', (time() - self.result_ttl,))
+
+
+class JobQueue:
+    """
+    A bounded priority queue of jobs run by a pool of local worker threads, so that slow work does not hold a web
+    worker.  Lower priority values run first; jobs with equal priority run in submission order.  Submitting a key that
+    is already queued or running returns the existing job.  Targets are called with their Job and should call
+    job.check_deadline() regularly: a job running longer than its timeout fails with status 'timeout'.
+    """
+    def __init__(self, workers=JOB_WORKERS, max_queued=JOB_QUEUE_SIZE, store=None):
+        self.workers = workers
+        self.store = store if store is not None else JobStore()
+        self._queue = PriorityQueue(maxsize=max_queued)
+        self._seq = itertools.count()
+        self._active = {}  # key -> queued or running Job
+        self._lock = Lock()
+        self._threads = []
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+
+    def stats(self) -> dict:
+        return {'queued': self._queue.qsize(), 'active': len(self._active), 'submitted': self.submitted,
+                'rejected': self.rejected, 'completed': self.completed, 'failed': self.failed,
+                'timed_out': self.timed_out}
+
+    def submit(self, target, key=None, priority=10, timeout=JOB_TIMEOUT) -> Job:
+        """
+        :param target: A callable accepting the Job and returning its (picklable) result
+        :param key: Identifies equivalent jobs; jobs without a key are never shared
+        :param priority: Lower values run first
+        :param timeout: The number of seconds the job may run
+        :return: The queued (or already queued or running) Job
+        :raises queue.Full: If max_queued jobs are already waiting
+        """
+        self.__start()
+        with self._lock:
+            if key is not None and key in self._active:
+                return self._active[key]
+            job = Job(target, key, priority, timeout)
+            job.store = self.store
+            try:
+                self._queue.put_nowait((priority, next(self._seq), job))
+            except Full:
+                self.rejected += 1
+                raise
+            self.submitted += 1
+            if key is not None:
+                self._active[key] = job
+        self.store.put(job)
+        self.store.prune()
+        return job
+
+    def __start(self):
+        if self._threads:
+            return
+        with self._lock:
+            if not self._threads:
+                self._threads = [Thread(target=self.__work, name=f'job-worker-{idx}', daemon=True)
+                                 for idx in range(self.workers)]
+                for thread in self._threads:
+                    thread.start()
+
+    def __work(self):
+        while True:
+            _, _, job = self._queue.get()
+            job.status, job.started_at = 'running', time()
+            self.store.put(job)
+            try:
+                job.result = job.target(job)
+                job.status = 'done'
+            except JobTimeout as exc:
+                job.status, job.error = 'timeout', str(exc)
+            except Exception as exc:
+                module_logger.error(f'Job {job.id} failed: {exc}')
+                job.status, job.error = 'failed', str(exc)
+            finally:
+                job.finished_at = time()
+                with self._lock:
+                    if job.status == 'done':
+                        self.completed += 1
+                    elif job.status == 'timeout':
+                        self.timed_out += 1
+                    else:
+                        self.failed += 1
+                    if self._active.get(job.key) is job:
+                        del self._active[job.key]
+                self.store.put(job)
+                self._queue.task_done()
+
+
+_job_queue = None
+_job_queue_lock = Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """
+    Returns the process-wide JobQueue, creating it on first use.  Its worker threads start with the first submitted
+    job, i.e., in the (forked) web worker that received it.  Set JOB_DB when running more than one worker process.
+    """
+    global _job_queue
+    if _job_queue is None:
+        with _job_queue_lock:
+            if _job_queue is None:
+                if not JOB_DB:
+                    module_logger.warning('JOB_DB is not set: job statuses are kept per process, so status requests '
+                                          'answered by another worker will not find them')
+                _job_queue = JobQueue()
+    return _job_queue
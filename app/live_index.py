@@ -0,0 +1,164 @@
+import logging
+import os
+from threading import Event, Lock, Thread
+from time import time
+from app.helix import get_transport
+
+try:
+    from app import settings
+    LIVE_INDEX_MAX_AGE = getattr(settings, 'LIVE_INDEX_MAX_AGE', 600)
+    LIVE_POLL_INTERVAL = getattr(settings, 'LIVE_POLL_INTERVAL', 0)
+except ImportError:
+    LIVE_INDEX_MAX_AGE = int(os.environ.get('LIVE_INDEX_MAX_AGE', 600))
+    LIVE_POLL_INTERVAL = int(os.environ.get('LIVE_POLL_INTERVAL', 0))
+
+module_logger = logging.getLogger(__name__+'.py')
+
+
+class LiveIndex:
+    """
+    A process-wide map of uid -> live stream status shared by every request.  Each known uid maps to the helix streams
+    record of its live broadcast, or to None when it is known to be offline.  Statuses are written by helix lookups, by
+    EventSub stream.online/stream.offline notifications and by the LivePoller; statuses older than max_age seconds are
+    treated as unknown so that the index never serves data that nothing has kept current.
+
+    Uids looked up in the last max_age seconds are active: those are the ones the LivePoller keeps current.  Statuses
+    older than max_age (and uids that are no longer looked up) are pruned at most once every max_age seconds, so the
+    index only holds the uids requests have recently asked about.
+    """
+    def __init__(self, max_age=LIVE_INDEX_MAX_AGE):
+        self.max_age = max_age
+        self._statuses = {}  # uid -> (stream record or None, updated_at)
+        self._looked_up = {}  # uid -> time of its last lookup
+        self._pruned_at = 0.0
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def active_uids(self) -> list:
+        """ :return: The uids looked up in the last max_age seconds """
+        now = time()
+        with self._lock:
+            return [uid for uid, looked_up_at in self._looked_up.items() if now - looked_up_at < self.max_age]
+
+    def lookup(self, uids: list) -> tuple:
+        """
+        :param uids: A list of user ids
+        :return: A tuple of ({'live_uid': stream record, ...}, [uids whose status is unknown or too old])
+        """
+        now = time()
+        live, unknown = {}, []
+        with self._lock:
+            self.__prune(now)
+            for uid in uids:
+                self._looked_up[uid] = now
+                status = self._statuses.get(uid)
+                if status is None or now - status[1] >= self.max_age:
+                    unknown.append(uid)
+                elif status[0] is not None:
+                    live[uid] = status[0]
+            self.hits += len(uids) - len(unknown)
+            self.misses += len(unknown)
+        return live, unknown
+
+    def update(self, uids: list, streams: list):
+        """ Records the result of a helix streams lookup: uids without a stream record are offline. """
+        now = time()
+        by_uid = {stream['user_id']: stream for stream in streams}
+        with self._lock:
+            self.__prune(now)
+            for uid in uids:
+                self._statuses[uid] = (by_uid.get(uid), now)
+
+    def set_offline(self, uid: str):
+        now = time()
+        with self._lock:
+            self.__prune(now)
+            self._statuses[uid] = (None, now)
+
+    def invalidate(self, uid: str):
+        """
+        Marks uid's status as unknown while keeping it in the index, e.g., on stream.online notifications, which do not
+        carry the title, viewer count or thumbnail; the next lookup fetches them from helix.
+        """
+        with self._lock:
+            self._statuses[uid] = (None, float('-inf'))
+
+    def clear(self):
+        with self._lock:
+            self._statuses.clear()
+            self._looked_up.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else 0.0,
+                'uids': len(self._statuses), 'looked_up': len(self._looked_up)}
+
+    def __prune(self, now: float):
+        """ Drops expired statuses and inactive uids, at most once every max_age seconds; the caller holds _lock. """
+        if now - self._pruned_at < self.max_age:
+            return
+        self._statuses = {uid: status for uid, status in self._statuses.items() if now - status[1] < self.max_age}
+        self._looked_up = {uid: looked_up_at for uid, looked_up_at in self._looked_up.items()
+                           if now - looked_up_at < self.max_age}
+        self._pruned_at = now
+
+
+class LivePoller:
+    """
+    A fallback for missed EventSub notifications: a daemon thread that refreshes the status of every active uid of the
+    index (see LiveIndex.active_uids()), 100 uids (the helix maximum) per streams request, every `interval` seconds.
+    """
+    req_batch_sz = 100
+
+    def __init__(self, helix, index: LiveIndex, interval: float):
+        self.helix = helix
+        self.index = index
+        self.interval = interval
+        self._stopped = Event()
+        self._thread = Thread(target=self.__run, name='live-poller', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+
+    def poll(self) -> int:
+        """ Refreshes every active uid once.  :return: The number of streams requests made """
+        uids = self.index.active_uids()
+        n_requests = 0
+        for next_batch in range(0, len(uids), self.req_batch_sz):
+            batch = uids[next_batch:next_batch+self.req_batch_sz]
+            streams = self.helix.get('streams', params={'user_id': batch, 'first': self.req_batch_sz})['data']
+            self.index.update(batch, streams)
+            n_requests += 1
+        return n_requests
+
+    def __run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as exc:
+                module_logger.warning(f'Live status poll failed: {exc}')
+
+
+_live_index = None
+_live_index_lock = Lock()
+
+
+def get_live_index() -> LiveIndex:
+    """
+    Returns the process-wide LiveIndex, creating it on first use.  When LIVE_POLL_INTERVAL is set, a LivePoller is
+    started with it; since this first runs while handling a request, each (forked) worker gets its own poller thread.
+    """
+    global _live_index
+    if _live_index is None:
+        with _live_index_lock:
+            if _live_index is None:
+                index = LiveIndex()
+                if LIVE_POLL_INTERVAL:
+                    LivePoller(get_transport(), index, LIVE_POLL_INTERVAL).start()
+                _live_index = index
+    return _live_index
@@ -0,0 +1,183 @@
+import logging
+import math
+from contextlib import contextmanager
+from threading import Lock
+from time import perf_counter
+
+module_logger = logging.getLogger(__name__+'.py')
+
+# Seconds; from a cached lookup to a cold suggestions run
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def format_value(value) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+
+def format_labels(labels: dict) -> str:
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+
+class Metric:
+    """ A metric family: one value (or histogram) per combination of label values. """
+    type = None
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # tuple of label values -> value
+        self._lock = Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}, got {tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def value(self, **labels):
+        """ :return: The current value for labels (e.g., for tests); None if nothing was recorded yet """
+        return self._values.get(self._key(labels))
+
+    def samples(self):
+        """ :return: A generator of (sample name, labels dict, value) tuples """
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in sorted(values, key=lambda item: item[0]):
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        lines.extend(f'{name}{format_labels(labels)} {format_value(value)}' for name, labels, value in self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for idx, upper_bound in enumerate(self.buckets):
+                if value <= upper_bound:
+                    counts[idx] += 1
+            self._values[key] = counts, total + value
+
+    @contextmanager
+    def time(self, **labels):
+        """ Observes the number of seconds spent in the with block. """
+        start_time = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - start_time, **labels)
+
+    def samples(self):
+        for _, labels, (counts, total) in super().samples():
+            for upper_bound, count in zip(self.buckets, counts):
+                yield f'{self.name}_bucket', dict(labels, le=format_value(upper_bound)), count
+            yield f'{self.name}_sum', labels, total
+            yield f'{self.name}_count', labels, counts[-1]
+
+
+class Registry:
+    """
+    Holds the metrics of a process and renders them in the Prometheus text exposition format.  Besides metrics updated
+    as events happen, collectors (callables returning a stats() dictionary) are read at render time; each numeric
+    entry is exported as a gauge named <prefix>_<entry>.
+    """
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = {}
+        self._lock = Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f'Metric {metric.name} is already registered')
+            self._metrics[metric.name] = metric
+        return metric
+
+    def register_collector(self, prefix: str, documentation: str, collect):
+        """
+        :param prefix: The name prefix of the exported gauges, e.g., 'raidrite_follows_cache'
+        :param collect: A callable returning a dictionary of {stat name: number, ...}, or None to export nothing
+        """
+        with self._lock:
+            self._collectors[prefix] = documentation, collect
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames=()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors.items())
+        families = [metric.render() for metric in metrics]
+        for prefix, (documentation, collect) in collectors:
+            try:
+                stats = collect()
+            except Exception as exc:
+                module_logger.error(f'Unable to collect {prefix} metrics: {exc}')
+                continue
+            for stat, value in (stats or {}).items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    families.append(f'# HELP {prefix}_{stat} {documentation} ({stat})\n'
+                                    f'# TYPE {prefix}_{stat} gauge\n{prefix}_{stat} {format_value(value)}')
+        return '\n'.join(families) + '\n'
+
+
+REGISTRY = Registry()
+
+PHASE_SECONDS = REGISTRY.histogram('raidrite_phase_seconds', 'Time spent in each phase of a suggestions run',
+                                   ['phase'])
+SUGGESTIONS_SECONDS = REGISTRY.histogram('raidrite_suggestions_seconds', 'Time to compute suggestions for a streamer',
+                                         ['source'])
+SKIPPED_FOLLOWERS = REGISTRY.counter('raidrite_skipped_followers_total',
+                                     'Followers skipped as bot-like for following too many streams')
+HELIX_REQUESTS = REGISTRY.counter('raidrite_helix_requests_total', 'Helix requests by endpoint and response status',
+                                  ['endpoint', 'status'])
+HELIX_SECONDS = REGISTRY.histogram('raidrite_helix_request_seconds', 'Helix request latency (each attempt)',
+                                   ['endpoint'])
+HELIX_BYTES = REGISTRY.counter('raidrite_helix_response_bytes_total', 'Helix response body bytes received',
+                               ['endpoint'])
+HELIX_RETRIES = REGISTRY.counter('raidrite_helix_retries_total', 'Helix requests retried, by reason',
+                                 ['endpoint', 'reason'])
+OAUTH_REQUESTS = REGISTRY.counter('raidrite_oauth_requests_total', 'Twitch OAuth requests by kind and response status',
+                                  ['kind', 'status'])
+OAUTH_SECONDS = REGISTRY.histogram('raidrite_oauth_request_seconds', 'Twitch OAuth request latency', ['kind'])
+HTTP_SECONDS = REGISTRY.histogram('raidrite_http_request_seconds', 'Latency of requests served by RaidRite',
+                                  ['route', 'method', 'status'])
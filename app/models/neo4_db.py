@@ -1,7 +1,11 @@
 from app import settings
 import logging
+import os
+from contextlib import contextmanager
+from itertools import chain, islice
+from threading import BoundedSemaphore, Lock
+from time import perf_counter, time
 import app.twitch_client as twitch_client
-from app.twitch_client import TwitchStreamer
 from py2neo import Graph
 from py2neo.ogm import GraphObject, Property, Label, RelatedFrom
 
@@ -9,17 +13,340 @@ module_logger = logging.getLogger(__name__+'.py')
 
 # for logging in fxn def outside class def
 # https://docs.python.org/3/howto/logging-cookbook.html#using-logging-in-multiple-modules
-# TODO: This may need to move to an extensions.py file and imported here so that new DB connections will not be made for
-#  each instantiation of this class (from extensions import graph)
-graph = Graph(
-    host=settings.NEO4J_HOST,
-    port=settings.NEO4J_PORT,
-    user=settings.NEO4J_USER,
-    password=settings.NEO4J_PASSWORD
-)
 
-graph.schema.create_uniqueness_constraint('User', 'twitch_uid')
-graph.schema.create_uniqueness_constraint('Streamer', 'twitch_uid')
+# The maximum number of connections (and concurrent DB operations) per worker process
+MAX_CONNECTIONS = getattr(settings, 'NEO4J_MAX_CONNECTIONS', 10)
+
+
+class GraphPool:
+    """
+    Creates the py2neo Graph on first use rather than at import, so that importing this module (and booting a worker)
+    does not depend on the DB being reachable.  DB operations borrow one of max_connections slots through
+    connection(); the time spent waiting for a slot is recorded in wait_time/max_wait.
+    """
+    def __init__(self, max_connections=MAX_CONNECTIONS, **graph_settings):
+        self.max_connections = max_connections
+        self.graph_settings = graph_settings
+        self._graph = None
+        self._graph_lock = Lock()
+        self._slots = BoundedSemaphore(max_connections)
+        self._stats_lock = Lock()
+        self.acquired = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+
+    @property
+    def graph(self) -> Graph:
+        if self._graph is None:
+            with self._graph_lock:
+                if self._graph is None:
+                    module_logger.info(f'Connecting to neo4j DB (pid {os.getpid()}, '
+                                       f'{self.max_connections} connections) ...')
+                    # py2neo sizes its connection pool with the max_size connector setting
+                    self._graph = Graph(max_size=self.max_connections, **self.graph_settings)
+        return self._graph
+
+    @contextmanager
+    def connection(self):
+        """ Borrows a connection slot for the duration of a with block, yielding the Graph. """
+        start_time = perf_counter()
+        self._slots.acquire()
+        waited = perf_counter() - start_time
+        with self._stats_lock:
+            self.acquired += 1
+            self.wait_time += waited
+            self.max_wait = max(self.max_wait, waited)
+        try:
+            yield self.graph
+        finally:
+            self._slots.release()
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {'acquired': self.acquired, 'wait_time': self.wait_time, 'max_wait': self.max_wait,
+                    'mean_wait': self.wait_time / self.acquired if self.acquired else 0.0}
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = Lock()
+
+
+def get_pool() -> GraphPool:
+    """
+    Returns this process's GraphPool, creating it on first use.  Pools (and their sockets) are never shared across a
+    fork: a worker forked after the pool was created (e.g., gunicorn --preload) gets a pool of its own.
+    """
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = GraphPool(host=settings.NEO4J_HOST, port=settings.NEO4J_PORT, user=settings.NEO4J_USER,
+                                  password=settings.NEO4J_PASSWORD)
+                _pool_pid = os.getpid()
+    return _pool
+
+
+def _reset_pool_after_fork():
+    global _pool, _pool_pid, _pool_lock
+    _pool, _pool_pid, _pool_lock = None, None, Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_pool_after_fork)
+
+
+def get_graph() -> Graph:
+    """ Returns this process's Graph without borrowing a connection slot, e.g., for building OGM matches. """
+    return get_pool().graph
+
+
+# Uniqueness constraints on twitch_uid; these also provide the indexes used by MATCH and MERGE on twitch_uid
+CONSTRAINTS = [('User', 'twitch_uid'), ('Streamer', 'twitch_uid')]
+
+
+def migrate() -> list:
+    """
+    Creates the DB schema (uniqueness constraints) if missing.  Run once per deployment with `flask migrate-graph`
+    rather than on import.
+
+    :return: A list of the (label, property_key) constraints that were created
+    """
+    created = []
+    with get_pool().connection() as graph:
+        for label, property_key in CONSTRAINTS:
+            if property_key not in graph.schema.get_uniqueness_constraints(label):
+                graph.schema.create_uniqueness_constraint(label, property_key)
+                created.append((label, property_key))
+    module_logger.info(f'Created {len(created)} of {len(CONSTRAINTS)} constraints: {created}')
+    return created
+
+
+# The number of rows sent per UNWIND statement (and per transaction) by bulk writes
+BATCH_SIZE = getattr(settings, 'NEO4J_BATCH_SIZE', 5000)
+
+# Follows are helix users/follows records; relationships match User.is_followed_by: (follower)-[:FOLLOWS]->(streamer)
+MERGE_FOLLOWS = """
+UNWIND $rows AS row
+MERGE (follower:User {twitch_uid: row.from_id})
+  SET follower.display_name = row.from_name
+MERGE (streamer:User {twitch_uid: row.to_id})
+MERGE (follower)-[follows:FOLLOWS]->(streamer)
+  SET follows.`followed at` = row.followed_at
+"""
+
+DELETE_FOLLOWS = """
+UNWIND $rows AS row
+MATCH (:User {twitch_uid: row.from_id})-[follows:FOLLOWS]->(:User {twitch_uid: row.to_id})
+DELETE follows
+"""
+
+# Users that are already in the DB (e.g., merged as the followed end of a FOLLOWS relationship) become Streamers
+MATCH_EXISTING = """
+UNWIND $uids AS uid
+MATCH (user:User {twitch_uid: uid})
+  SET user:Streamer
+RETURN user.twitch_uid
+"""
+
+MERGE_STREAMERS = """
+UNWIND $rows AS row
+MERGE (streamer:User {twitch_uid: row.twitch_uid})
+  SET streamer += row, streamer:Streamer
+"""
+
+# The number of followers whose followings are written together by User.add_all_followers_followings()
+FOLLOWERS_PER_BATCH = getattr(settings, 'NEO4J_FOLLOWERS_PER_BATCH', 100)
+
+# The number of SIMILAR_TO neighbours stored per Streamer; more than num_suggestions since many are not live
+SIMILAR_TO_K = getattr(settings, 'NEO4J_SIMILAR_TO_K', 100)
+
+# Replaces a batch of streamers' SIMILAR_TO relationships with their top $k co-followed streamers by the Jaccard
+# similarity of their followers sets.  Ties are broken by uid so that rebuilds are deterministic.  Followers counts
+# are aggregated from single hop matches (which the planner answers from the degree store) rather than with size() of
+# a pattern, which Neo4j 5 no longer accepts.
+BUILD_SIMILAR_TO = """
+UNWIND $uids AS uid
+MATCH (streamer:Streamer {twitch_uid: uid})
+OPTIONAL MATCH (streamer)-[old:SIMILAR_TO]->()
+DELETE old
+WITH DISTINCT streamer
+MATCH (streamer)<-[:FOLLOWS]-()
+WITH streamer, count(*) AS streamer_followers
+MATCH (streamer)<-[:FOLLOWS]-(:User)-[:FOLLOWS]->(candidate:Streamer)
+WHERE candidate <> streamer
+WITH streamer, streamer_followers, candidate, count(*) AS overlap
+WHERE overlap >= $min_overlap
+MATCH (candidate)<-[:FOLLOWS]-()
+WITH streamer, streamer_followers, candidate, overlap, count(*) AS candidate_followers
+WITH streamer, candidate, toFloat(overlap) / (streamer_followers + candidate_followers - overlap) AS score
+ORDER BY score DESC, candidate.twitch_uid
+WITH streamer, collect({candidate: candidate, score: score})[..$k] AS neighbours
+UNWIND range(0, size(neighbours) - 1) AS idx
+WITH streamer, neighbours[idx] AS neighbour, idx + 1 AS rank
+WITH streamer, neighbour.candidate AS candidate, neighbour.score AS score, rank
+CREATE (streamer)-[:SIMILAR_TO {score: score, rank: rank, computed_at: $computed_at}]->(candidate)
+RETURN count(*)
+"""
+
+MATCH_SIMILAR_TO = """
+MATCH (:Streamer {twitch_uid: $uid})-[similar:SIMILAR_TO]->(candidate:Streamer)
+WHERE similar.computed_at >= $computed_after
+RETURN candidate.twitch_uid AS uid, similar.score AS score
+ORDER BY similar.rank
+LIMIT $k
+"""
+
+
+def run_in_batches(query: str, rows, batch_size=BATCH_SIZE) -> dict:
+    """
+    Runs a parameterized UNWIND $rows query once per batch of rows, each batch inside its own explicit transaction, so
+    that a write costs one round trip per batch instead of one (or more) per row.
+
+    :param query: A Cypher statement reading its input from the $rows parameter
+    :param rows: A list or iterable of dictionaries of primitive values; iterables are consumed one batch at a time
+    :param batch_size: The number of rows per statement and transaction
+    :return: A dictionary of {'rows': int, 'batches': int, 'runtime': float, 'rows_per_sec': float}
+    """
+    start_time = perf_counter()
+    n_batches = n_rows = 0
+    rows = iter(rows)
+    batch = list(islice(rows, batch_size))
+    while batch:
+        with get_pool().connection() as graph:
+            tx = graph.begin()
+            try:
+                tx.run(query, rows=batch)
+                tx.commit()
+            except Exception:
+                tx.rollback()
+                raise
+        n_batches += 1
+        n_rows += len(batch)
+        batch = list(islice(rows, batch_size))
+
+    runtime = perf_counter() - start_time
+    rows_per_sec = round(n_rows / runtime, 1) if runtime else 0.0
+    module_logger.info(f'Wrote {n_rows} rows in {n_batches} batches @ {round(runtime, 2)} sec '
+                       f'({rows_per_sec} rows/sec)')
+    return {'rows': n_rows, 'batches': n_batches, 'runtime': runtime, 'rows_per_sec': rows_per_sec}
+
+
+def merge_follows(follows, batch_size=BATCH_SIZE) -> dict:
+    """
+    Merges helix users/follows records as User nodes joined by FOLLOWS relationships (with 'followed at'), in bulk.
+
+    :param follows: A list or iterable of {'from_id', 'from_name', 'to_id', 'followed_at', ...} dictionaries
+    :param batch_size: The number of follows per statement and transaction
+    :return: Ingestion stats, see run_in_batches()
+    """
+    rows = ({'from_id': follow['from_id'], 'from_name': follow['from_name'], 'to_id': follow['to_id'],
+             'followed_at': follow['followed_at']} for follow in follows)
+    return run_in_batches(MERGE_FOLLOWS, rows, batch_size)
+
+
+def ingest_followers(streamer_uid: str, batch_size=BATCH_SIZE) -> dict:
+    """
+    Merges every follower of a streamer while paging through them, so that at most one helix page and one batch of
+    rows are held in memory at a time, whatever the number of followers.
+
+    :param streamer_uid: The uid of a streamer already in the DB
+    :return: Ingestion stats, see run_in_batches()
+    """
+    return merge_follows(chain.from_iterable(twitch_client.iter_all_follows(streamer_uid, 'to_id')), batch_size)
+
+
+def delete_follows(streamer_uid: str, follower_uids: list, batch_size=BATCH_SIZE) -> dict:
+    """
+    Deletes the FOLLOWS relationships of unfollows (e.g., reconciled by follower_sync.FollowerSync), in bulk.
+
+    :param streamer_uid: The uid of the streamer that was unfollowed
+    :param follower_uids: A list of uids of users that unfollowed the streamer
+    :return: Ingestion stats, see run_in_batches()
+    """
+    rows = [{'from_id': follower_uid, 'to_id': streamer_uid} for follower_uid in follower_uids]
+    return run_in_batches(DELETE_FOLLOWS, rows, batch_size)
+
+
+def add_missing_streamers(streamer_uids: list, batch_size=BATCH_SIZE) -> int:
+    """
+    Adds Streamer nodes for those of streamer_uids that are not in the DB yet: existing uids are found (and labelled
+    Streamer, so that they are indexed by build_similarity_index()) with a single query, and missing ones are hydrated
+    with batched (100 ids per request) helix users lookups and written in bulk.
+
+    :param streamer_uids: A list of user ids (strings)
+    :param batch_size: The number of uids per statement and transaction
+    :return: The number of Streamer nodes added
+    """
+    existing = set()
+    for start in range(0, len(streamer_uids), batch_size):
+        with get_pool().connection() as graph:
+            records = graph.run(MATCH_EXISTING, uids=streamer_uids[start:start + batch_size])
+            existing.update(record[0] for record in records)
+    missing = [uid for uid in streamer_uids if uid not in existing]
+    if not missing:
+        return 0
+
+    rows = [{'twitch_uid': user['id'], 'name': user['login'], 'display_name': user['display_name'],
+             'profile_img_url': user['profile_image_url'], 'broadcaster_type': user['broadcaster_type']}
+            for user in twitch_client.get_users(missing)]
+    run_in_batches(MERGE_STREAMERS, rows, batch_size)
+    return len(rows)
+
+
+def build_similarity_index(k=SIMILAR_TO_K, n_streamers=50, min_overlap=2) -> dict:
+    """
+    Precomputes the top k co-followed neighbours of every Streamer node from the follow graph in the DB and stores them
+    as SIMILAR_TO relationships with 'score', 'rank' and 'computed_at' (epoch seconds) properties.  Streamers are
+    processed n_streamers at a time, each batch inside its own transaction, so an interrupted build keeps the batches
+    already written.
+
+    :param k: The number of neighbours stored per streamer
+    :param n_streamers: The number of streamers whose neighbours are computed per statement and transaction
+    :param min_overlap: The minimum number of shared followers for a candidate to be considered similar
+    :return: A dictionary of {'streamers': int, 'relationships': int, 'runtime': float}
+    """
+    start_time = perf_counter()
+    computed_at = time()
+    with get_pool().connection() as graph:
+        streamer_uids = [record[0] for record in graph.run('MATCH (streamer:Streamer) RETURN streamer.twitch_uid')]
+    n_relationships = 0
+    for start in range(0, len(streamer_uids), n_streamers):
+        with get_pool().connection() as graph:
+            tx = graph.begin()
+            try:
+                n_relationships += tx.evaluate(BUILD_SIMILAR_TO, uids=streamer_uids[start:start + n_streamers], k=k,
+                                               min_overlap=min_overlap, computed_at=computed_at) or 0
+                tx.commit()
+            except Exception:
+                tx.rollback()
+                raise
+
+    runtime = perf_counter() - start_time
+    module_logger.info(f'Indexed {n_relationships} SIMILAR_TO relationships for {len(streamer_uids)} streamers '
+                       f'@ {round(runtime, 2)} sec')
+    return {'streamers': len(streamer_uids), 'relationships': n_relationships, 'runtime': runtime}
+
+
+class SimilarityIndex:
+    """
+    Reads the precomputed SIMILAR_TO neighbours built by build_similarity_index().  Passed to TwitchClient as
+    similarity_index, it replaces the follower crawl for streamers that are indexed.
+    """
+    def __init__(self, k=SIMILAR_TO_K, max_age=None):
+        """
+        :param k: The maximum number of neighbours returned
+        :param max_age: Neighbours computed more than max_age seconds ago are ignored; any age is accepted by default
+        """
+        self.k = k
+        self.max_age = max_age
+
+    def neighbours(self, streamer_uid: str) -> list:
+        """ :return: A list of (candidate_uid, sim_score) tuples in descending order of similarity """
+        computed_after = time() - self.max_age if self.max_age is not None else 0
+        with get_pool().connection() as graph:
+            records = graph.run(MATCH_SIMILAR_TO, uid=streamer_uid, k=self.k, computed_after=computed_after)
+            return [(record['uid'], record['score']) for record in records]
 
 
 class BaseModel(GraphObject):
@@ -31,10 +358,11 @@ class BaseModel(GraphObject):
 
     @property
     def all(self):
-        return self.match(graph)
+        return self.match(get_graph())
 
     def save(self):
-        graph.push(self)
+        with get_pool().connection() as graph:
+            graph.push(self)
 
 
 class User(BaseModel):
@@ -66,7 +394,7 @@ class User(BaseModel):
     is_followed_by = RelatedFrom('User', 'FOLLOWS')
 
     @staticmethod
-    def create_or_update_from_twitch_client(some_streamer: TwitchStreamer):
+    def create_or_update_from_twitch_client(some_streamer: 'TwitchStreamer'):
         db_streamer = User()
         try:
             for key, val in some_streamer.as_dict().items():
@@ -83,7 +411,7 @@ class User(BaseModel):
         return db_streamer
 
     @staticmethod
-    def add_followers_to_streamer(some_streamer: TwitchStreamer, db_streamer: GraphObject) -> dict:
+    def add_followers_to_streamer(some_streamer: 'TwitchStreamer', db_streamer: GraphObject) -> dict:
         """
         Adds all followers to db for a given TwitchStreamer object and py2neo ogm object
 
@@ -118,23 +446,47 @@ class User(BaseModel):
         return {'foll_id_list': [each_fol['from_id'] for each_fol in foll_list], 'foll_nodes': foll_nodes}
 
     @staticmethod
-    def add_all_followers_followings(foll_dict: dict):
-        for follower_id, foll_node in zip(foll_dict['foll_id_list'], foll_dict['foll_nodes']):
-            # Fetch a followings list from twitch
-            all_followings = twitch_client.get_all_follows(follower_id, 'from_id', skip_validation=True)
+    def bulk_add_followers_to_streamer(some_streamer: 'TwitchStreamer', batch_size=BATCH_SIZE) -> dict:
+        """
+        Adds all followers to db for a given TwitchStreamer object like add_followers_to_streamer(), but writes follower
+        nodes and relationships with batched UNWIND ... MERGE statements instead of one push per follower.
 
-            for some_followed_stream in all_followings:
-                # Attempt to find Streamer node in DB
-                matched_streamer = User.match(graph, some_followed_stream['to_id']).first()
+        :param some_streamer: TwitchStreamer object and related methods
+        :param batch_size: The number of followers written per statement and transaction
+        :return: List of follower id's obtained from twitch and ingestion stats
+        """
+        foll_list = some_streamer.get_all_follows()
+        stats = merge_follows(foll_list, batch_size)
+        module_logger.info("Added {} followers of {} to DB".format(stats['rows'], some_streamer.display_name))
 
-                if matched_streamer is None:
-                    new_streamer = TwitchStreamer(some_followed_stream['to_name'])
-                    matched_streamer = User.create_or_update_from_twitch_client(new_streamer)
+        return {'foll_id_list': [each_fol['from_id'] for each_fol in foll_list], 'ingest': stats}
 
-                matched_streamer.is_followed_by.update(
-                    foll_node, properties={'followed at': some_followed_stream['followed_at']}
-                )
-                matched_streamer.save()
+    @staticmethod
+    def add_all_followers_followings(foll_dict: dict, n_followers=FOLLOWERS_PER_BATCH) -> dict:
+        """
+        Adds every stream followed by the given followers to db.  Followings are collected for n_followers followers at
+        a time; the followed streams missing from the DB are then added with one lookup query and batched helix users
+        requests, and all nodes and relationships are written in bulk, so DB round trips grow with the number of
+        batches rather than the number of follows.
+
+        :param foll_dict: The result of add_followers_to_streamer() or bulk_add_followers_to_streamer()
+        :param n_followers: The number of followers whose followings are written together
+        :return: A dictionary of {'follows': total follows written, 'streamers_added': total Streamer nodes added}
+        """
+        foll_id_list = foll_dict['foll_id_list']
+        totals = {'follows': 0, 'streamers_added': 0}
+        for start in range(0, len(foll_id_list), n_followers):
+            followings = []
+            for follower_id in foll_id_list[start:start + n_followers]:
+                # Fetch a followings list from twitch
+                followings.extend(twitch_client.get_all_follows(follower_id, 'from_id'))
+
+            followed_uids = list(dict.fromkeys(following['to_id'] for following in followings))
+            totals['streamers_added'] += add_missing_streamers(followed_uids)
+            totals['follows'] += merge_follows(followings)['rows']
+
+        module_logger.info("Added {follows} followings ({streamers_added} new streamers) to DB".format(**totals))
+        return totals
 
 # TODO: Delete or move this to twitch client?  it performs ZERO db operations
 # def get_streamer_set_from_foll_list(streamers_foll_list: list):
@@ -0,0 +1,363 @@
+import json
+import logging
+import os
+import sys
+import tempfile
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from itertools import count
+from threading import Event, Lock, Thread, current_thread, get_ident
+from time import perf_counter, time
+
+try:
+    from app import settings
+    PROFILE_DIR = getattr(settings, 'PROFILE_DIR', None)
+    PROFILE_SAMPLE_INTERVAL = getattr(settings, 'PROFILE_SAMPLE_INTERVAL', 0.005)
+    PROFILE_MAX_DURATION = getattr(settings, 'PROFILE_MAX_DURATION', 120)
+    PROFILE_MAX_FILES = getattr(settings, 'PROFILE_MAX_FILES', 50)
+except ImportError:
+    PROFILE_DIR = os.environ.get('PROFILE_DIR')
+    PROFILE_SAMPLE_INTERVAL = float(os.environ.get('PROFILE_SAMPLE_INTERVAL', 0.005))
+    PROFILE_MAX_DURATION = float(os.environ.get('PROFILE_MAX_DURATION', 120))
+    PROFILE_MAX_FILES = int(os.environ.get('PROFILE_MAX_FILES', 50))
+
+PROFILE_DIR = PROFILE_DIR or os.path.join(tempfile.gettempdir(), 'raidrite-profiles')
+FORMATS = {'speedscope': '.speedscope.json', 'chrome': '.trace.json'}
+
+module_logger = logging.getLogger(__name__+'.py')
+
+# The profile recording the current request (or main.py run), if any
+_current = ContextVar('raidrite_profile', default=None)
+
+
+class Span:
+    __slots__ = ('id', 'parent', 'name', 'tid', 'start', 'end', 'args')
+
+    def __init__(self, span_id, parent, name, tid, start, args):
+        self.id = span_id
+        self.parent = parent
+        self.name = name
+        self.tid = tid
+        self.start = start
+        self.end = None
+        self.args = args
+
+    def as_dict(self, children=()) -> dict:
+        return {'name': self.name, 'start': self.start, 'duration': (self.end or self.start) - self.start,
+                'args': self.args, 'children': list(children)}
+
+
+class Profile:
+    """
+    Records a single request (or run): a tree of timed spans, e.g., pipeline phases and every helix call, and a
+    sampling profile of the Python stacks of the threads working on it.  Sampling reads sys._current_frames() every
+    sample_interval seconds from a separate thread, so the profiled code itself is not slowed down by tracing; worker
+    threads take part once their work is wrapped with propagate().  Profiles can be saved as speedscope and Chrome
+    trace (chrome://tracing, Perfetto) json files.
+    """
+    def __init__(self, name: str, sample_interval=PROFILE_SAMPLE_INTERVAL, max_duration=PROFILE_MAX_DURATION):
+        """
+        :param name: A description of what is profiled, e.g., 'GET /user/<username>'
+        :param sample_interval: The number of seconds between stack samples; no samples are taken if 0
+        :param max_duration: Sampling stops after this many seconds
+        """
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.sample_interval = sample_interval
+        self.max_duration = max_duration
+        self.spans = []
+        self.samples = []  # (tid, at, weight, stack as a tuple of frame indices from the root)
+        self.frames = []  # speedscope frames: {'name': ..., 'file': ..., 'line': ...}
+        self.thread_names = {}
+        self.started_at = None
+        self.finished_at = None
+        self.created_at = time()
+        self._frame_index = {}
+        self._active = {}  # tid -> number of tasks being run for this profile
+        self._open = {}  # tid -> stack of open spans
+        self._span_ids = count(1)
+        self._lock = Lock()
+        self._stopped = Event()
+        self._sampler = None
+        self._token = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        """ Starts recording the calling thread and makes this the current profile of its context. """
+        self.started_at = perf_counter()
+        self._token = _current.set(self)
+        self.enter_thread()
+        if self.sample_interval:
+            self._sampler = Thread(target=self.__sample, name=f'profile-sampler-{self.id[:8]}', daemon=True)
+            self._sampler.start()
+        return self
+
+    def stop(self):
+        if self.finished_at is not None:
+            return
+        self.finished_at = perf_counter()
+        self._stopped.set()
+        self.exit_thread()
+        if self._token is not None:
+            try:
+                _current.reset(self._token)
+            except ValueError:
+                pass  # stopped from another context; current() ignores finished profiles
+            self._token = None
+        if self._sampler is not None:
+            self._sampler.join()
+
+    @property
+    def duration(self) -> float:
+        return ((self.finished_at or perf_counter()) - self.started_at) if self.started_at else 0.0
+
+    def enter_thread(self, parent=None):
+        """ Adds the calling thread to the threads sampled for this profile; parent becomes the parent of its spans. """
+        tid = get_ident()
+        with self._lock:
+            self._active[tid] = self._active.get(tid, 0) + 1
+            self.thread_names.setdefault(tid, current_thread().name)
+            if parent is not None:
+                self._open.setdefault(tid, []).append(parent)
+
+    def exit_thread(self, parent=None):
+        tid = get_ident()
+        with self._lock:
+            self._active[tid] -= 1
+            if not self._active[tid]:
+                del self._active[tid]
+            if parent is not None:
+                self._open[tid].pop()
+
+    def current_span(self):
+        stack = self._open.get(get_ident())
+        return stack[-1] if stack else None
+
+    @contextmanager
+    def span(self, name: str, **args):
+        """ Records the with block as a span nested in the thread's current span; yields the Span for adding args. """
+        span = self.__new_span(name, perf_counter(), args)
+        stack = self._open.setdefault(span.tid, [])
+        stack.append(span)
+        try:
+            yield span
+        finally:
+            span.end = perf_counter()
+            stack.pop()
+
+    def record(self, name: str, start: float, **args):
+        """ Records a span that started at start (a perf_counter() value) and ends now. """
+        self.__new_span(name, start, args).end = perf_counter()
+
+    def span_tree(self) -> list:
+        """ :return: The root spans as nested dictionaries of {'name', 'start', 'duration', 'args', 'children'} """
+        children = {}
+        for span in self.spans:
+            children.setdefault(span.parent.id if span.parent else None, []).append(span)
+
+        def subtree(span):
+            return span.as_dict(subtree(child) for child in children.get(span.id, []))
+
+        return [subtree(span) for span in children.get(None, [])]
+
+    def speedscope(self) -> dict:
+        """ :return: The profile in speedscope's file format: sampled stacks and span events for every thread """
+        frames = list(self.frames)
+        span_frames = {}
+        profiles = []
+        end = self.duration
+        for tid, name in self.thread_names.items():
+            samples = [(stack, weight) for sample_tid, _, weight, stack in self.samples if sample_tid == tid]
+            if samples:
+                profiles.append({'type': 'sampled', 'name': f'{name} (samples)', 'unit': 'seconds', 'startValue': 0,
+                                 'endValue': end, 'samples': [list(stack) for stack, _ in samples],
+                                 'weights': [weight for _, weight in samples]})
+            events = []
+            for span in self.__thread_spans(tid):
+                if span.name not in span_frames:
+                    span_frames[span.name] = len(frames)
+                    frames.append({'name': span.name})
+                events.append((span, span_frames[span.name]))
+            if events:
+                profiles.append({'type': 'evented', 'name': f'{name} (spans)', 'unit': 'seconds', 'startValue': 0,
+                                 'endValue': end, 'events': self.__open_close_events(events)})
+
+        return {'$schema': 'https://www.speedscope.app/file-format-schema.json', 'name': self.name,
+                'exporter': 'raidrite', 'activeProfileIndex': 0, 'shared': {'frames': frames}, 'profiles': profiles}
+
+    def chrome_trace(self) -> dict:
+        """ :return: The spans in the Chrome trace event format, one track per thread """
+        pid = os.getpid()
+        events = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+                  for tid, name in self.thread_names.items()]
+        for span in self.spans:
+            end = span.end if span.end is not None else span.start
+            events.append({'name': span.name, 'ph': 'X', 'pid': pid, 'tid': span.tid,
+                           'ts': round((span.start - self.started_at) * 1e6, 1),
+                           'dur': round((end - span.start) * 1e6, 1), 'args': span.args})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms',
+                'otherData': {'name': self.name, 'id': self.id, 'created_at': self.created_at}}
+
+    def save(self, directory=PROFILE_DIR, max_files=PROFILE_MAX_FILES) -> dict:
+        """
+        Writes the profile in every format to directory, deleting the oldest profiles beyond max_files.
+
+        :return: A dictionary of {format: file path, ...}
+        """
+        os.makedirs(directory, exist_ok=True)
+        paths = {}
+        for file_format, suffix in FORMATS.items():
+            paths[file_format] = os.path.join(directory, self.id + suffix)
+            content = self.speedscope() if file_format == 'speedscope' else self.chrome_trace()
+            with open(paths[file_format] + '.tmp', 'w') as profile_file:
+                json.dump(content, profile_file)
+            os.replace(paths[file_format] + '.tmp', paths[file_format])
+        prune(directory, max_files)
+        module_logger.info(f'Saved profile {self.id} of "{self.name}": {round(self.duration, 3)} sec, '
+                           f'{len(self.spans)} spans, {len(self.samples)} samples')
+        return paths
+
+    def __new_span(self, name, start, args) -> Span:
+        tid = get_ident()
+        span = Span(next(self._span_ids), self.current_span(), name, tid, start, args)
+        with self._lock:
+            self.spans.append(span)
+        return span
+
+    def __thread_spans(self, tid) -> list:
+        """ :return: The finished spans of a thread in depth-first order, i.e., properly nested """
+        spans = [span for span in self.spans if span.tid == tid and span.end is not None]
+        ids = {span.id for span in spans}
+        children = {}
+        for span in spans:
+            parent = span.parent.id if span.parent is not None and span.parent.id in ids else None
+            children.setdefault(parent, []).append(span)
+
+        ordered = []
+
+        def visit(span):
+            ordered.append(span)
+            for child in sorted(children.get(span.id, []), key=lambda child: child.start):
+                visit(child)
+
+        for root in sorted(children.get(None, []), key=lambda root: root.start):
+            visit(root)
+        return ordered
+
+    def __open_close_events(self, events: list) -> list:
+        # Spans are in depth-first order; close every open span that ends before the next one starts
+        result, open_spans = [], []
+        for span, frame in events:
+            while open_spans and open_spans[-1][0].end <= span.start:
+                closing, closing_frame = open_spans.pop()
+                result.append({'type': 'C', 'frame': closing_frame, 'at': closing.end - self.started_at})
+            at = span.start - self.started_at
+            result.append({'type': 'O', 'frame': frame, 'at': max(at, result[-1]['at']) if result else at})
+            open_spans.append((span, frame))
+        while open_spans:
+            closing, closing_frame = open_spans.pop()
+            result.append({'type': 'C', 'frame': closing_frame, 'at': max(closing.end - self.started_at,
+                                                                          result[-1]['at'])})
+        return result
+
+    def __sample(self):
+        own_tid = get_ident()
+        last = perf_counter()
+        while not self._stopped.wait(self.sample_interval):
+            now = perf_counter()
+            if now - self.started_at > self.max_duration:
+                module_logger.warning(f'Profile {self.id} stopped sampling after {self.max_duration} sec')
+                return
+            frames = sys._current_frames()
+            with self._lock:
+                tids = [tid for tid in self._active if tid != own_tid]
+            for tid in tids:
+                frame = frames.get(tid)
+                if frame is not None:
+                    self.samples.append((tid, now - self.started_at, now - last, self.__stack(frame)))
+            last = now
+
+    def __stack(self, frame) -> tuple:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            key = (code.co_name, code.co_filename, code.co_firstlineno)
+            index = self._frame_index.get(key)
+            if index is None:
+                index = self._frame_index[key] = len(self.frames)
+                self.frames.append({'name': code.co_name, 'file': code.co_filename, 'line': code.co_firstlineno})
+            stack.append(index)
+            frame = frame.f_back
+        return tuple(reversed(stack))
+
+
+def current():
+    """ :return: The Profile recording the calling context, or None """
+    profile = _current.get()
+    return profile if profile is not None and profile.finished_at is None else None
+
+
+@contextmanager
+def span(name: str, **args):
+    """ Records a span in the current profile, if any; usable as a decorator.  Yields the Span, or None. """
+    profile = current()
+    if profile is None:
+        yield None
+        return
+    with profile.span(name, **args) as new_span:
+        yield new_span
+
+
+def record(name: str, start: float, **args):
+    """ Records a span from start (a perf_counter() value) until now in the current profile, if any. """
+    profile = current()
+    if profile is not None:
+        profile.record(name, start, **args)
+
+
+def propagate(func):
+    """
+    :return: func wrapped to run as part of the current profile (if any) when called from another thread, e.g., a
+    ThreadPoolExecutor worker; its spans are nested in the span that is current now.
+    """
+    profile = current()
+    if profile is None:
+        return func
+    parent = profile.current_span()
+
+    def run(*args, **kwargs):
+        profile.enter_thread(parent)
+        token = _current.set(profile)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _current.reset(token)
+            profile.exit_thread(parent)
+    return run
+
+
+def profile_path(profile_id: str, file_format: str, directory=PROFILE_DIR):
+    """ :return: The path of a saved profile, or None if there is no such profile """
+    if file_format not in FORMATS or len(profile_id) != 32 or not all(c in '0123456789abcdef' for c in profile_id):
+        return None
+    path = os.path.join(directory, profile_id + FORMATS[file_format])
+    return path if os.path.isfile(path) else None
+
+
+def prune(directory=PROFILE_DIR, max_files=PROFILE_MAX_FILES):
+    """ Deletes the oldest saved profiles beyond max_files. """
+    suffix = FORMATS['chrome']
+    profiles = sorted((entry for entry in os.scandir(directory) if entry.name.endswith(suffix)),
+                      key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in profiles[max_files:]:
+        for other_suffix in FORMATS.values():
+            try:
+                os.remove(os.path.join(directory, entry.name[:-len(suffix)] + other_suffix))
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,90 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from app import profiling
+
+module_logger = logging.getLogger(__name__+'.py')
+
+
+class TopKRanker:
+    """
+    Ranks candidate streams by similarity score, overlap / (n_followers + total followers of candidate), while fetching
+    as few candidate totals as possible.  Since a candidate's total is never negative, overlap / n_followers is an upper
+    bound on its score.  Candidates are therefore scored in decreasing order of that bound, and scoring stops as soon
+    as no remaining candidate's bound can reach the k-th best score found so far.  Totals are fetched in waves of
+    max_workers concurrent calls.
+
+    The resulting ranking is identical to scoring every candidate and sorting, ties included: candidates with equal
+    scores keep their order in the supplied candidates dict.
+    """
+
+    def __init__(self, fetch_total, k: int, n_followers: int, max_workers=None):
+        """
+        :param fetch_total: A callable that returns the total followers count for a given candidate uid
+        :param int k: The number of best candidates to be ranked
+        :param int n_followers: The number of streamer followers that overlap counts were collected from
+        :param int max_workers: The number of totals fetched concurrently; totals are fetched serially by default
+        """
+        self.fetch_total = fetch_total
+        self.k = k
+        self.n_followers = n_followers
+        self.max_workers = max_workers if max_workers and max_workers > 1 else 1
+        self.totals = {}
+        self.calls_made = 0
+        self.calls_avoided = 0
+        self.runtime = 0.0
+
+
+    def score(self, overlap: int, total: int) -> float:
+        return overlap / (self.n_followers + total)
+
+
+    def rank(self, candidates: dict) -> list:
+        """
+        :param candidates: A dictionary of {'candidate_uid': overlap count, ...}
+        :return: A list of up to k (candidate_uid, sim_score) tuples in descending order of similarity
+        """
+        start_time = perf_counter()
+        position = {uid: idx for idx, uid in enumerate(candidates)}
+
+        def rank_key(scored_candidate):
+            uid, sim_score = scored_candidate
+            return -sim_score, position[uid]
+
+        # Highest upper bound first; ties keep candidates order
+        pending = sorted(candidates, key=lambda uid: -candidates[uid])
+        scored = {}
+        threshold = None
+        executor = ThreadPoolExecutor(max_workers=self.max_workers) if self.max_workers > 1 else None
+        fetch_total = profiling.propagate(self.fetch_total) if executor else self.fetch_total
+        try:
+            while pending and self.k > 0:
+                if threshold is not None and self.__bound(candidates[pending[0]]) < threshold:
+                    break
+
+                wave, pending = pending[:self.max_workers], pending[self.max_workers:]
+                if executor:
+                    totals = executor.map(fetch_total, wave)
+                else:
+                    totals = [self.fetch_total(uid) for uid in wave]
+                for uid, total in zip(wave, totals):
+                    self.totals[uid] = total
+                    scored[uid] = self.score(candidates[uid], total)
+                self.calls_made += len(wave)
+
+                if len(scored) >= self.k:
+                    threshold = sorted(scored.items(), key=rank_key)[self.k - 1][1]
+        finally:
+            if executor:
+                executor.shutdown()
+
+        self.calls_avoided = len(candidates) - self.calls_made
+        self.runtime = perf_counter() - start_time
+        module_logger.info(f'Ranked {len(candidates)} candidates with {self.calls_made} total follows calls '
+                           f'({self.calls_avoided} avoided) @ {round(self.runtime, 2)} sec')
+
+        return sorted(scored.items(), key=rank_key)[:self.k]
+
+
+    def __bound(self, overlap: int) -> float:
+        return overlap / self.n_followers if self.n_followers else float('inf')
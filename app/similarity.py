@@ -0,0 +1,156 @@
+import logging
+from array import array
+from collections import Counter
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # The sparse engine is optional; TwitchClient falls back to Counter based overlap counting
+    np = None
+    sparse = None
+
+module_logger = logging.getLogger(__name__+'.py')
+
+
+def sparse_engine_available() -> bool:
+    return np is not None and sparse is not None
+
+
+class CoFollowMatrix:
+    """
+    A follower-by-streamer sparse incidence matrix (scipy CSR) built one follower (row) at a time from collected
+    followings.  Streamers are assigned columns in first-seen order, which is also the insertion order of the Counter
+    built by TwitchClient.get_followers_followings(); ties are broken by column so that rankings match the Counter path.
+    Overlap and similarity scores for every candidate streamer are then computed in single vectorized passes.
+    """
+
+    def __init__(self):
+        if not sparse_engine_available():
+            raise ImportError('CoFollowMatrix requires numpy and scipy')
+        self._column = {}
+        self._streamer_uids = []
+        self._index_chunks = []
+        self._indptr = array('q', [0])
+        self._n_indexed = 0
+        self._pending = []
+        self._overlap = np.zeros(0, dtype=np.int64)
+        self._matrix = None
+
+    @classmethod
+    def from_store(cls, follow_store, follower_uids=None) -> 'CoFollowMatrix':
+        """
+        Builds the matrix from the followings kept in a follow_store.FollowStore, one row per follower.
+
+        :param follower_uids: The followers to include, in row order; every stored follower if None
+        """
+        cofollow = cls()
+        for follower_uid in (follow_store.follower_uids() if follower_uids is None else follower_uids):
+            cofollow.add_follower(follow_store.followings(follower_uid) or [])
+        return cofollow
+
+    @property
+    def streamer_uids(self) -> list:
+        """ Streamer uids indexed by column """
+        self.__assign_columns()
+        return self._streamer_uids
+
+    @property
+    def column(self) -> dict:
+        """ Columns keyed by streamer uid """
+        self.__assign_columns()
+        return self._column
+
+    @property
+    def n_followers(self) -> int:
+        return len(self._indptr) - 1
+
+    @property
+    def n_streamers(self) -> int:
+        self.__assign_columns()
+        return len(self._streamer_uids)
+
+    @property
+    def matrix(self):
+        """ The (n_followers x n_streamers) CSR incidence matrix; entry (i, j) is 1 if follower i follows streamer j """
+        self.__assign_columns()
+        if self._matrix is None or self._matrix.shape != (self.n_followers, self.n_streamers):
+            if len(self._index_chunks) != 1:
+                self._index_chunks = [np.concatenate(self._index_chunks or [np.zeros(0, dtype=np.int64)])]
+            indices = self._index_chunks[0]
+            indptr = np.frombuffer(self._indptr, dtype=np.int64)
+            data = np.ones(len(indices), dtype=np.int32)
+            self._matrix = sparse.csr_matrix((data, indices, indptr), shape=(self.n_followers, self.n_streamers))
+        return self._matrix
+
+    def add_follower(self, followed_uids):
+        """ Appends a row for a follower who follows each of followed_uids. """
+        self._pending.extend(followed_uids)
+        self._indptr.append(self._n_indexed + len(self._pending))
+
+    def __assign_columns(self):
+        # Columns are assigned in bulk, in first-seen order, when the matrix is next needed; dict.fromkeys and map keep
+        # the per-follow work out of the Python interpreter loop
+        if not self._pending:
+            return
+        column = self._column
+        for uid in dict.fromkeys(self._pending):
+            if uid not in column:
+                column[uid] = len(self._streamer_uids)
+                self._streamer_uids.append(uid)
+        new_indices = np.fromiter(map(column.__getitem__, self._pending), dtype=np.int64, count=len(self._pending))
+        self._index_chunks.append(new_indices)
+        # Column sums are kept up to date incrementally so that partial overlap is cheap while followings are collected
+        overlap = np.bincount(new_indices, minlength=len(self._streamer_uids))
+        overlap[:len(self._overlap)] += self._overlap
+        self._overlap = overlap
+        self._n_indexed += len(self._pending)
+        self._pending = []
+
+    def overlap(self):
+        """ :return: An array of follower overlap counts indexed by column, i.e., the column sums of the matrix """
+        self.__assign_columns()
+        return self._overlap
+
+    def overlap_counts(self) -> Counter:
+        """ :return: The overlap as a Counter, identical (in content and order) to the Counter path's followings_count """
+        return Counter(dict(zip(self.streamer_uids, self.overlap().tolist())))
+
+    def columns(self, uids):
+        self.__assign_columns()
+        return np.fromiter((self._column[uid] for uid in uids), dtype=np.int64, count=len(uids))
+
+    def scores(self, cols, n_followers: int, totals, method='union', scale=1.0):
+        """
+        Computes similarity scores for the streamers in cols in one vectorized pass.
+
+        :param cols: An array of candidate columns
+        :param int n_followers: The number of streamer followers that overlap was collected from
+        :param totals: An array of total followers counts aligned with cols
+        :param str method: 'union' for overlap / (n_followers + total) as used by get_similar_streams, or 'jaccard' for
+        overlap / (n_followers + total - overlap)
+        :param float scale: A factor applied to overlap counts, e.g., to extrapolate sampled overlap
+        :return: An array of scores aligned with cols
+        """
+        overlap = self.overlap()[cols].astype(np.float64) * scale
+        union = n_followers + np.asarray(totals, dtype=np.float64)
+        if method == 'jaccard':
+            union = union - overlap
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scores = np.where(union > 0, overlap / union, 0.0)
+        return scores
+
+    @staticmethod
+    def top_k(cols, scores, k: int):
+        """
+        Selects the k best scores with a partial selection (argpartition) rather than a full sort.  Ties are broken by
+        column, i.e., first-seen order.
+
+        :return: The positions (into cols and scores) of the k best candidates in descending order of score
+        """
+        k = min(k, len(scores))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64)
+        kth_best = -np.partition(-scores, k - 1)[k - 1]
+        contenders = np.flatnonzero(scores >= kth_best)
+        order = np.lexsort((np.asarray(cols)[contenders], -scores[contenders]))
+        return contenders[order][:k]
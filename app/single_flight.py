@@ -0,0 +1,163 @@
+import hashlib
+import logging
+import os
+import pickle
+import sqlite3
+from threading import Event, Lock
+from time import sleep, time
+
+try:
+    import fcntl
+except ImportError:  # Windows; computations are only deduplicated within a process
+    fcntl = None
+
+try:
+    from app import settings
+    SINGLE_FLIGHT_DIR = getattr(settings, 'SINGLE_FLIGHT_DIR', None)
+    SINGLE_FLIGHT_TIMEOUT = getattr(settings, 'SINGLE_FLIGHT_TIMEOUT', 120)
+except ImportError:
+    SINGLE_FLIGHT_DIR = os.environ.get('SINGLE_FLIGHT_DIR')
+    SINGLE_FLIGHT_TIMEOUT = int(os.environ.get('SINGLE_FLIGHT_TIMEOUT', 120))
+
+module_logger = logging.getLogger(__name__+'.py')
+
+
+class _Call:
+    __slots__ = ('done', 'value', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = Event()
+        self.value = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Runs at most one computation per key at a time; callers asking for a key that is already being computed wait for
+    that computation and share its result (or its exception).
+
+    Within a process, callers wait on the computing thread.  When lock_dir is given, processes on the same host (e.g.,
+    gunicorn workers) are coordinated too: the computing process holds an flock on a per-key lock file in lock_dir and
+    publishes its result to an SQLite database there; a process that had to wait for the lock reads that result instead
+    of computing it again.  Results must be picklable.
+    """
+    # Published results are deleted once they are this many seconds old
+    result_ttl = 600
+    poll_interval = 0.05
+
+    def __init__(self, lock_dir=SINGLE_FLIGHT_DIR, timeout=SINGLE_FLIGHT_TIMEOUT):
+        """
+        :param lock_dir: A directory shared by the processes to coordinate; threads only are coordinated if None
+        :param timeout: The number of seconds a caller waits for another computation before giving up (in-process) or
+        computing the result itself (across processes)
+        """
+        self.lock_dir = lock_dir
+        self.timeout = timeout
+        self._calls = {}
+        self._lock = Lock()
+        self.leaders = 0
+        self.coalesced = 0
+        self.coalesced_remote = 0
+        self._db = None
+        self._db_lock = Lock()
+        if lock_dir and fcntl:
+            os.makedirs(lock_dir, exist_ok=True)
+            self._db = sqlite3.connect(os.path.join(lock_dir, 'single_flight.db'), check_same_thread=False,
+                                       isolation_level=None, timeout=30)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, completed_at REAL, value BLOB)')
+
+    def stats(self) -> dict:
+        return {'leaders': self.leaders, 'coalesced': self.coalesced, 'coalesced_remote': self.coalesced_remote,
+                'in_flight': len(self._calls)}
+
+    def do(self, key, func) -> tuple:
+        """
+        :param key: A hashable key with a stable repr() identifying the computation, e.g., SuggestionCache.key()
+        :param func: A callable without arguments computing the result for key
+        :return: A tuple of (result, True if the result was computed by another caller)
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                leader = True
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            if not call.done.wait(self.timeout):
+                raise TimeoutError(f'Timed out waiting for {key}')
+            if call.error is not None:
+                raise call.error
+            return call.value, True
+
+        try:
+            call.value, shared = self.__run(key, func)
+            return call.value, shared
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def __run(self, key, func) -> tuple:
+        if self._db is None:
+            with self._lock:
+                self.leaders += 1
+            return func(), False
+
+        arrived_at = time()
+        key_repr = repr(key)
+        lock_path = os.path.join(self.lock_dir, hashlib.sha1(key_repr.encode()).hexdigest() + '.lock')
+        with open(lock_path, 'a') as lock_file:
+            locked = waited = False
+            while not locked and time() - arrived_at < self.timeout:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    locked = True
+                except BlockingIOError:
+                    waited = True
+                    sleep(self.poll_interval)
+            try:
+                if waited:
+                    # Another process held the lock; use its result if it completed after this call arrived
+                    with self._db_lock:
+                        row = self._db.execute('SELECT value FROM results WHERE key=? AND completed_at>=?',
+                                               (key_repr, arrived_at)).fetchone()
+                    if row is not None:
+                        with self._lock:
+                            self.coalesced_remote += 1
+                        return pickle.loads(row[0]), True
+
+                with self._lock:
+                    self.leaders += 1
+                value = func()
+                now = time()
+                with self._db_lock:
+                    self._db.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?)',
+                                     (key_repr, now, pickle.dumps(value)))
+                    self._db.execute('DELETE FROM results WHERE completed_at<?', (now - self.result_ttl,))
+                return value, False
+            finally:
+                if locked:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+_single_flight = None
+_single_flight_lock = Lock()
+
+
+def get_single_flight() -> SingleFlight:
+    """ Returns the process-wide SingleFlight, creating it on first use. """
+    global _single_flight
+    if _single_flight is None:
+        with _single_flight_lock:
+            if _single_flight is None:
+                _single_flight = SingleFlight()
+    return _single_flight
@@ -0,0 +1,266 @@
+import hashlib
+import heapq
+import logging
+import math
+import os
+import sqlite3
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from time import time
+from app import profiling
+from app.follower_sync import iter_follows_pages
+
+try:
+    from app import settings
+    SKETCH_DB = getattr(settings, 'SKETCH_DB', None)
+    SKETCH_REBUILD_AGE = getattr(settings, 'SKETCH_REBUILD_AGE', 7 * 86400)
+except ImportError:
+    SKETCH_DB = os.environ.get('SKETCH_DB')
+    SKETCH_REBUILD_AGE = int(os.environ.get('SKETCH_REBUILD_AGE', 7 * 86400))
+
+module_logger = logging.getLogger(__name__+'.py')
+
+
+def hash64(uid: str) -> int:
+    """ A stable 64 bit hash of a Twitch uid (Python's hash() is salted per process and cannot be stored). """
+    return int.from_bytes(hashlib.blake2b(uid.encode(), digest_size=8).digest(), 'big')
+
+
+class MinHash:
+    """
+    A bottom-k MinHash sketch: the k smallest 64 bit hashes of a set.  Sketches are updated one element at a time,
+    merge by keeping the k smallest hashes of both, and estimate the Jaccard similarity of two sets from the share of
+    the k smallest hashes of their union that are found in both.  Adding an element twice has no effect.
+    """
+
+    def __init__(self, k=256, hashes=()):
+        self.k = k
+        self._members = set()
+        self._heap = []  # Negated hashes; -self._heap[0] is the largest retained hash
+        for hashed in hashes:
+            self.add_hash(hashed)
+
+    def __len__(self):
+        return len(self._members)
+
+    @property
+    def hashes(self) -> set:
+        return self._members
+
+    def add(self, uid: str):
+        self.add_hash(hash64(uid))
+
+    def add_hash(self, hashed: int):
+        if hashed in self._members:
+            return
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, -hashed)
+            self._members.add(hashed)
+        elif hashed < -self._heap[0]:
+            evicted = -heapq.heapreplace(self._heap, -hashed)
+            self._members.discard(evicted)
+            self._members.add(hashed)
+
+    def merge(self, other: 'MinHash') -> 'MinHash':
+        return MinHash(self.k, heapq.nsmallest(self.k, self._members | other.hashes))
+
+    def jaccard(self, other: 'MinHash') -> float:
+        union = heapq.nsmallest(min(self.k, other.k), self._members | other.hashes)
+        if not union:
+            return 0.0
+        return sum(1 for hashed in union if hashed in self._members and hashed in other.hashes) / len(union)
+
+    def cardinality(self) -> float:
+        if len(self._heap) < self.k:
+            return float(len(self._heap))
+        return (self.k - 1) / ((-self._heap[0] + 1) / 2 ** 64)
+
+    def to_bytes(self) -> bytes:
+        return array('Q', sorted(self._members)).tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes, k=256) -> 'MinHash':
+        hashes = array('Q')
+        hashes.frombytes(data)
+        return cls(k, hashes)
+
+
+class HyperLogLog:
+    """
+    A HyperLogLog cardinality sketch with 2**p one-byte registers (4 KB for the default p=12, ~1.6% standard error).
+    Sketches merge by taking the register-wise maximum, so the size of the union of two sets is the cardinality of
+    their merged sketches.  Adding an element twice has no effect.
+    """
+
+    def __init__(self, p=12, registers=None):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.m)
+
+    def add(self, uid: str):
+        self.add_hash(hash64(uid))
+
+    def add_hash(self, hashed: int):
+        idx = hashed >> (64 - self.p)
+        rest = hashed & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+
+    def merge(self, other: 'HyperLogLog') -> 'HyperLogLog':
+        return HyperLogLog(self.p, bytes(max(pair) for pair in zip(self.registers, other.registers)))
+
+    def cardinality(self) -> float:
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m ** 2 / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.m and zeros:
+            # Small range correction (linear counting)
+            estimate = self.m * math.log(self.m / zeros)
+        return estimate
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'HyperLogLog':
+        return cls(int(math.log2(len(data))), data)
+
+
+class StreamerSketch:
+    """
+    Mergeable MinHash and HyperLogLog sketches of a streamer's followers, plus the newest `followed_at` seen so that the
+    sketch can be updated incrementally from helix (which returns follows newest first).
+    """
+    __slots__ = ('uid', 'minhash', 'hll', 'watermark', 'total', 'built_at', 'updated_at')
+
+    def __init__(self, uid, minhash=None, hll=None, watermark=None, total=0, built_at=None, updated_at=None):
+        self.uid = uid
+        self.minhash = minhash if minhash is not None else MinHash()
+        self.hll = hll if hll is not None else HyperLogLog()
+        self.watermark = watermark
+        self.total = total
+        self.built_at = built_at if built_at is not None else time()
+        self.updated_at = updated_at if updated_at is not None else self.built_at
+
+    def add(self, follower_uid: str):
+        hashed = hash64(follower_uid)
+        self.minhash.add_hash(hashed)
+        self.hll.add_hash(hashed)
+
+    def jaccard(self, other: 'StreamerSketch') -> float:
+        return self.minhash.jaccard(other.minhash)
+
+    def union_size(self, other: 'StreamerSketch') -> float:
+        return self.hll.merge(other.hll).cardinality()
+
+    def intersection_size(self, other: 'StreamerSketch') -> float:
+        return self.jaccard(other) * self.union_size(other)
+
+
+class SketchStore:
+    """ Stores StreamerSketches by uid, in memory or, when db_path is given, in an SQLite database on local disk. """
+
+    def __init__(self, db_path=SKETCH_DB):
+        self.db_path = db_path
+        self._sketches = {}
+        self._lock = Lock()
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('CREATE TABLE IF NOT EXISTS sketches ('
+                             'uid TEXT PRIMARY KEY, minhash BLOB, hll BLOB, watermark TEXT, total INTEGER, '
+                             'built_at REAL, updated_at REAL)')
+
+    def get(self, uid: str):
+        with self._lock:
+            if self._db is None:
+                return self._sketches.get(uid)
+            row = self._db.execute('SELECT minhash, hll, watermark, total, built_at, updated_at FROM sketches '
+                                   'WHERE uid=?', (uid,)).fetchone()
+        if row is None:
+            return None
+        return StreamerSketch(uid, MinHash.from_bytes(row[0]), HyperLogLog.from_bytes(row[1]), *row[2:])
+
+    def put(self, sketch: StreamerSketch):
+        with self._lock:
+            if self._db is None:
+                self._sketches[sketch.uid] = sketch
+                return
+            self._db.execute('INSERT OR REPLACE INTO sketches VALUES (?, ?, ?, ?, ?, ?, ?)',
+                             (sketch.uid, sketch.minhash.to_bytes(), sketch.hll.to_bytes(), sketch.watermark,
+                              sketch.total, sketch.built_at, sketch.updated_at))
+
+
+class SketchScorer:
+    """
+    Scores candidates by the estimated Jaccard similarity of their *whole* followers set with the streamer's, instead of
+    overlap among sampled followers over (n_followers + total followers) which overstates the union.  Sketches are read
+    from a SketchStore and brought up to date incrementally: only follows newer than a sketch's watermark are paged
+    from helix.  Sketches older than rebuild_age are rebuilt from scratch, since unfollows cannot be removed.
+    """
+    req_batch_sz = 100
+
+    def __init__(self, helix, store: SketchStore, refresh_age=3600, rebuild_age=SKETCH_REBUILD_AGE):
+        self.helix = helix
+        self.store = store
+        self.refresh_age = refresh_age
+        self.rebuild_age = rebuild_age
+        self.requests = 0
+        self._requests_lock = Lock()
+
+    def sketch(self, uid: str) -> StreamerSketch:
+        """ :return: An up to date StreamerSketch for uid, built or updated from helix as needed """
+        sketch = self.store.get(uid)
+        now = time()
+        if sketch is not None and now - sketch.built_at >= self.rebuild_age:
+            sketch = None
+        if sketch is not None and now - sketch.updated_at < self.refresh_age:
+            return sketch
+
+        sketch = sketch if sketch is not None else StreamerSketch(uid, built_at=now)
+        self.__update(sketch)
+        sketch.updated_at = now
+        self.store.put(sketch)
+        return sketch
+
+    def score(self, streamer_uid: str, candidate_uids: list, max_workers=None) -> dict:
+        """
+        :param max_workers: The number of sketches built or updated concurrently; sketches are updated serially by
+        default
+        :return: A dictionary of {'candidate_uid': estimated Jaccard similarity with streamer_uid, ...}
+        """
+        streamer = self.sketch(streamer_uid)
+        if max_workers and max_workers > 1:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                sketches = list(executor.map(profiling.propagate(self.sketch), candidate_uids))
+        else:
+            sketches = [self.sketch(uid) for uid in candidate_uids]
+        return {uid: streamer.jaccard(sketch) for uid, sketch in zip(candidate_uids, sketches)}
+
+    def __update(self, sketch: StreamerSketch):
+        newest = None
+        for total, new_follows in iter_follows_pages(self.helix, sketch.uid, sketch.watermark, self.req_batch_sz):
+            with self._requests_lock:
+                self.requests += 1
+            sketch.total = total
+            newest = newest or (new_follows[0]['followed_at'] if new_follows else None)
+            for follow in new_follows:
+                sketch.add(follow['from_id'])
+        sketch.watermark = newest or sketch.watermark
+
+
+_sketch_store = None
+_sketch_store_lock = Lock()
+
+
+def get_sketch_store() -> SketchStore:
+    """ Returns the process-wide SketchStore, creating it on first use. """
+    global _sketch_store
+    if _sketch_store is None:
+        with _sketch_store_lock:
+            if _sketch_store is None:
+                _sketch_store = SketchStore()
+    return _sketch_store
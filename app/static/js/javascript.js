@@ -123,7 +123,7 @@ function renderStreams(data){ //Generates html for displaying search results.
 
     data.map((stream, i) => {
 
-        generatedHTML += result_template.replace("{TIME}", stream.stream_duration).replace("{AVATAR}", stream.profile_image_url).replace("{NAME}", stream.name).replace("{NAME}", stream.name).replace("{TITLE}", stream.stream_title).replace("{VIEWERS}", stream.viewer_count.toLocaleString()).replace("{THUMBNAIL}", stream.thumbnail_url.replace("{width}x{height}", "300x168")).replace("{INDEX}", i + 1);
+        generatedHTML += result_template.replace("{TIME}", stream.stream_duration).replace("{AVATAR}", stream.profile_image_url || "").replace("{NAME}", stream.name).replace("{NAME}", stream.name).replace("{TITLE}", stream.stream_title).replace("{VIEWERS}", stream.viewer_count.toLocaleString()).replace("{THUMBNAIL}", stream.thumbnail_url.replace("{width}x{height}", "300x168")).replace("{INDEX}", i + 1);
 
     })
 
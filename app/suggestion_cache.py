@@ -0,0 +1,142 @@
+import logging
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from time import time
+from app.twitch_client import TwitchClient
+
+try:
+    from app import settings
+    SUGGESTION_CACHE_TTL = getattr(settings, 'SUGGESTION_CACHE_TTL', 3600)
+    SUGGESTION_CACHE_MAX_STALE = getattr(settings, 'SUGGESTION_CACHE_MAX_STALE', 24 * 3600)
+    SUGGESTION_CACHE_SIZE = getattr(settings, 'SUGGESTION_CACHE_SIZE', 1000)
+except ImportError:
+    SUGGESTION_CACHE_TTL = int(os.environ.get('SUGGESTION_CACHE_TTL', 3600))
+    SUGGESTION_CACHE_MAX_STALE = int(os.environ.get('SUGGESTION_CACHE_MAX_STALE', 24 * 3600))
+    SUGGESTION_CACHE_SIZE = int(os.environ.get('SUGGESTION_CACHE_SIZE', 1000))
+
+module_logger = logging.getLogger(__name__+'.py')
+
+
+class SuggestionCache:
+    """
+    Caches the slow, slowly changing part of a suggestions run -- a streamer's followers and their aggregated followings
+    counts -- keyed by (streamer uid, n_followers, n_followings, num_suggestions, adaptive).  The fast changing part (which
+    candidates are live, their totals and profile images) is recomputed on every request from the cached overlap.
+
+    Entries are fresh for `ttl` seconds.  A stale entry (younger than `max_stale` seconds) is still served while a single
+    background refresh recomputes its overlap; older entries are recomputed before responding.
+    """
+
+    def __init__(self, ttl=SUGGESTION_CACHE_TTL, max_stale=SUGGESTION_CACHE_MAX_STALE, max_entries=SUGGESTION_CACHE_SIZE,
+                 refresh_workers=2):
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.max_entries = max_entries
+        self.fresh_hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        self._lock = Lock()
+        self._refresher = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix='suggestion-refresh')
+
+    def stats(self) -> dict:
+        return {'fresh_hits': self.fresh_hits, 'stale_hits': self.stale_hits, 'misses': self.misses,
+                'refreshing': len(self._refreshing), 'entries': len(self._entries)}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    @staticmethod
+    def key(streamer_uid, n_followers=100, n_followings=50, num_suggestions=10, adaptive=False) -> tuple:
+        return streamer_uid, n_followers, n_followings, num_suggestions, adaptive
+
+    def get_similar_streams(self, streamer_uid, n_followers=100, n_followings=50, num_suggestions=10, adaptive=False,
+                            **client_kwargs) -> dict:
+        """
+        A cached equivalent of TwitchClient(streamer_uid, ...).get_similar_streams().  Extra keyword arguments (e.g.,
+        max_workers) are passed to TwitchClient.
+        """
+        key = self.key(streamer_uid, n_followers, n_followings, num_suggestions, adaptive)
+        client = self.get_client(key, **client_kwargs)
+        suggestions = client.get_similar_streams()
+        self.store(key, client)
+        return suggestions
+
+    def get_client(self, key: tuple, **client_kwargs) -> TwitchClient:
+        """
+        :return: A TwitchClient for key, seeded with cached followers and followings counts when available
+        """
+        client = self.__new_client(key, client_kwargs)
+        with self._lock:
+            entry = self._entries.get(key)
+            age = time() - entry['stored_at'] if entry else None
+            if entry is None or age >= self.max_stale:
+                self.misses += 1
+                return client
+
+            self._entries.move_to_end(key)
+            if age < self.ttl:
+                self.fresh_hits += 1
+            else:
+                self.stale_hits += 1
+                if key not in self._refreshing:
+                    self._refreshing.add(key)
+                    self._refresher.submit(self.__refresh, key, client_kwargs)
+
+        client.followers_list = entry['followers_list']
+        client.followings_count = entry['followings_count']
+        client.num_skipped = entry['num_skipped']
+        client.n_followers_used = entry['n_followers_used']
+        client.stop_reason = entry['stop_reason']
+        return client
+
+    def store(self, key: tuple, client: TwitchClient):
+        """ Caches the overlap collected by client, unless it was seeded from an entry that is already cached. """
+        if client.followings_count is None:
+            return
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry['followings_count'] is client.followings_count:
+                return
+            self._entries[key] = {'stored_at': time(), 'followers_list': client.followers_list,
+                                  'followings_count': client.followings_count, 'num_skipped': client.num_skipped,
+                                  'n_followers_used': client.n_followers_used, 'stop_reason': client.stop_reason}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    @staticmethod
+    def __new_client(key, client_kwargs) -> TwitchClient:
+        streamer_uid, n_followers, n_followings, num_suggestions, adaptive = key
+        return TwitchClient(streamer_uid, n_followers, n_followings, num_suggestions, adaptive=adaptive,
+                            **client_kwargs)
+
+    def __refresh(self, key, client_kwargs):
+        try:
+            client = self.__new_client(key, client_kwargs)
+            client.get_followers_followings()
+            self.store(key, client)
+            module_logger.info(f'Refreshed cached suggestions for {key}')
+        except Exception as exc:
+            module_logger.error(f'Failed to refresh cached suggestions for {key}: {exc}')
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+
+_suggestion_cache = None
+_suggestion_cache_lock = Lock()
+
+
+def get_suggestion_cache() -> SuggestionCache:
+    """ Returns the process-wide SuggestionCache, creating it on first use. """
+    global _suggestion_cache
+    if _suggestion_cache is None:
+        with _suggestion_cache_lock:
+            if _suggestion_cache is None:
+                _suggestion_cache = SuggestionCache()
+    return _suggestion_cache
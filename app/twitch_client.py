@@ -1,7 +1,18 @@
 import logging
 import requests
-from app.auth import Auth
-from collections import namedtuple, Counter
+from app import profiling
+from app.follows_cache import get_follows_cache
+from app.helix import get_transport
+from app.live_index import get_live_index
+from app.metrics import PHASE_SECONDS, SKIPPED_FOLLOWERS, SUGGESTIONS_SECONDS
+from app.user_loader import get_user_loader
+from app.ranking import TopKRanker
+from app.similarity import CoFollowMatrix, sparse_engine_available
+from app.sketches import SketchScorer
+from collections import namedtuple, Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from threading import Lock
 from time import perf_counter
 from dateutil.parser import parse as dt_parse
 from datetime import datetime as dt
@@ -11,46 +22,134 @@ module_logger = logging.getLogger(__name__+'.py')
 
 
 def get_userinfo(given_name: str, bear_token=None) -> dict:
-    """ Fetches userinfo (e.g., a uid ) for a given username.
+    """ Fetches userinfo (e.g., a uid ) for a given username.  Lookups go through the process-wide user loader, which
+    batches concurrent lookups and caches users, unless a bear_token is supplied.
     :return: A dictionary containing information about the given username or None if given name was not found.
+    :raises TimeoutError: If helix could not be reached or did not answer in time (callers respond with 503)
     """
-    if not bear_token:
-        bear_token = Auth().bear_token
-
-    base_url = 'https://api.twitch.tv/helix/users'
-    result = None
-    with requests.get(base_url, params={'login': given_name.lower()}, headers=bear_token) as req:
-        if req.ok and req.json()['data']:
-            resp = req.json()['data'][0]
-            result = {'name': resp['display_name'],
-                      'uid': resp['id'],
-                      'profile_img_url': resp['profile_image_url'],
-                      'broadcaster_type': resp['broadcaster_type']
-                      }
+    try:
+        if bear_token is None:
+            resp = get_user_loader().load('login', given_name)
         else:
-            raise ValueError('Supplied User name was not found on Twitch.')
+            user_data = get_transport().get('users', params={'login': given_name.lower()}, headers=bear_token)['data']
+            resp = user_data[0] if user_data else None
+    except requests.HTTPError as exc:
+        if exc.response is None or exc.response.status_code >= 500:
+            raise TimeoutError(f'Twitch is unavailable: {exc}') from exc
+        resp = None  # helix rejected the name
+    except requests.RequestException as exc:
+        raise TimeoutError(f'Twitch is unavailable: {exc}') from exc
+
+    if not resp:
+        raise ValueError('Supplied User name was not found on Twitch.')
+
+    result = {'name': resp['display_name'],
+              'uid': resp['id'],
+              'profile_img_url': resp['profile_image_url'],
+              'broadcaster_type': resp['broadcaster_type']
+              }
     return result
 
 
+def get_users(uid_list: list) -> list:
+    """
+    Fetches helix user records for a list of user ids, 100 ids (the helix maximum) per request.
+
+    :param uid_list: A list of user ids (strings)
+    :return: A list of helix user dictionaries; ids that were not found are left out
+    """
+    req_batch_sz = 100
+    users = []
+    for next_batch in range(0, len(uid_list), req_batch_sz):
+        q_params = {'id': uid_list[next_batch:next_batch+req_batch_sz]}
+        users.extend(get_transport().get('users', params=q_params)['data'])
+    return users
+
+
+def get_all_follows(given_uid: str, to_or_from_id: str) -> list:
+    """
+    Pages through every follow of a user, 100 per request.
+
+    :param given_uid: A user id (string)
+    :param to_or_from_id: 'to_id' for the user's followers or 'from_id' for the streams the user follows
+    :return: A list of helix follow dictionaries, newest first
+    """
+    return [follow for page in iter_all_follows(given_uid, to_or_from_id) for follow in page]
+
+
+def iter_all_follows(given_uid: str, to_or_from_id: str):
+    """
+    Pages through every follow of a user like get_all_follows(), yielding each page (a list of up to 100 helix follow
+    dictionaries) as it arrives so that callers can process large follows lists with bounded memory.
+    """
+    q_params = {to_or_from_id: given_uid, 'first': 100}
+    while True:
+        resp = get_transport().get('users/follows', params=q_params)
+        if resp['data']:
+            yield resp['data']
+        cursor = resp.get('pagination', {}).get('cursor')
+        if not cursor or not resp['data']:
+            return
+        q_params['after'] = cursor
+
+
 class TwitchClient:
     """ This class connects to the Twitch API to collect data for streamers and users. """
 
     Streamer = namedtuple('Streamer', ['uid', 'to_from'], defaults=['to_id'])
     Follower = namedtuple('Follower', ['uid', 'to_from'], defaults=['from_id'])
     MIN_FOLLOWINGS = 2
-
-    def __init__(self, streamer_uid, n_followers=100, n_followings=50, num_suggestions=10):
+    # With sketch scoring, this many times num_suggestions candidates are shortlisted before re-ranking by sketches
+    SKETCH_SHORTLIST = 3
+    # Longer follows lists are streamed without being kept in the follows cache
+    MAX_CACHED_FOLLOWS = 5000
+
+    def __init__(self, streamer_uid, n_followers=100, n_followings=50, num_suggestions=10, max_workers=None,
+                 follows_cache=None, adaptive=False, patience=3, min_followers=30, request_budget=None,
+                 time_budget=None, engine='counter', sketch_store=None, similarity_index=None, live_index=None,
+                 follow_store=None):
         if streamer_uid and isinstance(streamer_uid, str):
-            self.auth = Auth()
-            self.bear_token = self.auth.bear_token
-            self.sess = requests.Session()
+            # All helix calls share one rate-limited, retrying transport per process
+            self.helix = get_transport()
+            # Uses the process-wide follows cache unless a cache is supplied; follows_cache=False disables caching
+            self.follows_cache = get_follows_cache() if follows_cache is None else follows_cache
+            # Live statuses are read from the process-wide live index unless one is supplied; False disables it
+            self.live_index = get_live_index() if live_index is None else live_index
+            # Followings are collected concurrently when max_workers > 1; otherwise followers are processed serially
+            self.max_workers = max_workers
+            # In adaptive mode followings collection stops early once the top candidates stop changing for `patience`
+            # consecutive batches (after at least min_followers), or once the request or time (sec) budget runs out
+            self.adaptive = adaptive
+            self.patience = patience
+            self.min_followers = min_followers
+            self.request_budget = request_budget
+            self.time_budget = time_budget
+            self.stop_reason = None
+            # engine='sparse' counts overlap and scores candidates with a vectorized co-follow matrix (numpy/scipy)
+            if engine == 'sparse' and not sparse_engine_available():
+                module_logger.warning('numpy/scipy are not installed; falling back to the counter engine')
+                engine = 'counter'
+            self.engine = engine
+            self.cofollow = None
+            # With a SketchStore, shortlisted candidates are re-ranked by the Jaccard similarity of whole followers sets
+            self.sketch_store = sketch_store
+            # With a similarity index (e.g., neo4_db.SimilarityIndex), indexed streamers skip the follower crawl and
+            # only live status is checked online
+            self.similarity_index = similarity_index
+            # With a FollowStore, collected followings and follows totals are kept in its compact (interned) columns,
+            # e.g., so that clients sharing the store reuse each other's totals
+            self.follow_store = follow_store
+            self._counts_lock = Lock()
             self.streamer = self.Streamer(streamer_uid, 'to_id')
             self.followers_list = None
             self.followings_count = None
             self.n_followings = n_followings
             self.n_followers = n_followers if n_followers else self.get_total_follows_count(streamer_uid)
             self.num_suggestions = num_suggestions
+            self.n_followers_used = None
             self.num_skipped = 0
+            self.follows_requests = 0
+            self.calls_avoided = 0
         else:
             raise ValueError('Streamer id supplied to TwitchClient() was invalid; probably not found on Twitch')
 
@@ -66,43 +165,117 @@ class TwitchClient:
         :param int n_follows: Collects data for up to n_follows if provided; collects all follows otherwise
         :return: A list of dictionaries containing all follow information collected from Twitch; parsing left to caller.
         """
+        return [follow for page in self.iter_n_follows(given_uid, to_or_from_id, n_follows) for follow in page]
+
+
+    def iter_n_follows(self, given_uid: str, to_or_from_id: str, n_follows=None):
+        """
+        Collects the same follows as get_n_follows(), but yields them one page (a list of up to 100 follow dictionaries)
+        at a time as the pagination cursor advances, so that long follows lists can be processed with bounded memory.
+        A collection is stored in the follows cache once it completes, unless it exceeds MAX_CACHED_FOLLOWS follows.
+        The cache keeps uids only: follows served from it hold just 'from_id' and 'to_id'.
+
+        :return: A generator of lists of follow dictionaries
+        """
         req_batch_sz = 100
-        base_url = 'https://api.twitch.tv/helix/users/follows'
+        other_id = 'from_id' if to_or_from_id == 'to_id' else 'to_id'
+        cached = self.follows_cache.get(given_uid, to_or_from_id) if self.follows_cache else None
+        if cached is not None:
+            total_follows, result = cached
+            if self.follow_store is not None:
+                self.follow_store.set_total(given_uid, to_or_from_id, total_follows)
+            if self.__skip_followings(to_or_from_id, total_follows):
+                self.__count_skipped()
+                return
+            # Serve only if the cached list holds at least as many follows as a fresh collection would
+            n_wanted = total_follows if n_follows is None else min(n_follows, total_follows)
+            if len(result) >= n_wanted:
+                if n_follows is not None:
+                    # Fresh collections are made in whole batches; mirror that so warm and cold runs agree
+                    result = result[:-(-n_follows // req_batch_sz) * req_batch_sz]
+                for next_batch in range(0, len(result), req_batch_sz):
+                    yield [{to_or_from_id: given_uid, other_id: uid}
+                           for uid in result[next_batch:next_batch+req_batch_sz]]
+                return
+
         q_params = {to_or_from_id: given_uid, 'first': req_batch_sz}
-        resp = self.sess.get(base_url, params=q_params, headers=self.bear_token).json()
+        resp = self.helix.get('users/follows', params=q_params)
+        self.__count_requests()
         try:  # Update pagination cursor for next request batch
             q_params['after'] = resp['pagination']['cursor']
         except KeyError:
             pass  # A nonfatal KeyError is thrown for the pagination cursor when user has zero followers
 
-        result = resp['data']
+        page = resp['data']
         total_follows = resp['total']
+        if self.follow_store is not None:
+            self.follow_store.set_total(given_uid, to_or_from_id, total_follows)
 
         # Skips followings collection for 'bot-like' users that follow too many accounts
-        if to_or_from_id == 'from_id' and total_follows > self.n_followings:
+        if self.__skip_followings(to_or_from_id, total_follows):
             # print(f'Skipped {given_uid} -- too many followings detected ({total_follows} total)')
-            self.num_skipped += 1
-            return []
+            self.__count_skipped()
+            if self.follows_cache:
+                self.follows_cache.set(given_uid, to_or_from_id, total_follows, [])
+            return
 
         module_logger.info(f'Collecting {total_follows} follows for "{given_uid}"')
+        reported_total = total_follows
         # Modify number of followers to be collected by given parameter if necessary
         if n_follows is not None:
             if n_follows < total_follows:
                 total_follows = n_follows
 
+        # Only collections small enough to be cached are kept in memory as a whole
+        collected = None
+        if self.follows_cache and total_follows <= self.MAX_CACHED_FOLLOWS:
+            collected = [follow[other_id] for follow in page]
+        yield page
         for next_batch in range(req_batch_sz, total_follows, req_batch_sz):
-            resp = self.sess.get(base_url, params=q_params, headers=self.bear_token).json()
-            # Add next_batch to results
-            result.extend(resp['data'])
+            resp = self.helix.get('users/follows', params=q_params)
+            self.__count_requests()
+            if collected is not None:
+                collected.extend(follow[other_id] for follow in resp['data'])
+            yield resp['data']
             # Update pagination cursor for next batch
             try:
                 q_params['after'] = resp['pagination']['cursor']
             except KeyError:
                 break
 
-        return result
+        if collected is not None:
+            self.follows_cache.set(given_uid, to_or_from_id, reported_total, collected)
+
+
+    def iter_follow_ids(self, given_uid: str, to_or_from_id: str, n_follows=None):
+        """
+        Streams compact follow records: the uid on the other side of each follow collected by iter_n_follows().
+
+        :return: A generator of follower uids (for 'to_id') or followed uids (for 'from_id') as strings
+        """
+        other_id = 'from_id' if to_or_from_id == 'to_id' else 'to_id'
+        for page in self.iter_n_follows(given_uid, to_or_from_id, n_follows):
+            for follow in page:
+                yield follow[other_id]
+
+
+    def __skip_followings(self, to_or_from_id: str, total_follows: int) -> bool:
+        return to_or_from_id == 'from_id' and total_follows > self.n_followings
 
 
+    def __count_skipped(self):
+        with self._counts_lock:
+            self.num_skipped += 1
+        SKIPPED_FOLLOWERS.inc()
+
+
+    def __count_requests(self):
+        with self._counts_lock:
+            self.follows_requests += 1
+
+
+    @PHASE_SECONDS.time(phase='followers')
+    @profiling.span('followers')
     def get_streamer_followers(self) -> list:
         """
         Creates a list of follower id's with size self.n_followers for self.streamer.  If n_followers was not provided
@@ -111,9 +284,8 @@ class TwitchClient:
         :return: A list of follower ids as strings: ['follower_uid1', 'follower_uid2', ...]
         """
         if self.followers_list is None:
-            followers = self.get_n_follows(self.streamer.uid, self.streamer.to_from, self.n_followers)
-            follower_ids = [self.Follower(follower['from_id'], 'from_id') for follower in followers]
-            self.followers_list = follower_ids
+            follower_ids = self.iter_follow_ids(self.streamer.uid, self.streamer.to_from, self.n_followers)
+            self.followers_list = [self.Follower(follower_id, 'from_id') for follower_id in follower_ids]
 
         return self.followers_list
 
@@ -127,38 +299,148 @@ class TwitchClient:
 
         :return: A dictionary of {'other_streamer_uid1': count, 'other_streamer_uid2': count, ...}
         """
+        if self.followings_count is None:
+            for _ in self.iter_followers_followings():
+                pass
+
+        return self.followings_count
 
+
+    def iter_followers_followings(self, batch_size=10):
+        """
+        Collects the same aggregated counts as get_followers_followings() but yields progress while collecting, once
+        for every batch_size followers processed.  self.followings_count is only set once collection has finished.
+
+        In adaptive mode, collection ends early when the provisional ranking has converged or a budget runs out; the
+        reason is kept in self.stop_reason and the number of followers processed in self.n_followers_used.
+
+        :param int batch_size: The number of followers processed between progress updates (and convergence checks)
+        :return: A generator of (number of followers processed, partial followings Counter) tuples
+        """
         start_time = perf_counter()
+        if self.followings_count is not None:
+            yield self.followers_used(), self.followings_count
+            return
+
         # Get streamer's followers if list does not exist
         if self.followers_list is None:
             self.get_streamer_followers()
 
         tot_collected = 0
-        if self.followings_count is None:
-            self.followings_count = Counter()
-            for follower in self.followers_list:
-                followings = self.get_n_follows(follower.uid, follower.to_from, self.n_followings)
-                self.followings_count.update([following['to_id'] for following in followings])
-                tot_collected += len(followings)
 
-        runtime = round(perf_counter() - start_time, 2)
-        module_logger.info(f'Collected {self.n_followings} followings '
-                           f'for {self.n_followers} followers -- {tot_collected} total @ {runtime} sec')
+        followings_count = Counter()
+        cofollow = CoFollowMatrix() if self.engine == 'sparse' else None
+        n_processed = 0
+        last_ranking, n_stable = None, 0
+        self.stop_reason = 'exhausted'
+        for followings, follower in zip(self._map_followers(self._get_follower_followings), self.followers_list):
+            if self.follow_store is not None:
+                self.follow_store.add_follower(follower.uid, followings)
+            if cofollow is not None:
+                cofollow.add_follower(followings)
+            else:
+                followings_count.update(followings)
+            tot_collected += len(followings)
+            n_processed += 1
+            if n_processed % batch_size == 0 and n_processed < len(self.followers_list):
+                if cofollow is not None:
+                    followings_count = cofollow.overlap_counts()
+                if self.adaptive:
+                    ranking = [candidate['uid'] for candidate in self.provisional_ranking(followings_count)]
+                    n_stable = n_stable + 1 if ranking and ranking == last_ranking else 0
+                    last_ranking = ranking
+                    self.stop_reason = self.__adaptive_stop_reason(n_processed, n_stable, start_time)
+                    if self.stop_reason != 'exhausted':
+                        break
+                yield n_processed, followings_count
+
+        if cofollow is not None:
+            followings_count = cofollow.overlap_counts()
+            self.cofollow = cofollow
+        self.followings_count = followings_count
+        self.n_followers_used = n_processed
+        runtime = perf_counter() - start_time
+        PHASE_SECONDS.observe(runtime, phase='followings')
+        runtime = round(runtime, 2)
+        module_logger.info(f'Collected {self.n_followings} followings for {n_processed} of {self.n_followers} '
+                           f'followers -- {tot_collected} total @ {runtime} sec ({self.stop_reason})')
+        yield n_processed, followings_count
+
+
+    def followers_used(self) -> int:
+        """ :return: The number of followers whose followings were collected """
+        if self.n_followers_used is not None:
+            return self.n_followers_used
+        return len(self.followers_list) if self.followers_list is not None else 0
+
+
+    def __adaptive_stop_reason(self, n_processed: int, n_stable: int, start_time: float) -> str:
+        if self.request_budget is not None and self.follows_requests >= self.request_budget:
+            return 'request_budget'
+        if self.time_budget is not None and perf_counter() - start_time >= self.time_budget:
+            return 'time_budget'
+        if n_processed >= self.min_followers and n_stable >= self.patience:
+            return 'converged'
+        return 'exhausted'
+
+
+    def _get_follower_followings(self, follower) -> list:
+        """ :return: The uids followed by follower, as a list of strings """
+        return list(self.iter_follow_ids(follower.uid, follower.to_from, self.n_followings))
+
+
+    def _map_followers(self, func):
+        """
+        Applies func to every follower in self.followers_list, yielding results in the same order as the followers list.
+        Calls are spread over a bounded thread pool when self.max_workers > 1 so that Helix round trips overlap; results
+        are still merged by the caller (in follower order) so counts are identical to the serial path.  Only a small
+        window of calls is in flight at once so that a consumer that stops early does not pay for the rest.
 
-        return self.followings_count
+        :param func: A callable accepting a single Follower
+        :return: A generator of func(follower) results in followers list order
+        """
+        if not self.max_workers or self.max_workers <= 1:
+            for follower in self.followers_list:
+                yield func(follower)
+            return
+
+        func = profiling.propagate(func)
+        followers = iter(self.followers_list)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            in_flight = deque(executor.submit(func, follower) for follower in islice(followers, 2 * self.max_workers))
+            try:
+                while in_flight:
+                    result = in_flight.popleft().result()
+                    for follower in islice(followers, 1):
+                        in_flight.append(executor.submit(func, follower))
+                    yield result
+            finally:
+                for future in in_flight:
+                    future.cancel()
 
 
     def get_total_follows_count(self, twitch_uid: str) -> str:
         """
-        This function fetches the count of all followers as reported by Twitch for the supplied twitch_uid.
+        This function fetches the count of all followers as reported by Twitch for the supplied twitch_uid.  Counts are
+        kept in the follows cache (see FollowsCache.get_total()) and, with a FollowStore, in the store.
 
         :param str twitch_uid: A valid twitch user id.  No validation is performed; assumed valid.
         :return: A count of total followers as a String.
         """
-        base_url = 'https://api.twitch.tv/helix/users/follows'
-        query_params = {'to_id': twitch_uid, 'first': 1}
-
-        return self.sess.get(base_url, params=query_params, headers=self.bear_token).json()['total']
+        if self.follow_store is not None:
+            total = self.follow_store.total(twitch_uid, 'to_id')
+            if total is not None:
+                return total
+
+        total = self.follows_cache.get_total(twitch_uid, 'to_id') if self.follows_cache else None
+        if total is None:
+            query_params = {'to_id': twitch_uid, 'first': 1}
+            total = self.helix.get('users/follows', params=query_params)['total']
+            if self.follows_cache:
+                self.follows_cache.set_total(twitch_uid, 'to_id', total)
+        if self.follow_store is not None:
+            self.follow_store.set_total(twitch_uid, 'to_id', total)
+        return total
 
 
     def get_similar_streams(self) -> dict:
@@ -172,13 +454,51 @@ class TwitchClient:
         :return: A dictionary formatted as {'1': {best candidate details}, '2': {second best candidate details}, ...}
         which provides the final json response for the frontend.
         """
+        final_candidates = {}
+        for event in self.iter_similar_streams():
+            if event['event'] == 'result':
+                final_candidates = event['suggestions']
+
+        return final_candidates
+
+
+    def iter_similar_streams(self, batch_size=10):
+        """
+        Runs the get_similar_streams() pipeline as a generator of progress events so that callers can report results
+        progressively.  Events are dictionaries with an 'event' key:
+
+            {'event': 'phase', 'phase': 'followers' | 'followings' | 'live' | 'totals' | 'images'}
+            {'event': 'progress', 'processed': n, 'total': n_followers, 'provisional': [{'uid': ..., 'overlap': ...}]}
+            {'event': 'result', 'suggestions': {1: {best candidate details}, ...}, 'followers_used': n}
+
+        Provisional rankings are ordered by follower overlap only; they are not yet filtered by live status.  The
+        'result' event is always the last event.
+
+        :param int batch_size: The number of followers processed between provisional rankings
+        :return: A generator of event dictionaries
+        """
         start_time = perf_counter()
         if not self.streamer:
             print('No results fetched; streamer name was invalid or not found on Twitch.')
-            return {}
-
+            yield {'event': 'result', 'suggestions': {}, 'followers_used': self.followers_used()}
+            return
+
+        if self.similarity_index is not None and self.followings_count is None:
+            neighbours = self.similarity_index.neighbours(self.streamer.uid)
+            if neighbours:
+                yield from self.iter_indexed_streams(neighbours)
+                SUGGESTIONS_SECONDS.observe(perf_counter() - start_time, source='indexed')
+                print(f'Round trip time to collect suggestions: {round(perf_counter() - start_time, 3)} sec (indexed)')
+                return
+
+        source = 'cached' if self.followings_count is not None else 'crawl'
         if self.followings_count is None:
-            self.get_followers_followings()
+            yield {'event': 'phase', 'phase': 'followers'}
+            self.get_streamer_followers()
+            yield {'event': 'phase', 'phase': 'followings'}
+            for n_processed, followings_count in self.iter_followers_followings(batch_size):
+                yield {'event': 'progress', 'processed': n_processed, 'total': len(self.followers_list),
+                       'provisional': self.provisional_ranking(followings_count)}
 
         trimmed_candidates = {uid: count for uid, count in self.followings_count.items()
                               if count >= self.MIN_FOLLOWINGS}
@@ -186,70 +506,173 @@ class TwitchClient:
         # Check if any candidates exist before proceeding
         if not trimmed_candidates:
             print('No candidate streams available; returned "{}"')
-            return {}
+            SUGGESTIONS_SECONDS.observe(perf_counter() - start_time, source=source)
+            yield {'event': 'result', 'suggestions': {}, 'followers_used': self.followers_used()}
+            return
 
         # Remove *this* streamer from list of candidates
         trimmed_candidates.pop(self.streamer.uid, None)
+        yield {'event': 'phase', 'phase': 'live'}
         live_candidates = self.get_live_streams(list(trimmed_candidates.keys()))
         trimmed_candidates = {uid: count for uid, count in trimmed_candidates.items() if uid in live_candidates}
 
-        streamer_followers_count = self.n_followers
-        for candidate_id in live_candidates:
-            intersection_total_followers = trimmed_candidates[candidate_id]
-            union_total_followers = streamer_followers_count + self.get_total_follows_count(candidate_id)
-            trimmed_candidates[candidate_id] = intersection_total_followers / union_total_followers
-
-        n_best = self.num_suggestions
-        if n_best > len(trimmed_candidates):
-            n_best = len(trimmed_candidates)
-        # Rank Candidates, retaining only 'n_best' final candidates
-        ranked_candidates = sorted(trimmed_candidates.items(),
-                                   key=lambda similarity: similarity[1], reverse=True)[:n_best]
+        # Rank Candidates, retaining only 'num_suggestions' final candidates
+        yield {'event': 'phase', 'phase': 'totals'}
+        ranked_candidates = self.rank_candidates(trimmed_candidates)
+        yield {'event': 'phase', 'phase': 'images'}
+        final_candidates = self.final_candidates(ranked_candidates, live_candidates)
+
+        SUGGESTIONS_SECONDS.observe(perf_counter() - start_time, source=source)
+        print(f'Round trip time to collect suggestions: {round(perf_counter() - start_time, 3)} sec')
+        print(f'Num Skipped Followers: {self.num_skipped}')
+        print(f'Followers Used: {self.followers_used()} of {self.n_followers} ({self.stop_reason})')
+        print(f'Total follows calls avoided by ranking: {self.calls_avoided} of {len(trimmed_candidates)}')
+
+        yield {'event': 'result', 'suggestions': final_candidates, 'followers_used': self.followers_used()}
+
+
+    @PHASE_SECONDS.time(phase='totals')
+    @profiling.span('totals')
+    def rank_candidates(self, candidates: dict, fetch_total=None) -> list:
+        """
+        Scores live candidates by similarity and ranks them, fetching as few candidate totals as possible.
+
+        :param candidates: A dictionary of {'candidate_uid': overlap count, ...} for live candidates
+        :param fetch_total: A callable returning the total followers count of a candidate uid; by default totals are
+        fetched with get_total_follows_count()
+        :return: A list of up to num_suggestions (candidate_uid, sim_score) tuples in descending order of similarity
+        """
+        scale = 1.0
+        if self.adaptive and self.followers_list and self.followers_used():
+            # Adaptive runs sample fewer followers than were collected; extrapolate overlap to the whole followers list
+            # so that scores stay comparable with a full run
+            scale = len(self.followers_list) / self.followers_used()
+            candidates = {uid: count * scale for uid, count in candidates.items()}
+        n_ranked = self.num_suggestions * self.SKETCH_SHORTLIST if self.sketch_store else self.num_suggestions
+        ranker = TopKRanker(fetch_total or self.get_total_follows_count, n_ranked, self.n_followers, self.max_workers)
+        ranked_candidates = ranker.rank(candidates)
+        self.calls_avoided = ranker.calls_avoided
+        if self.cofollow is not None:
+            # The ranker decides which totals are worth fetching; the co-follow matrix scores them in one pass
+            ranked_candidates = self.rank_vectorized(ranker.totals, scale, n_ranked)
+        if self.sketch_store:
+            ranked_candidates = self.rank_by_sketches([candidate[0] for candidate in ranked_candidates])
+
+        return ranked_candidates
+
+
+    def iter_indexed_streams(self, neighbours: list):
+        """
+        Runs the online part of the pipeline for precomputed neighbours: only live status and profile images are
+        fetched.  Yields the same events as iter_similar_streams(), without followers or followings progress.
+
+        :param neighbours: A list of (candidate_uid, sim_score) tuples in descending order of similarity
+        :return: A generator of event dictionaries
+        """
+        self.stop_reason = 'indexed'
+        yield {'event': 'phase', 'phase': 'live'}
+        live_candidates = self.get_live_streams([uid for uid, _ in neighbours if uid != self.streamer.uid])
+        ranked_candidates = [(uid, score) for uid, score in neighbours if uid in live_candidates]
+        yield {'event': 'phase', 'phase': 'images'}
+        final_candidates = self.final_candidates(ranked_candidates[:self.num_suggestions], live_candidates)
+
+        yield {'event': 'result', 'suggestions': final_candidates, 'followers_used': self.followers_used()}
+
+
+    @PHASE_SECONDS.time(phase='images')
+    @profiling.span('images')
+    def final_candidates(self, ranked_candidates: list, live_candidates: dict) -> dict:
+        """
+        Adds similarity scores and profile images to the live stream details of ranked candidates.
+
+        :param ranked_candidates: A list of (candidate_uid, sim_score) tuples in descending order of similarity
+        :param live_candidates: A dictionary of live stream details as returned by get_live_streams()
+        :return: A dictionary formatted as {'1': {best candidate details}, '2': {second best candidate details}, ...}
+        """
+        if not ranked_candidates:
+            return {}
         ranked_prof_img_urls = self.get_prof_img_url([candidate[0] for candidate in ranked_candidates])
 
         final_candidates = {}
-        for rank, candidate in enumerate(ranked_candidates[:n_best]):
+        for rank, candidate in enumerate(ranked_candidates):
             uid, sim_score = candidate
             live_candidates[uid]['sim_score'] = sim_score
-            live_candidates[uid]['profile_image_url'] = ranked_prof_img_urls[uid]
+            if uid in ranked_prof_img_urls:  # left out when profiles could not be looked up
+                live_candidates[uid]['profile_image_url'] = ranked_prof_img_urls[uid]
             final_candidates[rank+1] = live_candidates[uid]
 
-        print(f'Round trip time to collect suggestions: {round(perf_counter() - start_time, 3)} sec')
-        print(f'Num Skipped Followers: {self.num_skipped}')
-
         return final_candidates
 
 
+    def rank_vectorized(self, totals: dict, scale=1.0, n_ranked=None) -> list:
+        """
+        Scores and ranks candidates with the co-follow matrix built during followings collection (engine='sparse').
+
+        :param totals: A dictionary of {'candidate_uid': total followers count, ...} for the candidates to be ranked
+        :param float scale: A factor applied to overlap counts, e.g., to extrapolate adaptively sampled overlap
+        :param int n_ranked: The number of candidates to be ranked; num_suggestions by default
+        :return: A list of up to n_ranked (candidate_uid, sim_score) tuples in descending order of similarity
+        """
+        uids = list(totals)
+        cols = self.cofollow.columns(uids)
+        scores = self.cofollow.scores(cols, self.n_followers, [totals[uid] for uid in uids], scale=scale)
+        best = self.cofollow.top_k(cols, scores, n_ranked or self.num_suggestions)
+
+        return [(uids[pos], float(scores[pos])) for pos in best]
+
+
+    def rank_by_sketches(self, candidate_uids: list) -> list:
+        """
+        Re-ranks candidates by the estimated Jaccard similarity between the streamer's and each candidate's whole
+        followers set, using MinHash sketches from self.sketch_store (built or updated from helix as needed).
+
+        :param candidate_uids: A list of (shortlisted) candidate uids
+        :return: A list of up to num_suggestions (candidate_uid, sim_score) tuples in descending order of similarity
+        """
+        scorer = SketchScorer(self.helix, self.sketch_store)
+        scores = scorer.score(self.streamer.uid, candidate_uids, self.max_workers)
+        module_logger.info(f'Scored {len(candidate_uids)} candidates by sketches '
+                           f'with {scorer.requests} follows requests')
+
+        return sorted(scores.items(), key=lambda similarity: similarity[1], reverse=True)[:self.num_suggestions]
+
+
+    def provisional_ranking(self, followings_count: Counter) -> list:
+        """
+        Ranks candidates by follower overlap alone, e.g., while followings are still being collected.
+
+        :param followings_count: A (partial) Counter of followings as built by get_followers_followings()
+        :return: A list of up to num_suggestions dictionaries as [{'uid': candidate uid, 'overlap': count}, ...]
+        """
+        provisional = []
+        for uid, count in followings_count.most_common(self.num_suggestions + 1):
+            if uid != self.streamer.uid and count >= self.MIN_FOLLOWINGS:
+                provisional.append({'uid': uid, 'overlap': count})
+
+        return provisional[:self.num_suggestions]
+
+
     def get_prof_img_url(self, streamer_uid_list: list) -> dict:
         """
         This function collects profile image urls for a given list of (candidate) user ids (strings).
 
+        Users are looked up through the process-wide user loader, so cached profiles need no request and lookups from
+        concurrent requests are batched together.
+
         :param streamer_uid_list: A list of candidate uids for collecting respective profile image urls.
         :return: A dictionary as {'candidate1_uid': 'profile url', 'candidate2_uid': ...}
         """
-        max_batch_sz = 100
-        req_batch_sz = len(streamer_uid_list) if len(streamer_uid_list) < max_batch_sz else max_batch_sz
-        base_url = 'https://api.twitch.tv/helix/users'
-        q_params = {'id': streamer_uid_list[:req_batch_sz], 'first': req_batch_sz}
-
-        # Fetch live streams for first req_batch_sz candidate streams
-        resp = self.sess.get(base_url, params=q_params, headers=self.bear_token).json()
         try:
-            user_data = resp['data']
-        except KeyError:
+            users = get_user_loader().load_many('id', streamer_uid_list)
+        except (KeyError, requests.RequestException, TimeoutError):
             print(f'Unable to collect profile images.  No data for {streamer_uid_list}')
             return {}
 
-        if len(streamer_uid_list) > req_batch_sz:
-            # Collect all remaining live streams
-            for next_batch in range(req_batch_sz, len(streamer_uid_list), req_batch_sz):
-                q_params = {'id': streamer_uid_list[next_batch:next_batch+req_batch_sz], 'first': req_batch_sz}
-                resp = self.sess.get(base_url, params=q_params, headers=self.bear_token).json()
-                user_data.extend(resp['data'])
-
-        return {user['id']: user['profile_image_url'] for user in user_data}
+        return {uid: user['profile_image_url'] for uid, user in users.items() if user}
 
 
+    @PHASE_SECONDS.time(phase='live')
+    @profiling.span('live')
     def get_live_streams(self, streamer_uid_list: list) -> dict:
         """
         This function takes a streamer_uid_list and returns a dictionary of user id's that are currently broadcasting on
@@ -257,28 +680,28 @@ class TwitchClient:
         function also provides details for live streams (such as number of viewers and a recent thumbnail of a live
         broadcast).
 
+        Statuses already in the live index are read from it; helix is only queried for uids it does not know.
+
         :param streamer_uid_list: A list of candidate streams as user ids (strings).
         :return: A nested dictionary of live streams information as {'stream_uid1: {details...}, 'stream_uid': ...}
         """
-        req_batch_sz = 100  # CANNOT be larger than 100
-        base_url = 'https://api.twitch.tv/helix/streams'
-        q_params = {'user_id': streamer_uid_list[:req_batch_sz], 'first': req_batch_sz}
+        live_list, unknown_uids = [], streamer_uid_list
+        if self.live_index:
+            indexed, unknown_uids = self.live_index.lookup(streamer_uid_list)
+            live_list = list(indexed.values())
 
-        # Fetch live streams for first req_batch_sz candidate streams
-        resp = self.sess.get(base_url, params=q_params, headers=self.bear_token).json()
+        req_batch_sz = 100  # CANNOT be larger than 100
         try:
-            live_list = resp['data']
-        except KeyError:
+            for next_batch in range(0, len(unknown_uids), req_batch_sz):
+                batch = unknown_uids[next_batch:next_batch+req_batch_sz]
+                streams = self.helix.get('streams', params={'user_id': batch, 'first': req_batch_sz})['data']
+                if self.live_index:
+                    self.live_index.update(batch, streams)
+                live_list.extend(streams)
+        except (KeyError, requests.HTTPError):
             print(f'Unable to collect live stream info.  No data for {streamer_uid_list}')
             return {}
 
-        # Collect all remaining live streams
-        if len(streamer_uid_list) > req_batch_sz:
-            for next_batch in range(req_batch_sz, len(streamer_uid_list), req_batch_sz):
-                q_params = {'user_id': streamer_uid_list[next_batch:next_batch+req_batch_sz], 'first': req_batch_sz}
-                resp = self.sess.get(base_url, params=q_params, headers=self.bear_token).json()
-                live_list.extend(resp['data'])
-
         def duration(twitch_time):
             diff = (dt.now(utc) - dt_parse(twitch_time)).total_seconds()
             return f'{int(diff//3600)}hr {int((diff%3600)//60)}min'
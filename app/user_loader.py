@@ -0,0 +1,183 @@
+import logging
+import os
+import re
+import requests
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from threading import Lock, Timer
+from time import time
+from app.helix import get_transport
+
+try:
+    from app import settings
+    USER_CACHE_TTL = getattr(settings, 'USER_CACHE_TTL', 3600)
+    USER_CACHE_SIZE = getattr(settings, 'USER_CACHE_SIZE', 50000)
+    USER_BATCH_WINDOW = getattr(settings, 'USER_BATCH_WINDOW', 0.01)
+except ImportError:
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 3600))
+    USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 50000))
+    USER_BATCH_WINDOW = float(os.environ.get('USER_BATCH_WINDOW', 0.01))
+
+module_logger = logging.getLogger(__name__+'.py')
+
+# Twitch logins are 1 to 25 letters, digits and underscores; helix rejects a whole users request over a malformed one
+LOGIN_PATTERN = re.compile(r'^[A-Za-z0-9_]{1,25}$')
+
+
+def is_valid_login(login: str) -> bool:
+    return isinstance(login, str) and LOGIN_PATTERN.fullmatch(login) is not None
+
+
+class UserLoader:
+    """
+    Coalesces helix users lookups from every thread in a process.  Lookups by id or by login that miss the TTL cache
+    are queued for `window` seconds, then sent together as users requests of up to 100 ids and logins each; results
+    are fanned back out to every waiting caller.  Concurrent lookups of the same user share a single pending result.
+    User records (profile_image_url, broadcaster_type, ...) are cached under both their id and their login.
+
+    Malformed logins are never sent (they are reported as not found).  When helix rejects a batch (a 4xx other than 401
+    or 429), its halves are retried separately, so that one bad key fails only its own callers.
+    """
+    max_batch = 100  # ids and logins per users request; helix allows at most 100
+
+    def __init__(self, helix=None, window=USER_BATCH_WINDOW, ttl=USER_CACHE_TTL, max_entries=USER_CACHE_SIZE,
+                 timeout=30):
+        """
+        :param helix: A HelixTransport; the process-wide transport by default
+        :param window: The number of seconds lookups are gathered before they are sent
+        :param timeout: The number of seconds a caller waits for its batch before giving up
+        """
+        self._helix = helix
+        self.window = window
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._cache = OrderedDict()  # (key_type, key) -> (user record, stored_at)
+        self._pending = OrderedDict()  # (key_type, key) -> Future, in arrival order
+        self._lock = Lock()
+        self._timer = None
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.requests = 0
+
+    @property
+    def helix(self):
+        return self._helix or get_transport()
+
+    def load(self, key_type: str, key: str):
+        """
+        :param key_type: 'id' or 'login'
+        :param key: A user id or login
+        :return: The helix user record for key, or None if no such user exists
+        """
+        key = key.lower() if key_type == 'login' else key
+        return self.load_many(key_type, [key])[key]
+
+    def load_many(self, key_type: str, keys: list) -> dict:
+        """
+        :param key_type: 'id' or 'login'
+        :param keys: A list of user ids or logins
+        :return: A dictionary of {key: helix user record or None if no such user exists, ...}
+        :raises TimeoutError: If helix did not answer within timeout seconds
+        """
+        if key_type == 'login':
+            keys = [key.lower() for key in keys]
+        results, futures = {}, {}
+        now = time()
+        with self._lock:
+            for key in keys:
+                if key_type == 'login' and not is_valid_login(key):
+                    results[key] = None
+                    continue
+                entry = self._cache.get((key_type, key))
+                if entry is not None and now - entry[1] < self.ttl:
+                    self._cache.move_to_end((key_type, key))
+                    results[key] = entry[0]
+                    self.hits += 1
+                    continue
+                self.misses += 1
+                future = self._pending.get((key_type, key))
+                if future is None:
+                    future = self._pending[(key_type, key)] = Future()
+                else:
+                    self.coalesced += 1
+                futures[key] = future
+            if self._pending and self._timer is None:
+                self._timer = Timer(self.window, self.__flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+        for key, future in futures.items():
+            try:
+                results[key] = future.result(self.timeout)
+            except FutureTimeoutError:
+                raise TimeoutError(f'Timed out waiting for user {key}') from None
+        return results
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else 0.0,
+                'coalesced': self.coalesced, 'requests': self.requests, 'entries': len(self._cache)}
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def __flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, OrderedDict()
+            self._timer = None
+        batch = list(pending.items())
+        for next_batch in range(0, len(batch), self.max_batch):
+            self.__send(batch[next_batch:next_batch + self.max_batch])
+
+    def __send(self, batch: list):
+        q_params = {'id': [key for (key_type, key), _ in batch if key_type == 'id'],
+                    'login': [key for (key_type, key), _ in batch if key_type == 'login']}
+        with self._lock:
+            self.requests += 1
+        try:
+            users = self.helix.get('users', params={name: keys for name, keys in q_params.items() if keys})['data']
+        except Exception as exc:
+            if len(batch) > 1 and self.__is_rejected(exc):
+                middle = len(batch) // 2
+                self.__send(batch[:middle])
+                self.__send(batch[middle:])
+                return
+            for _, future in batch:
+                future.set_exception(exc)
+            return
+
+        found = {}
+        now = time()
+        with self._lock:
+            for user in users:
+                for key in (('id', user['id']), ('login', user['login'].lower())):
+                    found[key] = user
+                    self._cache[key] = (user, now)
+                    self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        for key, future in batch:
+            future.set_result(found.get(key))
+
+    @staticmethod
+    def __is_rejected(exc) -> bool:
+        """ :return: True if helix rejected the request itself, i.e., if some key in it may be malformed """
+        status = exc.response.status_code if isinstance(exc, requests.HTTPError) and exc.response is not None else None
+        return status is not None and 400 <= status < 500 and status not in (401, 429)
+
+
+_user_loader = None
+_user_loader_lock = Lock()
+
+
+def get_user_loader() -> UserLoader:
+    """ Returns the process-wide UserLoader, creating it on first use. """
+    global _user_loader
+    if _user_loader is None:
+        with _user_loader_lock:
+            if _user_loader is None:
+                _user_loader = UserLoader()
+    return _user_loader
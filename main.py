@@ -1,4 +1,6 @@
 from app.twitch_client import TwitchClient, get_userinfo
+from app.profiling import Profile
+import argparse
 import logging
 from time import perf_counter
 import json
@@ -84,5 +86,16 @@ def logging_setup():
 
 
 if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--profile', action='store_true',
+                            help='record helix calls and stack samples; saved as speedscope and Chrome trace json')
+    args = arg_parser.parse_args()
+
     logging_setup()
-    main()
+    if args.profile:
+        with Profile('main.py') as profile:
+            main()
+        for file_format, path in profile.save().items():
+            print(f'Profile ({file_format}): {path}')
+    else:
+        main()
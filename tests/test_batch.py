@@ -0,0 +1,93 @@
+import unittest
+from collections import Counter
+from unittest import mock
+from app import app
+from app.batch import BatchClient
+from app.jobs import JobQueue, JobStore
+from app.twitch_client import TwitchClient
+
+# Streamers '1' to '3' share most of their followers; follower uids are '1000' and up
+FOLLOWERS = {'1': [str(1000 + uid) for uid in range(0, 30)],
+             '2': [str(1000 + uid) for uid in range(10, 40)],
+             '3': [str(1000 + uid) for uid in range(20, 50)]}
+FOLLOWINGS = {str(1000 + uid): [str(100 + (uid * step) % 11) for step in range(1, 2 + uid % 4)] for uid in range(50)}
+LIVE = {str(uid) for uid in range(100, 111) if uid % 3}
+followings_calls = Counter()
+
+
+def fake_iter_n_follows(self, given_uid, to_or_from_id, n_follows=None):
+    if to_or_from_id == 'to_id':
+        yield [{'from_id': uid} for uid in FOLLOWERS[given_uid]][:n_follows]
+        return
+    followings_calls[given_uid] += 1
+    yield [{'to_id': uid} for uid in FOLLOWINGS[given_uid]]
+
+
+def fake_get_live_streams(self, streamer_uid_list):
+    return {uid: {'name': f'streamer{uid}'} for uid in streamer_uid_list if uid in LIVE}
+
+
+@mock.patch.object(TwitchClient, 'iter_n_follows', fake_iter_n_follows)
+@mock.patch.object(TwitchClient, 'get_live_streams', fake_get_live_streams)
+@mock.patch.object(TwitchClient, 'get_total_follows_count', lambda self, uid: 10 * int(uid))
+@mock.patch.object(TwitchClient, 'get_prof_img_url', lambda self, uids: {uid: f'{uid}.png' for uid in uids})
+class TestBatchClient(unittest.TestCase):
+    def setUp(self):
+        followings_calls.clear()
+
+    def test_matches_separate_runs(self):
+        separate = {uid: TwitchClient(uid, n_followers=100, live_index=False).get_similar_streams()
+                    for uid in FOLLOWERS}
+        followings_calls.clear()
+        batch = BatchClient(list(FOLLOWERS), n_followers=100, max_workers=4, live_index=False)
+        self.assertEqual(batch.get_similar_streams(), separate)
+        # Every follower's followings are fetched once, although most follow several of the streamers
+        self.assertEqual(set(followings_calls.values()), {1})
+        self.assertEqual(batch.stats()['unique_followers'], 50)
+        self.assertEqual(batch.stats()['followers'], 90)
+        self.assertGreater(batch.totals_shared, 0)
+
+    def test_checkpoint_stops_the_crawl(self):
+        checkpoints = []
+
+        def checkpoint():
+            checkpoints.append(1)
+            if len(checkpoints) > 10:
+                raise TimeoutError('deadline passed')
+
+        batch = BatchClient(list(FOLLOWERS), n_followers=100, max_workers=2, live_index=False, checkpoint=checkpoint)
+        with self.assertRaises(TimeoutError):
+            batch.get_similar_streams()
+        # Only a small window of followings requests past the stopping point was sent, out of 50 followers
+        self.assertLess(sum(followings_calls.values()), 20)
+
+    def test_duplicate_streamers(self):
+        batch = BatchClient(['1', '1'], n_followers=100, live_index=False)
+        self.assertEqual(list(batch.get_similar_streams()), ['1'])
+
+    def test_route_reports_unknown_names(self):
+        users = {'one': {'id': '1'}, 'two': {'id': '2'}, 'nobody': None}
+        queue = JobQueue(workers=1, store=JobStore(None))
+        with mock.patch('app.get_user_loader') as get_user_loader, mock.patch('app.get_job_queue', return_value=queue):
+            get_user_loader.return_value.load_many.return_value = users
+            resp = app.test_client().post('/users/suggestions', json={'usernames': ['one', 'Two', 'nobody']})
+        self.assertEqual(resp.status_code, 202)
+        queue._queue.join()
+        job = queue.store.get(resp.get_json()['id'])
+        self.assertEqual(job['status'], 'done')
+        self.assertEqual(job['result']['nobody'], {})
+        self.assertTrue(job['result']['one'] and job['result']['Two'])
+        self.assertEqual(app.test_client().post('/users/suggestions', json={'names': 'one'}).status_code, 400)
+
+    def test_route_rejects_malformed_names_and_reports_timeouts(self):
+        with mock.patch('app.get_user_loader') as get_user_loader:
+            resp = app.test_client().post('/users/suggestions', json={'usernames': ['one', 'not a login']})
+            self.assertEqual(resp.status_code, 400)
+            get_user_loader.return_value.load_many.assert_not_called()
+            get_user_loader.return_value.load_many.side_effect = TimeoutError
+            resp = app.test_client().post('/users/suggestions', json={'usernames': ['one']})
+        self.assertEqual(resp.status_code, 503)
+        self.assertIn('Retry-After', resp.headers)
+
+if __name__ == '__main__':
+    unittest.main()
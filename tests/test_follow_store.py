@@ -0,0 +1,48 @@
+import random
+import unittest
+from collections import Counter
+from app.follow_store import FollowStore
+from app.similarity import CoFollowMatrix, sparse_engine_available
+
+
+class TestFollowStore(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(5)
+        self.followings = {str(1000 + uid): rng.sample([str(uid) for uid in range(30)], rng.randint(0, 8))
+                           for uid in range(100)}
+        self.store = FollowStore()
+        for follower_uid, followed in self.followings.items():
+            self.store.add_follower(follower_uid, followed)
+
+    def test_followings_round_trip(self):
+        self.assertEqual(len(self.store), sum(len(followed) for followed in self.followings.values()))
+        self.assertEqual(self.store.follower_uids(), list(self.followings))
+        self.assertEqual(self.store.followings('1042'), self.followings['1042'])
+        self.assertIsNone(self.store.followings('42'))
+        self.assertFalse(self.store.add_follower('1042', ['1', '2']))
+        self.assertEqual(self.store.followings('1042'), self.followings['1042'])
+
+    def test_overlap_matches_counter(self):
+        followers = ['1050', '1003', '1077', '9999', '1003']
+        followings_count = Counter()
+        for follower_uid in followers:
+            followings_count.update(self.followings.get(follower_uid, []))
+        self.assertEqual(list(self.store.overlap_counts(followers).items()), list(followings_count.items()))
+        self.assertEqual(sum(self.store.overlap_counts().values()), len(self.store))
+
+    def test_totals(self):
+        self.assertIsNone(self.store.total('7', 'to_id'))
+        self.store.set_total('7', 'to_id', 120)
+        self.store.set_total('7', 'from_id', 3)
+        self.assertEqual((self.store.total('7', 'to_id'), self.store.total('7', 'from_id')), (120, 3))
+        self.assertEqual(self.store.meta('7').followers, 120)
+
+    @unittest.skipUnless(sparse_engine_available(), 'numpy and scipy are required for the sparse engine')
+    def test_cofollow_matrix_from_store(self):
+        cofollow = CoFollowMatrix.from_store(self.store)
+        self.assertEqual(cofollow.overlap_counts(), self.store.overlap_counts())
+        self.assertEqual(cofollow.n_followers, self.store.n_followers)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+from app import app
+from app.follower_sync import FollowerStore, FollowerSync
+
+
+class FakeHelix:
+    """ Serves users/follows?to_id pages, newest first, from {streamer_uid: [(follower_uid, followed_at), ...]} """
+    def __init__(self, follows):
+        self.follows = follows
+        self.requests = 0
+
+    def get(self, endpoint, params, headers=None, timeout=None):
+        self.requests += 1
+        follows = self.follows[params['to_id']]
+        start = int(params.get('after', 0))
+        end = start + params['first']
+        data = [{'from_id': uid, 'to_id': params['to_id'], 'followed_at': at} for uid, at in follows[start:end]]
+        return {'total': len(follows), 'data': data, 'pagination': {'cursor': str(end)} if end < len(follows) else {}}
+
+
+def followed_at(day: int) -> str:
+    return (datetime(2018, 1, 1) + timedelta(days=day)).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class TestFollowerSync(unittest.TestCase):
+    def setUp(self):
+        self.helix = FakeHelix({'1': [(str(uid), followed_at(1000 - uid)) for uid in range(1000)]})
+        self.store = FollowerStore(db_path=None)
+
+    def test_incremental_sync_pages_only_new_follows(self):
+        follower_sync = FollowerSync(self.helix, self.store)
+        self.assertEqual(follower_sync.sync('1')['requests'], 10)
+
+        self.helix.follows['1'][:0] = [('new1', followed_at(1100)), ('new2', followed_at(1100))]
+        stats = follower_sync.sync('1')
+        self.assertEqual((stats['mode'], stats['requests'], stats['added']), ('incremental', 1, 2))
+        self.assertEqual((stats['stored'], stats['total']), (1002, 1002))
+        self.assertEqual(self.store.state('1')['watermark'], followed_at(1100))
+
+    def test_reconciliation_removes_unfollows(self):
+        removed = mock.MagicMock()
+        follower_sync = FollowerSync(self.helix, self.store, reconcile_age=3600, on_removed=removed)
+        follower_sync.sync('1')
+        del self.helix.follows['1'][500]
+
+        self.assertEqual(follower_sync.sync('1')['stored'], 1000)
+        with mock.patch('app.follower_sync.time', return_value=self.store.state('1')['reconciled_at'] + 3600):
+            stats = follower_sync.sync('1')
+        self.assertEqual((stats['mode'], stats['removed'], stats['stored']), ('full', 1, 999))
+        removed.assert_called_once_with('1', ['500'])
+
+    def test_store_survives_restart(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = os.path.join(tmp_dir, 'followers.db')
+            FollowerSync(self.helix, FollowerStore(db_path)).sync('1')
+            store = FollowerStore(db_path)
+            self.assertEqual(store.count('1'), 1000)
+            self.assertEqual(FollowerSync(self.helix, store).sync('1')['mode'], 'incremental')
+
+    def test_cli_requires_a_store_on_disk(self):
+        result = app.test_cli_runner().invoke(args=['sync-followers', 'streamer'])
+        self.assertEqual(result.exit_code, 2)
+        self.assertIn('FOLLOWER_DB', result.output)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+from unittest import mock
+from app.follow_store import FollowStore
+from app.twitch_client import TwitchClient
+
+
+# A tiny synthetic follow graph: follower uid -> list of followed uids
+FOLLOWINGS = {str(uid): [str(100 + (uid * step) % 7) for step in range(1, 1 + uid % 5)] for uid in range(40)}
+# Followers with more followings than n_followings are skipped as 'bot-like'
+FOLLOWINGS['39'] = [str(200 + i) for i in range(60)]
+
+
+def fake_iter_n_follows(self, given_uid, to_or_from_id, n_follows=None):
+    if to_or_from_id == 'to_id':
+        yield [{'from_id': uid} for uid in FOLLOWINGS][:n_follows]
+        return
+
+    followings = FOLLOWINGS[given_uid]
+    if len(followings) > self.n_followings:
+        with self._counts_lock:
+            self.num_skipped += 1
+        return
+    yield [{'to_id': uid} for uid in followings]
+
+
+@mock.patch.object(TwitchClient, 'iter_n_follows', fake_iter_n_follows)
+class TestFollowersFollowings(unittest.TestCase):
+    def test_parallel_matches_serial(self):
+        serial = TwitchClient('1', n_followers=40, n_followings=50)
+        parallel = TwitchClient('1', n_followers=40, n_followings=50, max_workers=8)
+
+        serial_count = serial.get_followers_followings()
+        parallel_count = parallel.get_followers_followings()
+
+        self.assertEqual(serial_count, parallel_count)
+        self.assertEqual(list(serial_count.items()), list(parallel_count.items()))
+        self.assertEqual(serial.num_skipped, 1)
+        self.assertEqual(serial.num_skipped, parallel.num_skipped)
+
+    @mock.patch.dict(FOLLOWINGS, {str(uid): ['100', '101', '102'][:1 + uid % 3] for uid in range(40)})
+    def test_adaptive_stops_once_ranking_is_stable(self):
+        client = TwitchClient('1', n_followers=40, n_followings=50, adaptive=True, patience=1, min_followers=20)
+        client.get_followers_followings()
+        self.assertEqual(client.stop_reason, 'converged')
+        self.assertEqual(client.followers_used(), 20)
+        self.assertEqual(client.followings_count, {'100': 20, '101': 13, '102': 6})
+
+    def test_adaptive_request_budget(self):
+        client = TwitchClient('1', n_followers=40, n_followings=50, adaptive=True, request_budget=0)
+        client.get_followers_followings()
+        self.assertEqual(client.stop_reason, 'request_budget')
+        self.assertEqual(client.followers_used(), 10)
+
+    def test_follow_store_keeps_followings(self):
+        store = FollowStore()
+        client = TwitchClient('1', n_followers=40, n_followings=50, max_workers=8, follow_store=store)
+        followings_count = client.get_followers_followings()
+        self.assertEqual(list(store.overlap_counts().items()), list(followings_count.items()))
+        self.assertEqual(store.followings('7'), FOLLOWINGS['7'])
+        self.assertEqual(store.followings('39'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+from app.follows_cache import FollowsCache
+
+
+class TestFollowsCache(unittest.TestCase):
+    def test_miss_then_hit(self):
+        cache = FollowsCache(ttl=60, max_entries=10)
+        self.assertIsNone(cache.get('1', 'from_id'))
+        cache.set('1', 'from_id', 2, ['a', 'b'])
+        self.assertEqual(cache.get('1', 'from_id'), (2, ['a', 'b']))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_lru_eviction(self):
+        cache = FollowsCache(ttl=60, max_entries=2)
+        cache.set('1', 'from_id', 0, [])
+        cache.set('2', 'from_id', 0, [])
+        cache.get('1', 'from_id')
+        cache.set('3', 'from_id', 0, [])
+        self.assertIsNone(cache.get('2', 'from_id'))
+        self.assertIsNotNone(cache.get('1', 'from_id'))
+
+    def test_size_bound(self):
+        cache = FollowsCache(ttl=60, max_entries=10, max_bytes=3 * (FollowsCache.entry_bytes + 100 * 70))
+        for uid in range(4):
+            cache.set(str(uid), 'to_id', 100, [str(follower) for follower in range(100)])
+        self.assertIsNone(cache.get('0', 'to_id'))
+        self.assertIsNotNone(cache.get('3', 'to_id'))
+        self.assertEqual(cache.stats()['bytes'], 3 * (FollowsCache.entry_bytes + 100 * FollowsCache.uid_bytes))
+
+    def test_totals(self):
+        cache = FollowsCache(ttl=60, max_entries=10, total_ttl=30)
+        self.assertIsNone(cache.get_total('1', 'to_id'))
+        with mock.patch('app.follows_cache.time', return_value=1000):
+            cache.set_total('1', 'to_id', 42)
+            cache.set('2', 'to_id', 7, ['a'])
+        with mock.patch('app.follows_cache.time', return_value=1020):
+            self.assertEqual((cache.get_total('1', 'to_id'), cache.get_total('2', 'to_id')), (42, 7))
+        with mock.patch('app.follows_cache.time', return_value=1031):
+            self.assertIsNone(cache.get_total('1', 'to_id'))
+        self.assertEqual((cache.total_hits, cache.total_misses), (2, 2))
+
+    def test_ttl_expiry(self):
+        cache = FollowsCache(ttl=60, max_entries=10)
+        with mock.patch('app.follows_cache.time', return_value=1000):
+            cache.set('1', 'to_id', 0, [])
+        with mock.patch('app.follows_cache.time', return_value=1061):
+            self.assertIsNone(cache.get('1', 'to_id'))
+
+    def test_sqlite_tier_survives_restart(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = os.path.join(tmp_dir, 'follows.db')
+            FollowsCache(ttl=60, max_entries=10, db_path=db_path).set('1', 'from_id', 1, ['a'])
+            cache = FollowsCache(ttl=60, max_entries=10, db_path=db_path)
+            self.assertEqual(cache.get('1', 'from_id'), (1, ['a']))
+            self.assertEqual(cache.disk_hits, 1)
+            cache.get('1', 'from_id')
+            self.assertEqual(cache.memory_hits, 1)
+            FollowsCache(ttl=60, max_entries=10, db_path=db_path).set_total('5', 'to_id', 9)
+            self.assertEqual(FollowsCache(ttl=60, max_entries=10, db_path=db_path).get_total('5', 'to_id'), 9)
+
+
+if __name__ == '__main__':
+    unittest.main()
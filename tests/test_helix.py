@@ -0,0 +1,63 @@
+import json
+import requests
+import unittest
+from unittest import mock
+from time import time
+from app.helix import HelixTransport, TokenBucket
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None, headers=None):
+        self.status_code = status_code
+        self.body = body if body is not None else {}
+        self.headers = headers or {}
+        self.content = json.dumps(self.body).encode()
+
+    def json(self):
+        return self.body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f'{self.status_code} Error', response=self)
+
+
+def make_transport(responses):
+    provider = mock.MagicMock()
+    provider.bear_token = {'Authorization': 'Bearer abc', 'Client-ID': 'cid'}
+    transport = HelixTransport(base_url='http://helix.test', token_provider=provider, backoff=0.001)
+    transport.sess.get = mock.MagicMock(side_effect=responses)
+    return transport, provider
+
+
+class TestHelixTransport(unittest.TestCase):
+    def test_retries_429_and_5xx(self):
+        transport, _ = make_transport([
+            FakeResponse(429, headers={'Ratelimit-Remaining': '0', 'Ratelimit-Reset': str(time())}),
+            FakeResponse(503),
+            FakeResponse(200, {'data': [1]}),
+        ])
+        self.assertEqual(transport.get('streams'), {'data': [1]})
+        self.assertEqual(transport.sess.get.call_count, 3)
+
+    def test_gives_up_after_max_retries(self):
+        transport, _ = make_transport([FakeResponse(500)] * 10)
+        transport.max_retries = 2
+        with self.assertRaises(requests.HTTPError):
+            transport.get('streams')
+        self.assertEqual(transport.sess.get.call_count, 3)
+
+    def test_401_refreshes_token_once(self):
+        transport, provider = make_transport([FakeResponse(401), FakeResponse(200, {'data': []})])
+        self.assertEqual(transport.get('users'), {'data': []})
+        provider.invalidate.assert_called_once_with('abc')
+
+    def test_bucket_syncs_with_headers(self):
+        bucket = TokenBucket(capacity=800, period=60)
+        bucket.sync(limit='800', remaining='5', reset=str(time() + 30))
+        self.assertLessEqual(bucket.tokens, 5.1)
+        bucket.sync(remaining='0', reset=str(time() + 30))
+        self.assertGreater(bucket.blocked_until, time())
+
+
+if __name__ == '__main__':
+    unittest.main()
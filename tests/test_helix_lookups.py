@@ -0,0 +1,94 @@
+import requests
+import unittest
+from unittest import mock
+from app import twitch_client
+from app.follows_cache import FollowsCache
+
+
+def follows_pages(total, page_size=100):
+    """ :return: helix users/follows responses for a streamer with total followers """
+    uids = [str(uid) for uid in range(total)]
+    return [{'data': [{'from_id': uid} for uid in uids[start:start + page_size]], 'total': total,
+             'pagination': {'cursor': str(start)} if start + page_size < total else {}}
+            for start in range(0, total, page_size)]
+
+
+class TestHelixLookups(unittest.TestCase):
+    @mock.patch('app.twitch_client.get_transport')
+    def test_get_users_batches_ids(self, get_transport):
+        get_transport.return_value.get.side_effect = lambda endpoint, params: {
+            'data': [{'id': uid} for uid in params['id'] if uid != '7']}
+        users = twitch_client.get_users([str(uid) for uid in range(250)])
+        self.assertEqual(get_transport.return_value.get.call_count, 3)
+        self.assertEqual(len(users), 249)
+
+    @mock.patch('app.twitch_client.get_transport')
+    def test_get_all_follows_pages_until_cursor_ends(self, get_transport):
+        pages = [{'data': [{'to_id': '1'}], 'pagination': {'cursor': 'a'}},
+                 {'data': [{'to_id': '2'}], 'pagination': {'cursor': 'b'}},
+                 {'data': [{'to_id': '3'}], 'pagination': {}}]
+        get_transport.return_value.get.side_effect = pages
+        follows = twitch_client.get_all_follows('9', 'from_id')
+        self.assertEqual([follow['to_id'] for follow in follows], ['1', '2', '3'])
+        last_params = get_transport.return_value.get.call_args[1]['params']
+        self.assertEqual((last_params['from_id'], last_params['after']), ('9', 'b'))
+
+    @mock.patch('app.twitch_client.get_transport')
+    def test_iter_all_follows_yields_pages(self, get_transport):
+        get_transport.return_value.get.side_effect = follows_pages(250)
+        pages = twitch_client.iter_all_follows('9', 'to_id')
+        self.assertEqual(len(next(pages)), 100)
+        self.assertEqual(get_transport.return_value.get.call_count, 1)
+        self.assertEqual([len(page) for page in pages], [100, 50])
+
+
+class TestIterNFollows(unittest.TestCase):
+    @mock.patch('app.twitch_client.get_transport')
+    def test_pages_are_cached_once_complete(self, get_transport):
+        get_transport.return_value.get.side_effect = follows_pages(250)
+        cache = FollowsCache(ttl=60, max_entries=10)
+        client = twitch_client.TwitchClient('9', follows_cache=cache)
+        pages = client.iter_n_follows('9', 'to_id')
+        next(pages)
+        self.assertIsNone(cache.get('9', 'to_id'))
+        self.assertEqual([len(page) for page in pages], [100, 50])
+        self.assertEqual(len(cache.get('9', 'to_id')[1]), 250)
+
+        cached_ids = list(client.iter_follow_ids('9', 'to_id', n_follows=150))
+        self.assertEqual(cached_ids, [str(uid) for uid in range(200)])
+        self.assertEqual(get_transport.return_value.get.call_count, 3)
+
+    @mock.patch('app.twitch_client.get_transport')
+    @mock.patch.object(twitch_client.TwitchClient, 'MAX_CACHED_FOLLOWS', 200)
+    def test_long_follows_lists_are_not_cached(self, get_transport):
+        get_transport.return_value.get.side_effect = follows_pages(250)
+        cache = FollowsCache(ttl=60, max_entries=10)
+        client = twitch_client.TwitchClient('9', follows_cache=cache)
+        self.assertEqual(len(client.get_n_follows('9', 'to_id')), 250)
+        self.assertIsNone(cache.get('9', 'to_id'))
+
+
+class TestUserLookupErrors(unittest.TestCase):
+    @mock.patch('app.twitch_client.get_user_loader')
+    def test_get_userinfo_maps_unreachable_helix_to_timeouts(self, get_user_loader):
+        load = get_user_loader.return_value.load
+        load.side_effect = requests.ConnectionError('connection refused')
+        with self.assertRaises(TimeoutError):
+            twitch_client.get_userinfo('streamer')
+        load.side_effect = requests.HTTPError('503 Server Error', response=mock.Mock(status_code=503))
+        with self.assertRaises(TimeoutError):
+            twitch_client.get_userinfo('streamer')
+        load.side_effect = requests.HTTPError('400 Client Error', response=mock.Mock(status_code=400))
+        with self.assertRaises(ValueError):
+            twitch_client.get_userinfo('streamer')
+
+    @mock.patch('app.twitch_client.get_user_loader')
+    def test_final_candidates_without_profile_images(self, get_user_loader):
+        get_user_loader.return_value.load_many.side_effect = TimeoutError
+        client = twitch_client.TwitchClient('1', live_index=False)
+        final = client.final_candidates([('2', 0.5)], {'2': {'name': 'two'}})
+        self.assertEqual(final, {1: {'name': 'two', 'sim_score': 0.5}})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import unittest
+from queue import Full
+from threading import Event
+from time import sleep
+from unittest import mock
+from app import app
+from app.jobs import JobQueue, JobStore
+
+
+def wait_for(store, job_id, statuses=('done', 'failed', 'timeout'), timeout=5):
+    for _ in range(int(timeout / 0.01)):
+        job = store.get(job_id)
+        if job['status'] in statuses:
+            return job
+        sleep(0.01)
+    raise AssertionError(f'Job {job_id} did not finish')
+
+
+class TestJobQueue(unittest.TestCase):
+    def test_lower_priorities_run_first(self):
+        queue, order, release = JobQueue(workers=1), [], Event()
+        blocker = queue.submit(lambda job: release.wait(5))
+        jobs = [queue.submit(lambda job, name=name: order.append(name), priority=priority)
+                for name, priority in (('low', 20), ('high', 1), ('default', 10), ('default2', 10))]
+        release.set()
+        for job in [blocker] + jobs:
+            wait_for(queue.store, job.id)
+        self.assertEqual(order, ['high', 'default', 'default2', 'low'])
+
+    def test_full_queue_rejects_jobs(self):
+        queue, release = JobQueue(workers=1, max_queued=2), Event()
+        queue.submit(lambda job: release.wait(5))
+        sleep(0.05)  # let the worker take the first job
+        queue.submit(lambda job: None)
+        queue.submit(lambda job: None)
+        with self.assertRaises(Full):
+            queue.submit(lambda job: None)
+        release.set()
+        self.assertEqual((queue.submitted, queue.rejected), (3, 1))
+
+    def test_equal_keys_share_a_job(self):
+        queue, release = JobQueue(workers=1), Event()
+        first = queue.submit(lambda job: release.wait(5) and 'result', key=('1', 10))
+        self.assertIs(queue.submit(lambda job: 'other', key=('1', 10)), first)
+        release.set()
+        self.assertEqual(wait_for(queue.store, first.id)['result'], 'result')
+        self.assertIsNot(queue.submit(lambda job: None, key=('1', 10)), first)
+
+    def test_jobs_time_out_cooperatively(self):
+        queue = JobQueue(workers=1)
+
+        def slow(job):
+            for step in range(100):
+                job.report({'step': step})
+                sleep(0.01)
+
+        job = wait_for(queue.store, queue.submit(slow, timeout=0.1).id)
+        self.assertEqual(job['status'], 'timeout')
+        self.assertLess(job['progress']['step'], 99)
+        self.assertEqual(queue.timed_out, 1)
+
+    def test_failures_are_recorded(self):
+        queue = JobQueue(workers=1)
+
+        def fail(job):
+            raise ValueError('not found')
+
+        job = wait_for(queue.store, queue.submit(fail).id)
+        self.assertEqual((job['status'], job['error']), ('failed', 'not found'))
+        self.assertNotIn('result', job)
+
+
+class TestJobRoutes(unittest.TestCase):
+    def setUp(self):
+        self.queue = JobQueue(workers=0, max_queued=1, store=JobStore())
+        patcher = mock.patch('app.controllers.jobs.get_job_queue', return_value=self.queue)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = app.test_client()
+
+    @mock.patch('app.controllers.jobs.get_userinfo', return_value={'uid': '1', 'name': 'streamer'})
+    def test_submit_and_poll(self, _):
+        resp = self.client.post('/jobs/suggestions/streamer?priority=50')
+        self.assertEqual(resp.status_code, 202)
+        self.assertEqual(resp.get_json()['status'], 'queued')
+        status = self.client.get(resp.get_json()['status_url'])
+        self.assertEqual(status.get_json()['priority'], 50)
+
+        resp = self.client.post('/jobs/suggestions/other')  # same key: the queued job is returned
+        self.assertEqual(resp.status_code, 202)
+        resp = self.client.post('/jobs/suggestions/other?adaptive=1')
+        self.assertEqual(resp.status_code, 503)
+        self.assertIn('Retry-After', resp.headers)
+
+    @mock.patch('app.controllers.jobs.get_userinfo', side_effect=ValueError)
+    def test_unknown_user(self, _):
+        self.assertEqual(self.client.post('/jobs/suggestions/nobody').status_code, 404)
+
+    @mock.patch('app.controllers.jobs.get_userinfo', return_value={'uid': '1', 'name': 'streamer'})
+    def test_rejects_non_positive_timeouts(self, _):
+        for timeout in ('0', '-5', 'nan', '-inf'):
+            self.assertEqual(self.client.post(f'/jobs/suggestions/streamer?timeout={timeout}').status_code, 400)
+        self.assertEqual(self.queue.submitted, 0)
+
+    @mock.patch('app.controllers.jobs.get_userinfo', return_value={'uid': '1', 'name': 'streamer'})
+    def test_priorities_are_clamped(self, _):
+        resp = self.client.post('/jobs/suggestions/streamer?priority=-999999')
+        self.assertEqual(self.client.get(resp.get_json()['status_url']).get_json()['priority'], 10)
+
+    def test_unknown_job(self):
+        self.assertEqual(self.client.get('/jobs/0123').status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import json
+import unittest
+from datetime import datetime
+from unittest import mock
+from pytz import utc
+from app import app
+from app.controllers import eventsub
+from app.live_index import LiveIndex, LivePoller
+from app.twitch_client import TwitchClient
+
+
+def stream(uid):
+    return {'user_id': uid, 'user_name': f'streamer{uid}', 'title': '', 'thumbnail_url': '', 'viewer_count': 1,
+            'started_at': '2020-01-01T00:00:00Z', 'language': 'en'}
+
+
+def fake_streams(endpoint, params):
+    return {'data': [stream(uid) for uid in params['user_id'] if int(uid) % 2 == 0]}
+
+
+class TestLiveIndex(unittest.TestCase):
+    def test_lookup_reports_unknown_and_stale_uids(self):
+        index = LiveIndex(max_age=60)
+        with mock.patch('app.live_index.time', return_value=1000):
+            index.update(['1', '2'], [stream('2')])
+            index.invalidate('3')
+        with mock.patch('app.live_index.time', return_value=1030):
+            self.assertEqual(index.lookup(['1', '2', '3', '4']), ({'2': stream('2')}, ['3', '4']))
+        with mock.patch('app.live_index.time', return_value=1060):
+            self.assertEqual(index.lookup(['1', '2']), ({}, ['1', '2']))
+
+    def test_get_live_streams_only_queries_unknown_uids(self):
+        client = TwitchClient('1', live_index=LiveIndex())
+        with mock.patch.object(client.helix, 'get', side_effect=fake_streams) as get:
+            first = client.get_live_streams([str(uid) for uid in range(150)])
+            second = client.get_live_streams([str(uid) for uid in range(160)])
+        self.assertEqual(get.call_count, 3)
+        self.assertEqual(get.call_args[1]['params']['user_id'], [str(uid) for uid in range(150, 160)])
+        self.assertEqual(len(first), 75)
+        self.assertEqual(set(second), {str(uid) for uid in range(0, 160, 2)})
+
+    def test_expired_statuses_and_inactive_uids_are_pruned(self):
+        index = LiveIndex(max_age=60)
+        with mock.patch('app.live_index.time', return_value=1000):
+            index.lookup(['1'])
+            index.update(['1', '2'], [])
+        with mock.patch('app.live_index.time', return_value=1030):
+            index.lookup(['2'])
+            index.update(['2'], [])
+        self.assertEqual((index.stats()['uids'], index.stats()['looked_up']), (2, 2))
+        with mock.patch('app.live_index.time', return_value=1070):
+            index.set_offline('3')
+            self.assertEqual(index.active_uids(), ['2'])
+        self.assertEqual((index.stats()['uids'], index.stats()['looked_up']), (2, 1))
+
+    def test_poller_refreshes_looked_up_uids_in_batches(self):
+        index = LiveIndex()
+        index.lookup([str(uid) for uid in range(250)])
+        index.update([str(uid) for uid in range(300)], [])
+        helix = mock.MagicMock()
+        helix.get.side_effect = fake_streams
+        self.assertEqual(LivePoller(helix, index, interval=60).poll(), 3)
+        self.assertEqual(len(index.lookup([str(uid) for uid in range(250)])[0]), 125)
+        self.assertEqual(sorted(uid for call in helix.get.call_args_list for uid in call[1]['params']['user_id']),
+                         sorted(str(uid) for uid in range(250)))
+
+
+@mock.patch.object(eventsub, 'EVENTSUB_SECRET', 's3cret')
+class TestEventSubCallback(unittest.TestCase):
+    def setUp(self):
+        self.client = app.test_client()
+        self.index = LiveIndex()
+        patcher = mock.patch.object(eventsub, 'get_live_index', return_value=self.index)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, message_type, message, message_id='id-1', secret='s3cret', time_format='%Y-%m-%dT%H:%M:%S.%fZ'):
+        body = json.dumps(message).encode()
+        timestamp = datetime.now(utc).strftime(time_format)
+        headers = {'Twitch-Eventsub-Message-Id': message_id, 'Twitch-Eventsub-Message-Timestamp': timestamp,
+                   'Twitch-Eventsub-Message-Type': message_type,
+                   'Twitch-Eventsub-Message-Signature': eventsub.signature(secret, message_id, timestamp, body)}
+        return self.client.post('/eventsub/callback', data=body, headers=headers, content_type='application/json')
+
+    def test_verification_challenge(self):
+        resp = self.post('webhook_callback_verification', {'challenge': 'abc', 'subscription': {}})
+        self.assertEqual((resp.status_code, resp.get_data(as_text=True)), (200, 'abc'))
+
+    def test_offline_and_online_notifications(self):
+        self.index.update(['7'], [stream('7')])
+        offline = {'subscription': {'type': 'stream.offline'}, 'event': {'broadcaster_user_id': '7'}}
+        self.assertEqual(self.post('notification', offline, 'id-1').status_code, 204)
+        self.assertEqual(self.index.lookup(['7']), ({}, []))
+
+        online = {'subscription': {'type': 'stream.online'}, 'event': {'broadcaster_user_id': '7'}}
+        self.post('notification', online, 'id-2')
+        self.assertEqual(self.index.lookup(['7']), ({}, ['7']))
+
+        # A retried delivery of the offline message is ignored
+        self.post('notification', offline, 'id-1')
+        self.assertEqual(self.index.lookup(['7']), ({}, ['7']))
+
+    def test_rejects_bad_signature(self):
+        resp = self.post('notification', {'subscription': {'type': 'stream.offline'}}, secret='wrong')
+        self.assertEqual(resp.status_code, 403)
+
+    def test_rejects_timestamp_without_timezone(self):
+        resp = self.post('notification', {'subscription': {'type': 'stream.offline'}}, time_format='%Y-%m-%dT%H:%M:%S')
+        self.assertEqual((resp.status_code, resp.get_data(as_text=True)), (400, 'Invalid timestamp'))
+
+
+if __name__ == '__main__':
+    unittest.main()
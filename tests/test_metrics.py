@@ -0,0 +1,78 @@
+import unittest
+from unittest import mock
+from app import app
+from app.helix import HelixTransport
+from app.metrics import HELIX_BYTES, HELIX_REQUESTS, HELIX_RETRIES, PHASE_SECONDS, Registry
+
+
+class TestRegistry(unittest.TestCase):
+    def test_counter_and_labels(self):
+        registry = Registry()
+        requests = registry.counter('requests_total', 'Requests', ['endpoint'])
+        requests.inc(endpoint='users')
+        requests.inc(2, endpoint='say "hi"\n')
+        self.assertEqual(registry.render(), '# HELP requests_total Requests\n# TYPE requests_total counter\n'
+                                            'requests_total{endpoint="say \\"hi\\"\\n"} 2.0\n'
+                                            'requests_total{endpoint="users"} 1.0\n')
+        with self.assertRaises(ValueError):
+            requests.inc(status='200')
+
+    def test_histogram_buckets_are_cumulative(self):
+        registry = Registry()
+        latency = registry.histogram('latency_seconds', 'Latency', buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.7, 3.0):
+            latency.observe(value)
+        lines = registry.render().splitlines()[2:]
+        self.assertEqual(lines, ['latency_seconds_bucket{le="0.1"} 1.0', 'latency_seconds_bucket{le="1.0"} 3.0',
+                                 'latency_seconds_bucket{le="+Inf"} 4.0', 'latency_seconds_sum 4.25',
+                                 'latency_seconds_count 4.0'])
+
+    def test_collectors_export_numeric_stats(self):
+        registry = Registry()
+        registry.register_collector('cache', 'Cache statistics', lambda: {'hits': 3, 'hit_rate': 0.75, 'key': 'x'})
+        registry.register_collector('broken', 'Fails', lambda: 1 / 0)
+        rendered = registry.render()
+        self.assertIn('cache_hits 3.0\n', rendered)
+        self.assertIn('cache_hit_rate 0.75\n', rendered)
+        self.assertNotIn('cache_key', rendered)
+        self.assertNotIn('broken', rendered)
+
+
+def fake_response(status_code, content=b'{}'):
+    return mock.MagicMock(status_code=status_code, headers={}, content=content)
+
+
+class TestInstrumentation(unittest.TestCase):
+    def test_helix_requests_are_counted(self):
+        transport = HelixTransport(base_url='http://helix.test', token_provider=mock.MagicMock(), backoff=0.001)
+        transport.sess.get = mock.MagicMock(side_effect=[fake_response(503), fake_response(200, b'{"data": [1, 2]}')])
+        before = (HELIX_REQUESTS.value(endpoint='metrics/test', status='503') or 0,
+                  HELIX_RETRIES.value(endpoint='metrics/test', reason='503') or 0,
+                  HELIX_BYTES.value(endpoint='metrics/test') or 0)
+        transport.get('metrics/test')
+        after = (HELIX_REQUESTS.value(endpoint='metrics/test', status='503'),
+                 HELIX_RETRIES.value(endpoint='metrics/test', reason='503'),
+                 HELIX_BYTES.value(endpoint='metrics/test'))
+        self.assertEqual((after[0] - before[0], after[1] - before[1]), (1, 1))
+        self.assertEqual(after[2] - before[2], len(b'{}') + len(b'{"data": [1, 2]}'))
+
+    def test_phases_are_timed(self):
+        count = (PHASE_SECONDS.value(phase='live') or ([0], 0))[0][-1]
+        with mock.patch('app.twitch_client.get_live_index', return_value=False):
+            from app.twitch_client import TwitchClient
+            TwitchClient('1', n_followers=10).get_live_streams([])
+        self.assertEqual(PHASE_SECONDS.value(phase='live')[0][-1], count + 1)
+
+    def test_metrics_route(self):
+        client = app.test_client()
+        client.get('/index')
+        resp = client.get('/metrics')
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.content_type.startswith('text/plain; version=0.0.4'))
+        body = resp.get_data(as_text=True)
+        self.assertIn('raidrite_http_request_seconds_count{route="/index",method="GET",status="200"}', body)
+        self.assertIn('raidrite_follows_cache_hit_rate', body)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import os
+import unittest
+from unittest import mock
+from app.models import neo4_db
+from app.models.neo4_db import GraphPool, SimilarityIndex
+
+
+class GraphTestCase(unittest.TestCase):
+    """ Runs neo4_db functions against a GraphPool whose py2neo Graph (and its transactions) are mocks """
+    def setUp(self):
+        patcher = mock.patch('app.models.neo4_db.Graph')
+        self.graph_class = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pool = GraphPool(max_connections=2)
+        patcher = mock.patch('app.models.neo4_db.get_pool', return_value=self.pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.graph = self.graph_class.return_value
+        self.tx = self.graph.begin.return_value
+
+    def batches(self) -> list:
+        return [call.kwargs['rows'] for call in self.tx.run.call_args_list]
+
+
+class TestRunInBatches(GraphTestCase):
+    def test_one_transaction_per_batch(self):
+        rows = ({'idx': idx} for idx in range(12))
+        stats = neo4_db.run_in_batches('UNWIND $rows AS row', rows, batch_size=5)
+        self.assertEqual([len(batch) for batch in self.batches()], [5, 5, 2])
+        self.assertEqual([row['idx'] for batch in self.batches() for row in batch], list(range(12)))
+        self.assertEqual((self.graph.begin.call_count, self.tx.commit.call_count), (3, 3))
+        self.tx.rollback.assert_not_called()
+        self.assertEqual((stats['rows'], stats['batches']), (12, 3))
+
+    def test_exact_multiple_and_empty_input(self):
+        neo4_db.run_in_batches('UNWIND $rows AS row', [{'idx': idx} for idx in range(10)], batch_size=5)
+        self.assertEqual([len(batch) for batch in self.batches()], [5, 5])
+        self.assertEqual(neo4_db.run_in_batches('UNWIND $rows AS row', [], batch_size=5)['batches'], 0)
+        self.assertEqual(self.graph.begin.call_count, 2)
+
+    def test_failing_batch_is_rolled_back(self):
+        self.tx.run.side_effect = [None, RuntimeError('constraint violated'), None]
+        with self.assertRaises(RuntimeError):
+            neo4_db.run_in_batches('UNWIND $rows AS row', [{'idx': idx} for idx in range(15)], batch_size=5)
+        # The first batch stays committed, the failing one is rolled back and later ones are not sent
+        self.assertEqual((self.tx.commit.call_count, self.tx.rollback.call_count, self.tx.run.call_count), (1, 1, 2))
+        # The connection slot of the failing batch was released
+        self.assertEqual(self.pool._slots._value, self.pool.max_connections)
+
+    def test_merge_and_delete_follows_rows(self):
+        follows = [{'from_id': '1', 'from_name': 'one', 'to_id': '9', 'to_name': 'nine', 'followed_at': '2020'}]
+        neo4_db.merge_follows(follows)
+        neo4_db.delete_follows('9', ['1', '2'])
+        queries = [call.args[0] for call in self.tx.run.call_args_list]
+        self.assertEqual(queries, [neo4_db.MERGE_FOLLOWS, neo4_db.DELETE_FOLLOWS])
+        self.assertEqual(self.batches(), [[{'from_id': '1', 'from_name': 'one', 'to_id': '9', 'followed_at': '2020'}],
+                                          [{'from_id': '1', 'to_id': '9'}, {'from_id': '2', 'to_id': '9'}]])
+
+
+class TestAddMissingStreamers(GraphTestCase):
+    def test_only_missing_streamers_are_looked_up(self):
+        self.graph.run.return_value = [('1',)]
+        users = [{'id': uid, 'login': f'user{uid}', 'display_name': f'User{uid}', 'profile_image_url': f'{uid}.png',
+                  'broadcaster_type': ''} for uid in ('2', '3')]
+        with mock.patch('app.twitch_client.get_users', return_value=users) as get_users:
+            self.assertEqual(neo4_db.add_missing_streamers(['1', '2', '3'], batch_size=2), 2)
+        get_users.assert_called_once_with(['2', '3'])
+        self.assertEqual([call.kwargs['uids'] for call in self.graph.run.call_args_list], [['1', '2'], ['3']])
+        self.assertEqual(self.tx.run.call_args.args[0], neo4_db.MERGE_STREAMERS)
+        self.assertEqual([row['twitch_uid'] for row in self.batches()[0]], ['2', '3'])
+
+    def test_existing_users_are_labelled_streamers(self):
+        self.assertIn('SET user:Streamer', neo4_db.MATCH_EXISTING)
+        self.graph.run.return_value = [('1',)]
+        with mock.patch('app.twitch_client.get_users') as get_users:
+            self.assertEqual(neo4_db.add_missing_streamers(['1']), 0)
+        get_users.assert_not_called()
+        self.tx.run.assert_not_called()
+
+
+class TestSimilarityIndex(GraphTestCase):
+    def test_neighbours(self):
+        self.graph.run.return_value = [{'uid': '2', 'score': 0.5}, {'uid': '3', 'score': 0.25}]
+        with mock.patch('app.models.neo4_db.time', return_value=1000.0):
+            self.assertEqual(SimilarityIndex(k=2, max_age=100).neighbours('1'), [('2', 0.5), ('3', 0.25)])
+        self.graph.run.assert_called_once_with(neo4_db.MATCH_SIMILAR_TO, uid='1', k=2, computed_after=900.0)
+        SimilarityIndex().neighbours('1')
+        self.assertEqual(self.graph.run.call_args.kwargs['computed_after'], 0)
+
+    def test_build_does_not_use_pattern_expressions(self):
+        self.assertNotIn('size((', neo4_db.BUILD_SIMILAR_TO)
+
+
+class TestGraphPool(unittest.TestCase):
+    @mock.patch('app.models.neo4_db.Graph')
+    def test_graph_is_created_on_first_use(self, graph_class):
+        pool = GraphPool(max_connections=3, host='neo4j')
+        graph_class.assert_not_called()
+        for _ in range(2):
+            with pool.connection() as graph:
+                self.assertIs(graph, graph_class.return_value)
+        graph_class.assert_called_once_with(max_size=3, host='neo4j')
+        self.assertEqual(pool.stats()['acquired'], 2)
+
+    def test_settings_are_accepted_by_py2neo(self):
+        # The real Graph and its ServiceProfile are built; only the connector, which would open a socket, is mocked
+        pool = GraphPool(max_connections=3, host='neo4j.local', port=7688, user='neo4j', password='secret')
+        with mock.patch('py2neo.client.Connector') as connector:
+            self.assertIsNotNone(pool.graph)
+        profile = connector.call_args.args[0]
+        self.assertEqual(connector.call_args.kwargs['max_size'], 3)
+        self.assertEqual((profile.host, profile.port, profile.user), ('neo4j.local', 7688, 'neo4j'))
+
+    @mock.patch('app.models.neo4_db.Graph')
+    def test_wait_stats(self, _):
+        pool = GraphPool(max_connections=1)
+        with mock.patch('app.models.neo4_db.perf_counter', side_effect=[0.0, 0.25, 1.0, 1.5]):
+            for _ in range(2):
+                with pool.connection():
+                    pass
+        self.assertEqual(pool.stats(), {'acquired': 2, 'wait_time': 0.75, 'max_wait': 0.5, 'mean_wait': 0.375})
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'requires os.fork')
+    def test_pool_is_reset_after_fork(self):
+        with mock.patch.object(neo4_db, '_pool', GraphPool()), mock.patch.object(neo4_db, '_pool_pid', os.getpid()):
+            pid = os.fork()
+            if pid == 0:  # child: the pool inherited from the parent must not be used
+                os._exit(0 if neo4_db._pool is None and neo4_db._pool_pid is None else 1)
+            _, status = os.waitpid(pid, 0)
+            self.assertEqual(os.WEXITSTATUS(status), 0)
+            self.assertIsNotNone(neo4_db._pool)
+
+
+if __name__ == '__main__':
+    unittest.main()
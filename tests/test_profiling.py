@@ -0,0 +1,97 @@
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter, sleep
+from unittest import mock
+from app import app, profiling
+from app.controllers import profiles
+from app.profiling import Profile
+
+
+def busy(profile, n_samples=2, timeout=5):
+    """ Spins until the profile's sampler has taken n_samples more samples (i.e., of this frame), or for timeout """
+    n_wanted, end = len(profile.samples) + n_samples, perf_counter() + timeout
+    while len(profile.samples) < n_wanted and perf_counter() < end:
+        pass
+
+
+class TestProfile(unittest.TestCase):
+    def test_spans_nest_across_threads(self):
+        with Profile('test', sample_interval=0) as profile:
+            with profiling.span('phase', n=2):
+                def work(uid):
+                    profiling.record('helix users', perf_counter(), uid=uid)
+                    return uid
+
+                with ThreadPoolExecutor(max_workers=2) as executor:
+                    self.assertEqual(list(executor.map(profiling.propagate(work), ['1', '2'])), ['1', '2'])
+        self.assertIsNone(profiling.current())
+        profiling.record('outside', perf_counter())
+
+        tree = profile.span_tree()
+        self.assertEqual([(span['name'], span['args']) for span in tree], [('phase', {'n': 2})])
+        self.assertEqual(sorted(child['args']['uid'] for child in tree[0]['children']), ['1', '2'])
+
+    def test_speedscope_events_and_samples(self):
+        with Profile('test', sample_interval=0.001) as profile:
+            with profiling.span('outer'):
+                with profiling.span('inner'):
+                    busy(profile)
+                with profiling.span('inner'):
+                    pass
+        document = profile.speedscope()
+        sampled, evented = document['profiles']
+        self.assertEqual(len(sampled['samples']), len(sampled['weights']))
+        frames = document['shared']['frames']
+        self.assertIn('busy', {frames[stack[-1]]['name'] for stack in sampled['samples']})
+
+        names = [(event['type'], frames[event['frame']]['name']) for event in evented['events']]
+        self.assertEqual(names, [('O', 'outer'), ('O', 'inner'), ('C', 'inner'), ('O', 'inner'), ('C', 'inner'),
+                                 ('C', 'outer')])
+        times = [event['at'] for event in evented['events']]
+        self.assertEqual(times, sorted(times))
+
+    def test_save_and_prune(self):
+        with tempfile.TemporaryDirectory() as directory:
+            saved = []
+            for _ in range(3):
+                with Profile('test', sample_interval=0) as profile:
+                    pass
+                profile.save(directory, max_files=2)
+                saved.append(profile.id)
+                sleep(0.01)
+            self.assertIsNone(profiling.profile_path(saved[0], 'chrome', directory))
+            self.assertTrue(profiling.profile_path(saved[-1], 'speedscope', directory).endswith('.speedscope.json'))
+            self.assertIsNone(profiling.profile_path(saved[-1], 'pstats', directory))
+            self.assertIsNone(profiling.profile_path('../' + saved[-1][3:], 'chrome', directory))
+
+
+class TestProfilingRoutes(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        for patcher in (mock.patch.object(profiles, 'PROFILE_TOKEN', 's3cret'),
+                        mock.patch.object(profiles, 'PROFILE_DIR', directory.name)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = app.test_client()
+
+    def test_profiles_authorized_requests(self):
+        resp = self.client.get('/index?profile=1', headers={'X-Profile-Token': 's3cret'})
+        self.assertIn('X-Profile-Id', resp.headers)
+        url = resp.headers['X-Profile-Url']
+        self.assertEqual(self.client.get(url).status_code, 403)
+        download = self.client.get(url + '?format=chrome', headers={'X-Profile-Token': 's3cret'})
+        self.assertEqual(download.status_code, 200)
+        self.assertIn('traceEvents', download.get_json())
+
+    def test_ignores_unauthorized_requests(self):
+        self.assertNotIn('X-Profile-Id', self.client.get('/index?profile=1').headers)
+        resp = self.client.get('/index', headers={'X-Profile': '1', 'X-Profile-Token': 'guess'})
+        self.assertNotIn('X-Profile-Id', resp.headers)
+        resp = self.client.get('/index?profile=1&profile_token=s3cret')
+        self.assertNotIn('X-Profile-Id', resp.headers)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import random
+import unittest
+from app.ranking import TopKRanker
+
+
+def brute_force(candidates, totals, n_followers, k):
+    scores = {uid: overlap / (n_followers + totals[uid]) for uid, overlap in candidates.items()}
+    return sorted(scores.items(), key=lambda similarity: similarity[1], reverse=True)[:k]
+
+
+class TestTopKRanker(unittest.TestCase):
+    def test_matches_full_sort(self):
+        rng = random.Random(7)
+        for trial in range(200):
+            n_followers = rng.choice([50, 100])
+            candidates = {str(uid): rng.randint(2, 20) for uid in range(rng.randint(0, 60))}
+            # Few distinct totals so that tied scores are common
+            totals = {uid: rng.choice([0, 10, 100, 1000, 5000]) for uid in candidates}
+            k = rng.randint(1, 12)
+            for max_workers in (None, 4):
+                ranker = TopKRanker(totals.__getitem__, k, n_followers, max_workers)
+                self.assertEqual(ranker.rank(candidates), brute_force(candidates, totals, n_followers, k))
+                self.assertEqual(ranker.calls_made + ranker.calls_avoided, len(candidates))
+
+    def test_avoids_calls(self):
+        # A few strong candidates and a long tail of weak ones that cannot reach the top 2
+        candidates = {'a': 50, 'b': 40, **{str(uid): 2 for uid in range(100)}}
+        totals = {uid: 100 for uid in candidates}
+        ranker = TopKRanker(totals.__getitem__, 2, 100)
+        self.assertEqual([uid for uid, _ in ranker.rank(candidates)], ['a', 'b'])
+        self.assertEqual(ranker.calls_made, 2)
+        self.assertEqual(ranker.calls_avoided, 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import random
+import unittest
+from collections import Counter
+from app.similarity import CoFollowMatrix, sparse_engine_available
+
+
+@unittest.skipUnless(sparse_engine_available(), 'numpy and scipy are required for the sparse engine')
+class TestCoFollowMatrix(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(3)
+        self.followings = [rng.sample([str(uid) for uid in range(30)], rng.randint(0, 8)) for _ in range(200)]
+        self.cofollow = CoFollowMatrix()
+        for followed in self.followings:
+            self.cofollow.add_follower(followed)
+
+    def test_overlap_matches_counter(self):
+        followings_count = Counter()
+        for followed in self.followings:
+            followings_count.update(followed)
+        self.assertEqual(list(self.cofollow.overlap_counts().items()), list(followings_count.items()))
+        self.assertEqual(self.cofollow.matrix.shape, (200, len(followings_count)))
+        self.assertEqual(self.cofollow.matrix.sum(), sum(followings_count.values()))
+
+    def test_top_k_matches_sort(self):
+        uids = self.cofollow.streamer_uids
+        totals = [int(uid) % 4 * 10 for uid in uids]
+        cols = self.cofollow.columns(uids)
+        scores = self.cofollow.scores(cols, 200, totals)
+        expected = sorted(zip(uids, scores.tolist()), key=lambda similarity: similarity[1], reverse=True)[:7]
+        self.assertEqual([(uids[pos], float(scores[pos])) for pos in self.cofollow.top_k(cols, scores, 7)], expected)
+
+    def test_jaccard(self):
+        cols = self.cofollow.columns(self.cofollow.streamer_uids[:1])
+        overlap = self.cofollow.overlap()[cols[0]]
+        jaccard = self.cofollow.scores(cols, 200, [overlap + 5], method='jaccard')[0]
+        self.assertAlmostEqual(jaccard, overlap / 205)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+from unittest import mock
+from app.twitch_client import TwitchClient
+
+
+class FakeIndex:
+    def __init__(self, neighbours):
+        self.neighbours_by_uid = neighbours
+
+    def neighbours(self, streamer_uid):
+        return self.neighbours_by_uid.get(streamer_uid, [])
+
+
+def fake_live_streams(self, streamer_uid_list):
+    return {uid: {'name': f'streamer{uid}'} for uid in streamer_uid_list if int(uid) % 2 == 0}
+
+
+def fake_prof_img_url(self, streamer_uid_list):
+    return {uid: f'https://img/{uid}' for uid in streamer_uid_list}
+
+
+@mock.patch.object(TwitchClient, 'get_live_streams', fake_live_streams)
+@mock.patch.object(TwitchClient, 'get_prof_img_url', fake_prof_img_url)
+class TestSimilarityIndexLookup(unittest.TestCase):
+    def test_indexed_streamer_skips_crawl(self):
+        index = FakeIndex({'1': [(str(uid), 1 / uid) for uid in range(2, 30)]})
+        client = TwitchClient('1', num_suggestions=3, similarity_index=index)
+        with mock.patch.object(TwitchClient, 'iter_n_follows') as iter_n_follows:
+            suggestions = client.get_similar_streams()
+        iter_n_follows.assert_not_called()
+        self.assertEqual([details['name'] for details in suggestions.values()],
+                         ['streamer2', 'streamer4', 'streamer6'])
+        self.assertEqual((suggestions[1]['sim_score'], client.stop_reason), (0.5, 'indexed'))
+
+    def test_unindexed_streamer_falls_back_to_crawl(self):
+        client = TwitchClient('1', num_suggestions=3, similarity_index=FakeIndex({}))
+        with mock.patch.object(TwitchClient, 'iter_n_follows', return_value=[]) as iter_n_follows:
+            self.assertEqual(client.get_similar_streams(), {})
+        iter_n_follows.assert_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from threading import Barrier, Event
+from time import sleep
+from unittest import mock
+from app import app
+from app.single_flight import SingleFlight
+
+
+class TestSingleFlight(unittest.TestCase):
+    def test_concurrent_callers_share_one_computation(self):
+        flight = SingleFlight(lock_dir=None)
+        barrier, calls = Barrier(10), []
+
+        def compute():
+            calls.append(1)
+            sleep(0.2)
+            return {1: 'a'}
+
+        def call(_):
+            barrier.wait()
+            return flight.do(('1', 100), compute)
+
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            results = list(executor.map(call, range(10)))
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(value == {1: 'a'} for value, _ in results))
+        self.assertEqual(sorted(shared for _, shared in results), [False] + [True] * 9)
+        self.assertEqual((flight.leaders, flight.coalesced), (1, 9))
+
+    def test_errors_reach_every_waiter(self):
+        flight = SingleFlight(lock_dir=None)
+        started = Event()
+
+        def fail():
+            started.set()
+            sleep(0.1)
+            raise ValueError('not found')
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            leader = executor.submit(flight.do, 'key', fail)
+            started.wait()
+            waiter = executor.submit(flight.do, 'key', fail)
+            for future in (leader, waiter):
+                with self.assertRaises(ValueError):
+                    future.result()
+        self.assertEqual(flight.do('key', lambda: 1), (1, False))
+
+    def test_processes_share_results_through_lock_dir(self):
+        # Two SingleFlight instances stand in for two gunicorn workers; flock locks are per open file, not per process
+        with tempfile.TemporaryDirectory() as lock_dir:
+            worker1, worker2 = SingleFlight(lock_dir), SingleFlight(lock_dir)
+            started = Event()
+
+            def slow():
+                started.set()
+                sleep(0.3)
+                return 'suggestions'
+
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                first = executor.submit(worker1.do, 'key', slow)
+                started.wait()
+                second = executor.submit(worker2.do, 'key', lambda: 'recomputed')
+                self.assertEqual((first.result(), second.result()), (('suggestions', False), ('suggestions', True)))
+            self.assertEqual(worker2.coalesced_remote, 1)
+            # Later callers compute a new result
+            self.assertEqual(worker2.do('key', lambda: 'recomputed'), ('recomputed', False))
+
+
+    @mock.patch('app.get_userinfo', return_value={'uid': '1', 'name': 'streamer'})
+    def test_route_responds_503_when_waiting_times_out(self, _):
+        flight = SingleFlight(lock_dir=None, timeout=0.1)
+        started, release = Event(), Event()
+
+        def slow():
+            started.set()
+            release.wait()
+            return {}, 0
+
+        key = ('1', 10, False)
+        cache = mock.Mock(**{'key.return_value': key})
+        with mock.patch('app.get_single_flight', return_value=flight), mock.patch('app.get_suggestion_cache',
+                                                                                  return_value=cache):
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                leader = executor.submit(flight.do, key, slow)
+                started.wait()
+                resp = app.test_client().get('/user/streamer')
+                release.set()
+                leader.result()
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(resp.headers['Retry-After'], '10')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+from app.sketches import MinHash, HyperLogLog, StreamerSketch, SketchStore, SketchScorer
+
+
+class FakeHelix:
+    """ Serves users/follows?to_id pages (newest first) from a {streamer_uid: [(follower_uid, followed_at), ...]} dict """
+    def __init__(self, follows):
+        self.follows = follows
+
+    def get(self, endpoint, params, headers=None, timeout=None):
+        follows = self.follows[params['to_id']]
+        start = int(params.get('after', 0))
+        end = start + params['first']
+        data = [{'from_id': uid, 'to_id': params['to_id'], 'followed_at': at} for uid, at in follows[start:end]]
+        return {'total': len(follows), 'data': data, 'pagination': {'cursor': str(end)} if end < len(follows) else {}}
+
+
+class TestSketches(unittest.TestCase):
+    def test_minhash_jaccard_estimate(self):
+        a, b = MinHash(), MinHash()
+        for uid in range(0, 6000):
+            a.add(str(uid))
+        for uid in range(4000, 10000):
+            b.add(str(uid))
+        self.assertAlmostEqual(a.jaccard(b), 0.2, delta=0.06)
+
+    def test_hll_cardinality_and_merge(self):
+        a, b = HyperLogLog(), HyperLogLog()
+        for uid in range(0, 60000):
+            a.add(str(uid))
+        for uid in range(40000, 100000):
+            b.add(str(uid))
+        self.assertAlmostEqual(a.merge(b).cardinality() / 100000, 1, delta=0.05)
+
+    def test_adding_twice_is_idempotent(self):
+        sketch = StreamerSketch('1')
+        for uid in range(500):
+            sketch.add(str(uid))
+        before = (sketch.minhash.to_bytes(), sketch.hll.to_bytes())
+        for uid in range(500):
+            sketch.add(str(uid))
+        self.assertEqual((sketch.minhash.to_bytes(), sketch.hll.to_bytes()), before)
+
+    def test_serialization_round_trip(self):
+        minhash, hll = MinHash(), HyperLogLog()
+        for uid in range(1000):
+            minhash.add(str(uid))
+            hll.add(str(uid))
+        self.assertEqual(MinHash.from_bytes(minhash.to_bytes()).jaccard(minhash), 1.0)
+        self.assertEqual(HyperLogLog.from_bytes(hll.to_bytes()).cardinality(), hll.cardinality())
+
+    def test_sqlite_store_survives_restart(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = os.path.join(tmp_dir, 'sketches.db')
+            sketch = StreamerSketch('1', watermark='2020-01-01T00:00:00Z', built_at=1, updated_at=1)
+            sketch.add('a')
+            SketchStore(db_path).put(sketch)
+            loaded = SketchStore(db_path).get('1')
+            self.assertEqual((loaded.watermark, loaded.minhash.hashes), (sketch.watermark, sketch.minhash.hashes))
+
+    def test_scorer_pages_only_new_follows(self):
+        follows = [(str(uid), f'2020-01-{uid % 28 + 1:02d}T00:00:00Z') for uid in range(250)]
+        helix = FakeHelix({'1': sorted(follows, key=lambda follow: follow[1], reverse=True)})
+        scorer = SketchScorer(helix, SketchStore(db_path=None), refresh_age=0)
+        scorer.sketch('1')
+        self.assertEqual(scorer.requests, 3)
+
+        helix.follows['1'].insert(0, ('new', '2020-02-01T00:00:00Z'))
+        with mock.patch.object(helix, 'get', wraps=helix.get) as get:
+            sketch = scorer.sketch('1')
+        self.assertEqual(get.call_count, 1)
+        self.assertEqual((sketch.watermark, sketch.total), ('2020-02-01T00:00:00Z', 251))
+
+    def test_scorer_ranks_by_whole_followers_sets(self):
+        helix = FakeHelix({
+            '1': [(str(uid), '2020-01-01T00:00:00Z') for uid in range(0, 1000)],
+            '2': [(str(uid), '2020-01-01T00:00:00Z') for uid in range(500, 1500)],
+            '3': [(str(uid), '2020-01-01T00:00:00Z') for uid in range(900, 5000)],
+        })
+        scores = SketchScorer(helix, SketchStore(db_path=None)).score('1', ['2', '3'], max_workers=2)
+        self.assertGreater(scores['2'], scores['3'])
+
+
+if __name__ == '__main__':
+    unittest.main()
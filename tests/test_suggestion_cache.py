@@ -0,0 +1,42 @@
+import unittest
+from unittest import mock
+from app.suggestion_cache import SuggestionCache
+from app.twitch_client import TwitchClient
+
+
+def fake_iter_n_follows(self, given_uid, to_or_from_id, n_follows=None):
+    if to_or_from_id == 'to_id':
+        yield [{'from_id': str(uid)} for uid in range(5)]
+    else:
+        yield [{'to_id': 'a'}, {'to_id': 'b'}]
+
+
+@mock.patch.object(TwitchClient, 'get_prof_img_url', lambda self, uids: {uid: 'img' for uid in uids})
+@mock.patch.object(TwitchClient, 'get_total_follows_count', lambda self, uid: 10)
+@mock.patch.object(TwitchClient, 'get_live_streams', lambda self, uids: {uid: {'name': uid} for uid in uids})
+class TestSuggestionCache(unittest.TestCase):
+    def test_fresh_entry_skips_followings_collection(self):
+        cache = SuggestionCache(ttl=60, max_stale=120)
+        with mock.patch.object(TwitchClient, 'iter_n_follows', autospec=True,
+                               side_effect=fake_iter_n_follows) as follows:
+            first = cache.get_similar_streams('1', n_followers=5)
+            n_calls = follows.call_count
+            second = cache.get_similar_streams('1', n_followers=5)
+        self.assertEqual(first, second)
+        self.assertEqual(follows.call_count, n_calls)
+        self.assertEqual((cache.misses, cache.fresh_hits), (1, 1))
+
+    def test_stale_entry_is_served_and_refreshed(self):
+        cache = SuggestionCache(ttl=60, max_stale=120)
+        with mock.patch.object(TwitchClient, 'iter_n_follows', fake_iter_n_follows):
+            with mock.patch('app.suggestion_cache.time', return_value=1000):
+                cache.get_similar_streams('1', n_followers=5)
+            with mock.patch('app.suggestion_cache.time', return_value=1090):
+                self.assertTrue(cache.get_similar_streams('1', n_followers=5))
+                cache._refresher.shutdown(wait=True)
+            self.assertEqual(cache.stale_hits, 1)
+            self.assertEqual(cache._entries[cache.key('1', 5)]['stored_at'], 1090)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import os
+import requests
+import tempfile
+import unittest
+from unittest import mock
+from app.auth import Auth, TokenProvider
+
+
+def fake_post(expires_in=5184000):
+    calls = []
+
+    def post(url, data=None, timeout=None):
+        calls.append(url)
+        resp = mock.MagicMock(status_code=200)
+        resp.__enter__.return_value = resp
+        resp.json.return_value = {'access_token': f'token{len(calls)}', 'expires_in': expires_in, 'token_type': 'bearer'}
+        resp.headers = {}
+        return resp
+    return post, calls
+
+
+class TestTokenProvider(unittest.TestCase):
+    def test_token_is_fetched_once(self):
+        post, calls = fake_post()
+        provider = TokenProvider('cid', 'secret')
+        with mock.patch('app.auth.requests.post', post):
+            first = Auth(provider)
+            second = Auth(provider)
+            self.assertEqual(first.bear_token, second.bear_token)
+            self.assertEqual(first.bear_token['Client-ID'], 'cid')
+            self.assertFalse(first.is_expired())
+        self.assertEqual(len(calls), 1)
+
+    def test_invalidate_fetches_new_token(self):
+        post, calls = fake_post()
+        provider = TokenProvider('cid', 'secret')
+        with mock.patch('app.auth.requests.post', post):
+            self.assertEqual(provider.token['access_token'], 'token1')
+            provider.invalidate()
+            self.assertTrue(provider.is_expired())
+            self.assertEqual(provider.token['access_token'], 'token2')
+
+    def test_invalidating_a_replaced_token_keeps_the_new_one(self):
+        post, calls = fake_post()
+        provider = TokenProvider('cid', 'secret')
+        with mock.patch('app.auth.requests.post', post):
+            self.assertEqual(provider.token['access_token'], 'token1')
+            provider.invalidate('token1')
+            self.assertEqual(provider.token['access_token'], 'token2')
+            # A request that sent token1 and got a 401 after the refresh must not drop token2
+            provider.invalidate('token1')
+            self.assertEqual(provider.token['access_token'], 'token2')
+        self.assertEqual(len(calls), 2)
+
+    def test_file_store_is_shared(self):
+        post, calls = fake_post()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            store_path = os.path.join(tmp_dir, 'token.json')
+            with mock.patch('app.auth.requests.post', post):
+                worker_a = TokenProvider('cid', 'secret', store_path=store_path)
+                worker_b = TokenProvider('cid', 'secret', store_path=store_path)
+                self.assertEqual(worker_a.token['access_token'], worker_b.token['access_token'])
+        self.assertEqual(len(calls), 1)
+
+
+    def test_invalidate_keeps_a_token_stored_by_another_worker(self):
+        post, calls = fake_post()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            store_path = os.path.join(tmp_dir, 'token.json')
+            with mock.patch('app.auth.requests.post', post):
+                worker_a = TokenProvider('cid', 'secret', store_path=store_path)
+                worker_b = TokenProvider('cid', 'secret', store_path=store_path)
+                self.assertEqual((worker_a.token['access_token'], worker_b.token['access_token']), ('token1', 'token1'))
+                worker_b.invalidate()
+                self.assertEqual(worker_b.token['access_token'], 'token2')
+                # worker_a still holds token1; dropping it must not wipe token2 from the store
+                worker_a.invalidate('token1')
+                self.assertEqual(worker_a.token['access_token'], 'token2')
+        self.assertEqual(len(calls), 2)
+
+    def test_failed_token_request_raises_http_error(self):
+        resp = mock.MagicMock(status_code=403)
+        resp.__enter__.return_value = resp
+        resp.raise_for_status.side_effect = requests.HTTPError('403 Client Error: Forbidden', response=resp)
+        with mock.patch('app.auth.requests.post', return_value=resp) as post:
+            with self.assertRaises(requests.HTTPError):
+                TokenProvider('cid', 'wrong secret').token
+        self.assertIsNotNone(post.call_args.kwargs['timeout'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import requests
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from threading import Barrier, Lock
+from unittest import mock
+from app.user_loader import UserLoader
+
+
+class FakeHelix:
+    def __init__(self):
+        self.calls = []
+        self._lock = Lock()
+
+    def get(self, endpoint, params):
+        with self._lock:
+            self.calls.append(params)
+        found = [uid for uid in params.get('id', []) if uid != 'missing']
+        found += [login[len('user'):] for login in params.get('login', [])]
+        return {'data': [{'id': uid, 'login': f'user{uid}', 'profile_image_url': f'img{uid}'} for uid in found]}
+
+
+class TestUserLoader(unittest.TestCase):
+    def test_concurrent_lookups_share_requests(self):
+        helix = FakeHelix()
+        loader = UserLoader(helix, window=0.2)
+        barrier = Barrier(20)
+
+        def load(idx):
+            barrier.wait()
+            return loader.load('id', str(idx % 10))
+
+        with ThreadPoolExecutor(max_workers=20) as executor:
+            results = list(executor.map(load, range(20)))
+        self.assertEqual([user['id'] for user in results], [str(idx % 10) for idx in range(20)])
+        self.assertEqual(len(helix.calls), 1)
+        self.assertEqual(loader.coalesced, 10)
+
+    def test_batches_at_most_100_keys_per_request(self):
+        helix = FakeHelix()
+        loader = UserLoader(helix, window=0.01)
+        users = loader.load_many('id', [str(uid) for uid in range(150)] + ['missing'])
+        self.assertEqual([len(params['id']) for params in helix.calls], [100, 51])
+        self.assertIsNone(users['missing'])
+
+    def test_cache_serves_ids_and_logins(self):
+        helix = FakeHelix()
+        loader = UserLoader(helix, window=0, ttl=60)
+        self.assertEqual(loader.load('login', 'User7')['id'], '7')
+        self.assertEqual(loader.load('id', '7')['login'], 'user7')
+        self.assertEqual((len(helix.calls), loader.hits), (1, 1))
+        with mock.patch('app.user_loader.time', return_value=loader._cache[('id', '7')][1] + 60):
+            loader.load('id', '7')
+        self.assertEqual(len(helix.calls), 2)
+
+    def test_errors_reach_every_waiter(self):
+        helix = mock.MagicMock()
+        helix.get.side_effect = RuntimeError('helix down')
+        loader = UserLoader(helix, window=0)
+        with self.assertRaises(RuntimeError):
+            loader.load('id', '1')
+
+    def test_rejected_key_fails_only_its_callers(self):
+        class RejectingHelix(FakeHelix):
+            def get(self, endpoint, params):
+                if 'bad' in params.get('id', []):
+                    with self._lock:
+                        self.calls.append(params)
+                    raise requests.HTTPError('400 Bad Request', response=mock.Mock(status_code=400))
+                return super().get(endpoint, params)
+
+        helix = RejectingHelix()
+        loader = UserLoader(helix, window=0.2)
+        barrier = Barrier(6)
+
+        def load(uid):
+            barrier.wait()
+            try:
+                return loader.load('id', uid)['id']
+            except requests.HTTPError:
+                return 'rejected'
+
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            results = list(executor.map(load, ['1', '2', 'bad', '3', '4', '5']))
+        self.assertEqual(results, ['1', '2', 'rejected', '3', '4', '5'])
+        self.assertEqual(len(helix.calls[0]['id']), 6)
+
+    def test_malformed_logins_are_not_sent(self):
+        helix = FakeHelix()
+        loader = UserLoader(helix, window=0)
+        users = loader.load_many('login', ['User1', 'no spaces', 'x' * 26, ''])
+        self.assertEqual(users['user1']['id'], '1')
+        self.assertEqual([users[key] for key in ('no spaces', 'x' * 26, '')], [None, None, None])
+        self.assertEqual(helix.calls, [{'login': ['user1']}])
+
+    def test_timeouts_raise_builtin_timeout_error(self):
+        helix = mock.MagicMock()
+        loader = UserLoader(helix, window=60, timeout=0.01)
+        with self.assertRaises(TimeoutError):
+            loader.load('id', '1')
+
+
+if __name__ == '__main__':
+    unittest.main()
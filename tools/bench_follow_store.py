@@ -0,0 +1,112 @@
+"""
+Measures the memory held by the follow structures of a crawl on synthetic follows, without any HTTP: helix follow
+dictionaries as returned by get_n_follows() (and kept by the follows cache), Follower namedtuples keyed to lists of uid
+strings (as BatchClient kept them), and the interned, array-backed app/follow_store.FollowStore.  Memory is traced with
+tracemalloc and reported per million follow edges; every structure must yield the same overlap counts.
+
+    python -m tools.bench_follow_store --edges 100000 1000000
+"""
+import argparse
+import random
+import tracemalloc
+from collections import Counter
+from itertools import accumulate
+from time import perf_counter
+from app.follow_store import FollowStore
+from app.twitch_client import TwitchClient
+
+
+def synthetic_follows(n_edges: int, n_streamers=20000, max_followings=50, seed=0):
+    """
+    Yields (follower uid, [followed uid, ...]) pairs totalling about n_edges follows.  Uids are new string objects for
+    every follow, as they are when parsed from helix json.
+    """
+    rng = random.Random(seed)
+    # Cumulative weights are computed once; choices() would otherwise accumulate them on every call
+    cum_weights = list(accumulate(1 / (rank + 1) ** 0.8 for rank in range(n_streamers)))
+    streamers = range(n_streamers)
+    follower, n_yielded = 100000000, 0
+    while n_yielded < n_edges:
+        followed = set(rng.choices(streamers, cum_weights=cum_weights, k=rng.randint(1, max_followings)))
+        yield str(follower), [str(10000000 + streamer) for streamer in followed]
+        follower += 1
+        n_yielded += len(followed)
+
+
+def helix_dicts(follows) -> dict:
+    return {follower: [{'from_id': follower, 'from_login': f'user{follower}', 'from_name': f'User{follower}',
+                        'to_id': uid, 'to_login': f'streamer{uid}', 'to_name': f'Streamer{uid}',
+                        'followed_at': '2020-05-17T03:14:15Z'} for uid in followed]
+            for follower, followed in follows}
+
+
+def helix_dicts_overlap(followings: dict) -> Counter:
+    overlap = Counter()
+    for follows in followings.values():
+        overlap.update(follow['to_id'] for follow in follows)
+    return overlap
+
+
+def uid_lists(follows) -> dict:
+    return {TwitchClient.Follower(follower, 'from_id'): followed for follower, followed in follows}
+
+
+def uid_lists_overlap(followings: dict) -> Counter:
+    overlap = Counter()
+    for followed in followings.values():
+        overlap.update(followed)
+    return overlap
+
+
+def follow_store(follows) -> FollowStore:
+    store = FollowStore()
+    for follower, followed in follows:
+        store.add_follower(follower, followed)
+    return store
+
+
+def follow_store_overlap(store: FollowStore) -> Counter:
+    return store.overlap_counts()
+
+
+STRUCTURES = [('helix dicts', helix_dicts, helix_dicts_overlap),
+              ('Follower -> uid lists', uid_lists, uid_lists_overlap),
+              ('FollowStore', follow_store, follow_store_overlap)]
+
+
+def measure(build, count, n_edges: int, seed: int) -> dict:
+    tracemalloc.start()
+    start_time = perf_counter()
+    structure = build(synthetic_follows(n_edges, seed=seed))
+    build_time = perf_counter() - start_time
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    start_time = perf_counter()
+    overlap = count(structure)
+    count_time = perf_counter() - start_time
+    n_follows = sum(overlap.values())
+    return {'bytes': retained, 'follows': n_follows, 'build_time': build_time, 'count_time': count_time,
+            'overlap': overlap}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--edges', type=int, nargs='+', default=[100000, 1000000])
+    arg_parser.add_argument('--seed', type=int, default=0)
+    args = arg_parser.parse_args()
+
+    for n_edges in args.edges:
+        expected = None
+        for name, build, count in STRUCTURES:
+            result = measure(build, count, n_edges, args.seed)
+            if expected is None:
+                expected = result['overlap']
+            assert list(result['overlap'].items()) == list(expected.items()), f'{name} overlap differs'
+            mb_per_million = result['bytes'] / result['follows'] * 1e6 / 2 ** 20
+            print(f'{result["follows"]:>9} follows  {name:<22} {result["bytes"] / 2 ** 20:>9.1f} MB '
+                  f'({mb_per_million:>7.1f} MB per million follows) | build {result["build_time"]:.3f} sec, '
+                  f'overlap {result["count_time"]:.3f} sec')
+
+
+if __name__ == '__main__':
+    main()
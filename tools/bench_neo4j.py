@@ -0,0 +1,80 @@
+"""
+Compares the per-object OGM path (User.add_followers_to_streamer) with batched UNWIND ... MERGE ingestion
+(User.bulk_add_followers_to_streamer) on a local Neo4j configured by the NEO4J_* settings.  Followers come from a
+SyntheticGraph; every uid written is prefixed so that benchmark nodes never touch real data, and they are deleted
+before every run.
+
+    python -m tools.bench_neo4j --viewers 20000 --batch-sizes 1000 5000 10000
+"""
+import argparse
+from time import gmtime, perf_counter, strftime
+from app.models import neo4_db
+from app.models.neo4_db import User
+from tools.mock_helix import SyntheticGraph
+
+
+class SyntheticStreamer:
+    """ Serves a SyntheticGraph streamer's followers the way TwitchStreamer.get_all_follows() returns them """
+    def __init__(self, graph: SyntheticGraph, uid: str, prefix: str):
+        self.twitch_uid = prefix + uid
+        self.display_name = graph.users[uid]['display_name']
+        self.follows = [{'from_id': prefix + viewer_uid, 'from_name': graph.users[viewer_uid]['display_name'],
+                         'to_id': self.twitch_uid, 'to_name': self.display_name,
+                         'followed_at': strftime('%Y-%m-%dT%H:%M:%SZ', gmtime(followed_at))}
+                        for viewer_uid, followed_at in graph.followers[uid]]
+
+    def get_all_follows(self) -> list:
+        return self.follows
+
+
+def delete_benchmark_nodes(prefix: str):
+    neo4_db.get_graph().run('MATCH (n:User) WHERE n.twitch_uid STARTS WITH $prefix DETACH DELETE n', prefix=prefix)
+
+
+def run_ogm(streamer: SyntheticStreamer) -> float:
+    start_time = perf_counter()
+    db_streamer = User(twitch_uid=streamer.twitch_uid, display_name=streamer.display_name)
+    db_streamer.save()
+    User.add_followers_to_streamer(streamer, db_streamer)
+    return perf_counter() - start_time
+
+
+def run_bulk(streamer: SyntheticStreamer, batch_size: int) -> float:
+    start_time = perf_counter()
+    User.bulk_add_followers_to_streamer(streamer, batch_size)
+    return perf_counter() - start_time
+
+
+def count_follows(streamer: SyntheticStreamer) -> int:
+    query = 'MATCH (:User)-[follows:FOLLOWS]->(:User {twitch_uid: $uid}) RETURN count(follows)'
+    return neo4_db.get_graph().evaluate(query, uid=streamer.twitch_uid)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--viewers', type=int, default=20000)
+    arg_parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1000, 5000, 10000])
+    arg_parser.add_argument('--skip-ogm', action='store_true', help='only time bulk ingestion')
+    arg_parser.add_argument('--prefix', default='bench-')
+    args = arg_parser.parse_args()
+
+    graph = SyntheticGraph(n_streamers=100, n_viewers=args.viewers)
+    streamer = SyntheticStreamer(graph, graph.most_followed()[0], args.prefix)
+    n_rows = len(streamer.follows)
+    print(f'{streamer.display_name}: {n_rows} followers')
+
+    neo4_db.migrate()
+    runs = [] if args.skip_ogm else [('ogm', run_ogm, ())]
+    runs += [(f'bulk {batch_size}', run_bulk, (batch_size,)) for batch_size in args.batch_sizes]
+    try:
+        for name, run, run_args in runs:
+            delete_benchmark_nodes(args.prefix)
+            runtime = run(streamer, *run_args)
+            assert count_follows(streamer) == n_rows, f'{name} wrote {count_follows(streamer)} of {n_rows} follows'
+            print(f'{name:>12}: {runtime:8.2f} sec {n_rows / runtime:10.1f} rows/sec')
+        print(f'pool: {neo4_db.get_pool().stats()}')
+    finally:
+        delete_benchmark_nodes(args.prefix)
+
+if __name__ == '__main__':
+    main()
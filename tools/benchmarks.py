@@ -0,0 +1,185 @@
+"""
+End-to-end benchmarks of RaidRite against tools.mock_helix.  Each benchmark runs against a synthetic follow graph and
+records its wall time and the number of requests received by every mock endpoint.  Results can be saved as a baseline
+and later runs compared against it to catch regressions in request counts or wall time.
+
+    python -m tools.benchmarks --sizes small medium --output tools/baseline.json
+    python -m tools.benchmarks --sizes small medium --compare tools/baseline.json
+"""
+import argparse
+import io
+import json
+import sys
+from contextlib import redirect_stdout
+from time import perf_counter
+from tools.mock_helix import MockHelix, MockHelixServer, SyntheticGraph
+
+GRAPH_SIZES = {
+    'small':  {'n_streamers': 200, 'n_viewers': 2000},
+    'medium': {'n_streamers': 1000, 'n_viewers': 10000},
+    'large':  {'n_streamers': 3000, 'n_viewers': 40000},
+}
+
+
+class BenchmarkRun:
+    """ Runs and records benchmarks against a single MockHelixServer. """
+
+    def __init__(self, server: MockHelixServer):
+        self.server = server
+        self.results = []
+
+    def measure(self, name: str, size: str, func, **extra):
+        self.server.mock.reset_stats()
+        start_time = perf_counter()
+        # The app reports progress with print(); keep it out of the results table
+        with redirect_stdout(io.StringIO()):
+            func()
+        wall_time = perf_counter() - start_time
+        requests = self.server.mock.reset_stats()
+        result = {'name': name, 'size': size, 'wall_time': round(wall_time, 4),
+                  'total_requests': sum(requests.values()), 'requests': requests, **extra}
+        self.results.append(result)
+        print(f'{size:>7}  {name:<44} {result["wall_time"]:>9.3f} sec {result["total_requests"]:>7} requests')
+        return result
+
+
+def run_benchmarks(server: MockHelixServer, sizes: list, seed=0) -> list:
+    # Every helix and OAuth request goes through the process-wide transport and token provider; both are replaced by
+    # ones bound to the mock server and mock credentials, whatever app/settings.py configures
+    from app import auth, helix
+    provider = auth.TokenProvider('mock', 'mock', oauth_url=server.url + '/oauth2')
+    auth._token_provider = provider
+    helix._transport = helix.HelixTransport(base_url=server.url + '/helix', token_provider=provider)
+    from app import app
+    from app.batch import BatchClient
+    from app.follows_cache import FollowsCache, get_follows_cache
+    from app.live_index import get_live_index
+    from app.suggestion_cache import get_suggestion_cache
+    from app.twitch_client import TwitchClient
+    from app.user_loader import get_user_loader
+
+    def reset_caches():
+        """ Clears every process-wide cache so that the next measurement starts cold """
+        for cache in (get_follows_cache(), get_suggestion_cache(), get_live_index(), get_user_loader()):
+            cache.clear()
+
+    run = BenchmarkRun(server)
+    web = app.test_client()
+    for size in sizes:
+        server.mock.graph = graph = SyntheticGraph(**GRAPH_SIZES[size], seed=seed)
+        # A popular, but not the most popular, streamer
+        streamer_uid = graph.most_followed(10)[-1]
+        login = graph.users[streamer_uid]['login']
+        n_followers = len(graph.followers[streamer_uid])
+
+        reset_caches()
+        run.measure('get_n_follows[all followers]', size,
+                    lambda: TwitchClient(streamer_uid, follows_cache=False).get_n_follows(streamer_uid, 'to_id'),
+                    n_follows=n_followers)
+
+        def stream_follower_ids():
+            client = TwitchClient(streamer_uid, follows_cache=False)
+            return sum(1 for _ in client.iter_follow_ids(streamer_uid, 'to_id'))
+        run.measure('iter_follow_ids[all followers]', size, stream_follower_ids, n_follows=n_followers)
+
+        for max_workers in (None, 10):
+            cache = FollowsCache(db_path=None)
+            workers = max_workers or 1
+            reset_caches()
+            run.measure(f'get_similar_streams[cold, {workers} workers]', size,
+                        lambda: TwitchClient(streamer_uid, max_workers=max_workers,
+                                             follows_cache=cache).get_similar_streams())
+            run.measure(f'get_similar_streams[warm, {workers} workers]', size,
+                        lambda: TwitchClient(streamer_uid, max_workers=max_workers,
+                                             follows_cache=cache).get_similar_streams())
+
+        # A dashboard's worth of streamers: separate runs vs. one shared crawl
+        streamer_uids = graph.most_followed(20)[-10:]
+        reset_caches()
+        run.measure('get_similar_streams[10 streamers, separate]', size,
+                    lambda: [TwitchClient(uid, max_workers=10, follows_cache=FollowsCache(db_path=None),
+                                          live_index=False).get_similar_streams() for uid in streamer_uids])
+        reset_caches()
+        run.measure('BatchClient[10 streamers]', size,
+                    lambda: BatchClient(streamer_uids, max_workers=10, follows_cache=FollowsCache(db_path=None),
+                                        live_index=False).get_similar_streams())
+
+        reset_caches()
+        run.measure('GET /validate/<username>', size, lambda: web.get(f'/validate/{login}'))
+        run.measure('GET /user/<username>[cold]', size, lambda: web.get(f'/user/{login}'))
+        run.measure('GET /user/<username>[cached]', size, lambda: web.get(f'/user/{login}'))
+
+        reset_caches()
+        timings = {}
+
+        def stream():
+            start_time = perf_counter()
+            chunks = iter(web.get(f'/user/{login}/stream').response)
+            next(chunks)
+            timings['ttfb'] = round(perf_counter() - start_time, 4)
+            for _ in chunks:
+                pass
+
+        result = run.measure('GET /user/<username>/stream', size, stream)
+        result['ttfb'] = timings['ttfb']
+
+    return run.results
+
+
+def compare(results: list, baseline: list, tolerance: float, min_slowdown=0.05) -> list:
+    """
+    :param min_slowdown: Wall time differences below this many seconds are never regressions, as millisecond runs vary
+    by more than any tolerance ratio
+    :return: A list of regression descriptions for results that made more requests than, or ran more than `tolerance`
+    times (and min_slowdown seconds) slower than, the matching baseline result, and for results missing from the
+    baseline (which could not be checked; regenerate the baseline with --output when adding benchmarks)
+    """
+    baseline = {(result['size'], result['name']): result for result in baseline}
+    regressions = []
+    for result in results:
+        base = baseline.get((result['size'], result['name']))
+        label = f'{result["size"]} {result["name"]}'
+        if base is None:
+            regressions.append(f'{label}: missing from the baseline')
+            continue
+        if result['total_requests'] > base['total_requests']:
+            regressions.append(f'{label}: {result["total_requests"]} requests (baseline {base["total_requests"]})')
+        slowdown = result['wall_time'] - base['wall_time']
+        if result['wall_time'] > base['wall_time'] * tolerance and slowdown > min_slowdown:
+            regressions.append(f'{label}: {result["wall_time"]} sec (baseline {base["wall_time"]})')
+    return regressions
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--sizes', nargs='+', choices=GRAPH_SIZES, default=['small', 'medium'])
+    arg_parser.add_argument('--latency', type=float, default=0.005, help='seconds added to every helix request')
+    arg_parser.add_argument('--rate-limit', type=int, default=None, help='helix points per minute')
+    arg_parser.add_argument('--seed', type=int, default=0)
+    arg_parser.add_argument('--output', help='write results to this json file')
+    arg_parser.add_argument('--compare', help='compare results against this json baseline')
+    arg_parser.add_argument('--tolerance', type=float, default=1.5, help='allowed wall time ratio against baseline')
+    args = arg_parser.parse_args()
+
+    mock = MockHelix(SyntheticGraph(n_streamers=1, n_viewers=1), latency=args.latency, rate_limit=args.rate_limit)
+    server = MockHelixServer(mock).start()
+    try:
+        results = run_benchmarks(server, args.sizes, args.seed)
+    finally:
+        server.stop()
+
+    if args.output:
+        with open(args.output, 'w') as out_file:
+            json.dump({'latency': args.latency, 'rate_limit': args.rate_limit, 'results': results}, out_file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(results, json.load(baseline_file)['results'], args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
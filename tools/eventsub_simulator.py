@@ -0,0 +1,104 @@
+"""
+Sends signed EventSub webhook messages (subscription verification, stream.online and stream.offline notifications) to
+RaidRite's /eventsub/callback route, like Twitch would, so the live index can be exercised without a public callback
+URL.  When a SyntheticGraph is given, its live streams are toggled along with the events sent, so that a MockHelix
+serving the same graph answers streams lookups consistently.
+
+    EVENTSUB_SECRET=s3cret python main.py
+    python -m tools.eventsub_simulator --url http://127.0.0.1:5000/eventsub/callback --secret s3cret --events 50
+"""
+import argparse
+import json
+import random
+import uuid
+from datetime import datetime
+import requests
+from pytz import utc
+from app.controllers.eventsub import signature
+
+
+class EventSubSimulator:
+    def __init__(self, url: str, secret: str, graph=None, seed=0):
+        self.url = url
+        self.secret = secret
+        self.graph = graph
+        self.sess = requests.Session()
+        self._rng = random.Random(seed)
+
+    def send(self, message_type: str, message: dict, message_id=None) -> requests.Response:
+        """ Signs and posts a message; pass a previous message_id to simulate a retried delivery. """
+        body = json.dumps(message).encode()
+        message_id = message_id or str(uuid.uuid4())
+        timestamp = datetime.now(utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+        headers = {'Content-Type': 'application/json',
+                   'Twitch-Eventsub-Message-Id': message_id,
+                   'Twitch-Eventsub-Message-Timestamp': timestamp,
+                   'Twitch-Eventsub-Message-Type': message_type,
+                   'Twitch-Eventsub-Message-Signature': signature(self.secret, message_id, timestamp, body)}
+        return self.sess.post(self.url, data=body, headers=headers)
+
+    def verify(self, event_type='stream.online', broadcaster_uid='1') -> requests.Response:
+        message = {'challenge': uuid.uuid4().hex, 'subscription': self.__subscription(event_type, broadcaster_uid)}
+        return self.send('webhook_callback_verification', message)
+
+    def online(self, broadcaster_uid: str, login=None) -> requests.Response:
+        started_at = datetime.now(utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        if self.graph is not None:
+            self.graph.live[broadcaster_uid] = {'started_at': started_at, 'viewer_count': self._rng.randint(1, 5000),
+                                                'language': 'en'}
+        event = dict(self.__broadcaster(broadcaster_uid, login), id=str(uuid.uuid4()), type='live',
+                     started_at=started_at)
+        return self.send('notification', {'subscription': self.__subscription('stream.online', broadcaster_uid),
+                                          'event': event})
+
+    def offline(self, broadcaster_uid: str, login=None) -> requests.Response:
+        if self.graph is not None:
+            self.graph.live.pop(broadcaster_uid, None)
+        return self.send('notification', {'subscription': self.__subscription('stream.offline', broadcaster_uid),
+                                          'event': self.__broadcaster(broadcaster_uid, login)})
+
+    def random_events(self, broadcaster_uids: list, n_events: int) -> dict:
+        """ Sends n_events online/offline notifications for random broadcasters.  :return: Counts by event type """
+        counts = {'stream.online': 0, 'stream.offline': 0}
+        for _ in range(n_events):
+            uid = self._rng.choice(broadcaster_uids)
+            if self._rng.random() < 0.5:
+                self.online(uid).raise_for_status()
+                counts['stream.online'] += 1
+            else:
+                self.offline(uid).raise_for_status()
+                counts['stream.offline'] += 1
+        return counts
+
+    def __broadcaster(self, broadcaster_uid: str, login=None) -> dict:
+        if login is None and self.graph is not None and broadcaster_uid in self.graph.users:
+            login = self.graph.users[broadcaster_uid]['login']
+        login = login or f'streamer{broadcaster_uid}'
+        return {'broadcaster_user_id': broadcaster_uid, 'broadcaster_user_login': login,
+                'broadcaster_user_name': login}
+
+    def __subscription(self, event_type: str, broadcaster_uid: str) -> dict:
+        return {'id': str(uuid.uuid4()), 'type': event_type, 'version': '1', 'status': 'enabled', 'cost': 1,
+                'condition': {'broadcaster_user_id': broadcaster_uid},
+                'transport': {'method': 'webhook', 'callback': self.url},
+                'created_at': datetime.now(utc).strftime('%Y-%m-%dT%H:%M:%SZ')}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--url', default='http://127.0.0.1:5000/eventsub/callback')
+    arg_parser.add_argument('--secret', required=True)
+    arg_parser.add_argument('--uids', nargs='+', default=[str(10000000 + idx) for idx in range(500)],
+                            help='broadcaster uids to send events for; the mock helix streamers by default')
+    arg_parser.add_argument('--events', type=int, default=20)
+    arg_parser.add_argument('--seed', type=int, default=0)
+    args = arg_parser.parse_args()
+
+    simulator = EventSubSimulator(args.url, args.secret, seed=args.seed)
+    resp = simulator.verify()
+    print(f'verification: {resp.status_code} {resp.text}')
+    print(f'sent: {simulator.random_events(args.uids, args.events)}')
+
+
+if __name__ == '__main__':
+    main()
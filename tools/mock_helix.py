@@ -0,0 +1,265 @@
+"""
+A local stand-in for the parts of Twitch's API used by RaidRite: the OAuth token endpoints and the helix `users`,
+`users/follows` and `streams` endpoints.  It serves a synthetic, seeded follow graph with configurable size, latency,
+page size, rate limit and error rate, and counts every request it receives by endpoint.
+
+Run it standalone and point the app at it with TWITCH_HELIX_URL and TWITCH_OAUTH_URL, set in app/settings.py or, when
+there is no settings module, as environment variables:
+
+    python -m tools.mock_helix --port 8081 --viewers 5000 --latency 0.02
+    TWITCH_HELIX_URL=http://127.0.0.1:8081/helix TWITCH_OAUTH_URL=http://127.0.0.1:8081/oauth2 python main.py
+
+tools/benchmarks.py does not rely on either: it binds the app's transport and token provider to its own server.
+"""
+import argparse
+import logging
+import random
+from collections import Counter
+from datetime import datetime, timedelta
+from threading import Lock, Thread
+from time import gmtime, sleep, strftime, time
+from flask import Flask, jsonify, request
+from pytz import utc
+from werkzeug.serving import make_server
+
+
+class SyntheticGraph:
+    """
+    A seeded, synthetic Twitch follow graph.  Streamer popularity follows a power law so that a few streamers are
+    followed by most viewers, like on Twitch.  A share of viewers are 'bot-like' and follow far more streamers than
+    TwitchClient.n_followings.  Follows are stored newest first, as helix returns them.
+    """
+    STREAMER_BASE_UID = 10000000
+
+    def __init__(self, n_streamers=500, n_viewers=5000, max_followings=40, bot_share=0.02, bot_followings=200,
+                 live_share=0.3, seed=0):
+        rng = random.Random(seed)
+        self.users = {}
+        self.logins = {}
+        self.followers = {}   # streamer uid -> [(viewer uid, followed_at epoch seconds), ...] newest first
+        self.followings = {}  # viewer uid -> [(streamer uid, followed_at epoch seconds), ...] newest first
+        self.live = {}
+
+        streamer_uids = [str(self.STREAMER_BASE_UID + idx) for idx in range(n_streamers)]
+        weights = [1 / (rank + 1) ** 0.8 for rank in range(n_streamers)]
+        for uid in streamer_uids:
+            self.__add_user(uid, f'streamer{uid}', 'affiliate')
+            self.followers[uid] = []
+            self.followings[uid] = []
+
+        epoch = int(datetime(2020, 1, 1, tzinfo=utc).timestamp())
+        edges = []
+        for idx in range(1, n_viewers + 1):
+            uid = str(idx)
+            self.__add_user(uid, f'viewer{uid}', '')
+            self.followings[uid] = []
+            n_follows = bot_followings if rng.random() < bot_share else rng.randint(1, max_followings)
+            followed = sorted(set(rng.choices(streamer_uids, weights=weights, k=min(n_follows, n_streamers))))
+            for streamer_uid in followed:
+                edges.append((epoch + rng.randint(0, 3 * 365 * 86400), uid, streamer_uid))
+
+        # Newest first, with ties broken deterministically; timestamps are formatted when served
+        for followed_at, viewer_uid, streamer_uid in sorted(edges, reverse=True):
+            self.followers[streamer_uid].append((viewer_uid, followed_at))
+            self.followings[viewer_uid].append((streamer_uid, followed_at))
+
+        now = datetime.now(utc)
+        for uid in streamer_uids:
+            if rng.random() < live_share:
+                started_at = (now - timedelta(minutes=rng.randint(5, 600))).strftime('%Y-%m-%dT%H:%M:%SZ')
+                self.live[uid] = {'started_at': started_at, 'viewer_count': rng.randint(1, 5000),
+                                  'language': rng.choice(['en', 'en', 'es', 'de'])}
+
+    @property
+    def n_edges(self) -> int:
+        return sum(len(followers) for followers in self.followers.values())
+
+    def most_followed(self, n=1) -> list:
+        """ :return: The uids of the n streamers with the most followers """
+        return sorted(self.followers, key=lambda uid: -len(self.followers[uid]))[:n]
+
+    def __add_user(self, uid, login, broadcaster_type):
+        self.logins[login] = uid
+        self.users[uid] = {
+            'id': uid,
+            'login': login,
+            'display_name': login,
+            'type': '',
+            'broadcaster_type': broadcaster_type,
+            'description': '',
+            'profile_image_url': f'https://static-cdn.example/{login}-profile_image-300x300.png',
+            'offline_image_url': '',
+            'view_count': 0,
+            'created_at': '2019-01-01T00:00:00Z'
+            }
+
+
+class MockHelix:
+    """ The Flask application and request accounting behind MockHelixServer. """
+    UNLIMITED = 10 ** 9
+
+    def __init__(self, graph: SyntheticGraph, latency=0.0, max_page_size=100, rate_limit=None, error_rate=0.0,
+                 seed=0):
+        self.graph = graph
+        self.latency = latency
+        self.max_page_size = max_page_size
+        self.rate_limit = rate_limit
+        self.error_rate = error_rate
+        self.requests = Counter()
+        self._rng = random.Random(seed)
+        self._lock = Lock()
+        self._tokens = float(rate_limit or 0)
+        self._updated_at = time()
+        self.app = self.__create_app()
+
+    def reset_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.requests)
+            self.requests.clear()
+        return stats
+
+    def __create_app(self) -> Flask:
+        app = Flask(__name__)
+
+        @app.route('/oauth2/token', methods=['POST'])
+        def token():
+            self.__count('oauth2/token')
+            return jsonify({'access_token': f'mock{int(time() * 1000)}', 'expires_in': 5184000,
+                            'token_type': 'bearer'})
+
+        @app.route('/oauth2/validate')
+        def validate():
+            self.__count('oauth2/validate')
+            return jsonify({'client_id': 'mock', 'scopes': [], 'expires_in': 5184000})
+
+        @app.route('/helix/<path:endpoint>')
+        def helix(endpoint):
+            self.__count(endpoint)
+            if self.latency:
+                sleep(self.latency)
+            limited = self.__take_point()
+            if limited is not None:
+                return limited
+            if self.error_rate and self._rng.random() < self.error_rate:
+                return self.__with_ratelimit(jsonify({'error': 'Service Unavailable', 'status': 503}), 503)
+
+            handler = {'users': self.__users, 'users/follows': self.__follows, 'streams': self.__streams}.get(endpoint)
+            if handler is None:
+                return jsonify({'error': 'Not Found', 'status': 404}), 404
+            return self.__with_ratelimit(jsonify(handler()), 200)
+
+        return app
+
+    def __count(self, endpoint):
+        with self._lock:
+            self.requests[endpoint] += 1
+
+    def __users(self) -> dict:
+        users, logins = self.graph.users, self.graph.logins
+        found = [users[uid] for uid in request.args.getlist('id') if uid in users]
+        found += [users[logins[login]] for login in request.args.getlist('login') if login in logins]
+        return {'data': found}
+
+    def __follows(self) -> dict:
+        first = min(int(request.args.get('first', 20)), self.max_page_size)
+        offset = int(request.args.get('after', 0))
+        users = self.graph.users
+        if 'to_id' in request.args:
+            to_uid = request.args['to_id']
+            follows = self.graph.followers.get(to_uid, [])
+            page = [(from_uid, to_uid, followed_at) for from_uid, followed_at in follows[offset:offset + first]]
+        else:
+            from_uid = request.args.get('from_id')
+            follows = self.graph.followings.get(from_uid, [])
+            page = [(from_uid, to_uid, followed_at) for to_uid, followed_at in follows[offset:offset + first]]
+
+        data = [{'from_id': from_uid, 'from_login': users[from_uid]['login'], 'from_name': users[from_uid]['login'],
+                 'to_id': to_uid, 'to_login': users[to_uid]['login'], 'to_name': users[to_uid]['login'],
+                 'followed_at': strftime('%Y-%m-%dT%H:%M:%SZ', gmtime(followed_at))}
+                for from_uid, to_uid, followed_at in page]
+        pagination = {'cursor': str(offset + first)} if offset + first < len(follows) else {}
+        return {'total': len(follows), 'data': data, 'pagination': pagination}
+
+    def __streams(self) -> dict:
+        data = []
+        for uid in request.args.getlist('user_id'):
+            stream = self.graph.live.get(uid)
+            if stream:
+                login = self.graph.users[uid]['login']
+                data.append({'id': f'stream{uid}', 'user_id': uid, 'user_login': login, 'user_name': login,
+                             'game_id': '0', 'type': 'live', 'title': f'{login} is live',
+                             'viewer_count': stream['viewer_count'], 'started_at': stream['started_at'],
+                             'language': stream['language'],
+                             'thumbnail_url': f'https://static-cdn.example/live_user_{login}-{{width}}x{{height}}.jpg'})
+        return {'data': data, 'pagination': {}}
+
+    def __take_point(self):
+        """ Emulates Twitch's token bucket rate limit; returns a 429 response when the bucket is empty. """
+        if not self.rate_limit:
+            return None
+        with self._lock:
+            now = time()
+            self._tokens = min(self.rate_limit, self._tokens + (now - self._updated_at) * self.rate_limit / 60)
+            self._updated_at = now
+            if self._tokens < 1:
+                return self.__with_ratelimit(jsonify({'error': 'Too Many Requests', 'status': 429}), 429)
+            self._tokens -= 1
+        return None
+
+    def __with_ratelimit(self, resp, status):
+        if self.rate_limit:
+            refill = (self.rate_limit - self._tokens) * 60 / self.rate_limit
+            resp.headers['Ratelimit-Limit'] = str(self.rate_limit)
+            resp.headers['Ratelimit-Remaining'] = str(int(self._tokens))
+            resp.headers['Ratelimit-Reset'] = str(int(time() + refill) + 1)
+        else:
+            # Advertise a quota that is never exhausted so that clients do not throttle to Twitch's default
+            resp.headers['Ratelimit-Limit'] = resp.headers['Ratelimit-Remaining'] = str(self.UNLIMITED)
+            resp.headers['Ratelimit-Reset'] = str(int(time()))
+        return resp, status
+
+
+class MockHelixServer:
+    """ Serves a MockHelix app from a background thread, e.g., for benchmarks. """
+
+    def __init__(self, mock: MockHelix, host='127.0.0.1', port=0):
+        self.mock = mock
+        # Per-request access logs would drown out benchmark output
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+        self._server = make_server(host, port, mock.app, threaded=True)
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f'http://{self._server.host}:{self._server.port}'
+
+    def start(self):
+        self._thread = Thread(target=self._server.serve_forever, name='mock-helix', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._thread.join()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--port', type=int, default=8081)
+    arg_parser.add_argument('--streamers', type=int, default=500)
+    arg_parser.add_argument('--viewers', type=int, default=5000)
+    arg_parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every helix request')
+    arg_parser.add_argument('--page-size', type=int, default=100, help='maximum page size for users/follows')
+    arg_parser.add_argument('--rate-limit', type=int, default=None, help='helix points per minute')
+    arg_parser.add_argument('--error-rate', type=float, default=0.0, help='share of helix requests failing with 503')
+    arg_parser.add_argument('--seed', type=int, default=0)
+    args = arg_parser.parse_args()
+
+    graph = SyntheticGraph(n_streamers=args.streamers, n_viewers=args.viewers, seed=args.seed)
+    print(f'Serving {len(graph.users)} users and {graph.n_edges} follows; most followed: {graph.most_followed(5)}')
+    mock = MockHelix(graph, args.latency, args.page_size, args.rate_limit, args.error_rate, args.seed)
+    mock.app.run(host='127.0.0.1', port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()